@@ -0,0 +1,328 @@
+"""In-process MQTT 3.1.1 broker stand-in for the benchmarks.
+
+It speaks just enough of the protocol for the SDK: CONNECT, PUBLISH with QoS 0
+and 1, SUBSCRIBE, UNSUBSCRIBE, PINGREQ and DISCONNECT over plain TCP. It also
+answers AWS IoT device shadow get/update/delete requests like the shadow
+service does. There are no retained messages, sessions or authentication.
+
+Everything runs on one selector thread. That thread's CPU time is tracked so
+the benchmarks can subtract it from the process CPU time.
+"""
+import json
+import selectors
+import socket
+import struct
+import threading
+import time
+
+CONNECT = 0x10
+PUBLISH = 0x30
+PUBACK = 0x40
+SUBSCRIBE = 0x80
+UNSUBSCRIBE = 0xA0
+PINGREQ = 0xC0
+DISCONNECT = 0xE0
+
+SHADOW_TOPIC_PREFIX = "$aws/things/"
+
+
+def topic_matches(topic_filter, topic):
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for index, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if index >= len(topic_levels):
+            return False
+        if level != "+" and level != topic_levels[index]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+def encode_remaining_length(length):
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length = length // 128
+        if length > 0:
+            byte |= 0x80
+        encoded.append(byte)
+        if length == 0:
+            return bytes(encoded)
+
+
+def encode_publish(topic, payload):
+    topic = topic.encode("utf-8")
+    body = struct.pack("!H", len(topic)) + topic + payload
+    return bytes([PUBLISH]) + encode_remaining_length(len(body)) + body
+
+
+class _Connection(object):
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.in_buffer = bytearray()
+        self.out_buffer = bytearray()
+        self.subscriptions = set()
+
+
+class BrokerStandIn(object):
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind((host, port))
+        self._listener.listen(1024)
+        self._listener.setblocking(False)
+        self.host = host
+        self.port = self._listener.getsockname()[1]
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._listener, selectors.EVENT_READ, None)
+        self._waker_r, self._waker_w = socket.socketpair()
+        self._waker_r.setblocking(False)
+        self._selector.register(self._waker_r, selectors.EVENT_READ, None)
+        self._commands = []
+        self._commands_lock = threading.Lock()
+        self._connections = dict()
+        self._shadows = dict()
+        self._accepting = True
+        self._running = False
+        self._thread = None
+        self._cpu_sec = 0.0
+        self.on_publish = None  # Called on the broker thread with (topic, payload) for every PUBLISH received
+        self.published = 0
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="broker-stand-in")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._call(self._stop)
+        self._thread.join()
+        self._listener.close()
+
+    def pause(self):
+        """Drop every connection and refuse new ones until resume(), like a network outage."""
+        self._call(self._pause)
+
+    def resume(self):
+        self._call(self._resume)
+
+    def get_cpu_sec(self):
+        return self._cpu_sec
+
+    def _call(self, function):
+        done = threading.Event()
+        with self._commands_lock:
+            self._commands.append((function, done))
+        self._waker_w.send(b"\0")
+        done.wait()
+
+    def _stop(self):
+        self._running = False
+        for connection in list(self._connections.values()):
+            self._close(connection)
+
+    def _pause(self):
+        self._accepting = False
+        for connection in list(self._connections.values()):
+            self._close(connection)
+
+    def _resume(self):
+        self._accepting = True
+
+    def _run(self):
+        while self._running:
+            for key, mask in self._selector.select():
+                if key.fileobj is self._listener:
+                    self._accept()
+                elif key.fileobj is self._waker_r:
+                    self._run_commands()
+                else:
+                    connection = key.data
+                    if mask & selectors.EVENT_READ:
+                        self._read(connection)
+                    if mask & selectors.EVENT_WRITE and connection.sock.fileno() != -1:
+                        self._flush(connection)
+            self._cpu_sec = time.thread_time()
+
+    def _run_commands(self):
+        try:
+            while self._waker_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        with self._commands_lock:
+            commands, self._commands = self._commands, []
+        for function, done in commands:
+            function()
+            done.set()
+
+    def _accept(self):
+        while True:
+            try:
+                sock, _ = self._listener.accept()
+            except BlockingIOError:
+                return
+            if not self._accepting:
+                sock.close()
+                continue
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = _Connection(sock)
+            self._connections[sock.fileno()] = connection
+            self._selector.register(sock, selectors.EVENT_READ, connection)
+
+    def _close(self, connection):
+        fd = connection.sock.fileno()
+        if fd == -1:
+            return
+        self._selector.unregister(connection.sock)
+        del self._connections[fd]
+        connection.sock.close()
+
+    def _read(self, connection):
+        try:
+            data = connection.sock.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._close(connection)
+            return
+        connection.in_buffer += data
+        self._handle_packets(connection)
+        if connection.sock.fileno() != -1:
+            self._flush(connection)
+
+    def _handle_packets(self, connection):
+        buffer = connection.in_buffer
+        pos = 0
+        while len(buffer) - pos >= 2:
+            remaining_length = 0
+            multiplier = 1
+            header_length = 1
+            while True:
+                if pos + header_length >= len(buffer):
+                    del buffer[:pos]
+                    return
+                byte = buffer[pos + header_length]
+                header_length += 1
+                remaining_length += (byte & 127) * multiplier
+                multiplier *= 128
+                if not byte & 128:
+                    break
+            end = pos + header_length + remaining_length
+            if end > len(buffer):
+                break
+            command = buffer[pos]
+            body = bytes(buffer[pos + header_length:end])
+            pos = end
+            if not self._handle_packet(connection, command, body):
+                self._close(connection)
+                return
+        del buffer[:pos]
+
+    def _handle_packet(self, connection, command, body):
+        packet_type = command & 0xF0
+        if packet_type == CONNECT:
+            connection.out_buffer += b"\x20\x02\x00\x00"
+        elif packet_type == PUBLISH:
+            qos = (command >> 1) & 0x03
+            topic_length = struct.unpack_from("!H", body)[0]
+            topic = body[2:2 + topic_length].decode("utf-8")
+            pos = 2 + topic_length
+            if qos > 0:
+                connection.out_buffer += b"\x40\x02" + body[pos:pos + 2]
+                pos += 2
+            self._publish(topic, body[pos:])
+        elif packet_type == SUBSCRIBE:
+            mid = body[:2]
+            pos = 2
+            granted = bytearray()
+            while pos < len(body):
+                topic_length = struct.unpack_from("!H", body, pos)[0]
+                connection.subscriptions.add(body[pos + 2:pos + 2 + topic_length].decode("utf-8"))
+                granted.append(min(body[pos + 2 + topic_length], 1))
+                pos += 3 + topic_length
+            connection.out_buffer += bytes([0x90]) + encode_remaining_length(2 + len(granted)) + mid + granted
+        elif packet_type == UNSUBSCRIBE:
+            pos = 2
+            while pos < len(body):
+                topic_length = struct.unpack_from("!H", body, pos)[0]
+                connection.subscriptions.discard(body[pos + 2:pos + 2 + topic_length].decode("utf-8"))
+                pos += 2 + topic_length
+            connection.out_buffer += b"\xb0\x02" + body[:2]
+        elif packet_type == PINGREQ:
+            connection.out_buffer += b"\xd0\x00"
+        elif packet_type == DISCONNECT:
+            return False
+        return True
+
+    def _publish(self, topic, payload):
+        self.published += 1
+        if self.on_publish is not None:
+            self.on_publish(topic, payload)
+        self._deliver(topic, payload)
+        if topic.startswith(SHADOW_TOPIC_PREFIX):
+            self._handle_shadow_request(topic, payload)
+
+    def _deliver(self, topic, payload):
+        packet = None
+        targets = []
+        for connection in self._connections.values():
+            for topic_filter in connection.subscriptions:
+                if topic_matches(topic_filter, topic):
+                    if packet is None:
+                        packet = encode_publish(topic, payload)
+                    connection.out_buffer += packet
+                    targets.append(connection)
+                    break
+        # Subscribers other than the connection being read are not flushed by _read, send to them now
+        for connection in targets:
+            if connection.sock.fileno() != -1:
+                self._flush(connection)
+
+    def _handle_shadow_request(self, topic, payload):
+        # $aws/things/<thing>/shadow/<get|update|delete>
+        levels = topic.split("/")
+        if len(levels) != 5 or levels[3] != "shadow":
+            return
+        thing_name, action = levels[2], levels[4]
+        try:
+            request = json.loads(payload.decode("utf-8"))
+        except ValueError:
+            request = dict()
+        shadow = self._shadows.setdefault(thing_name, {"state": {}, "version": 0})
+        if action == "update":
+            shadow["version"] += 1
+            for section, values in request.get("state", {}).items():
+                shadow["state"].setdefault(section, {}).update(values)
+            response = {"state": request.get("state", {}), "version": shadow["version"], "timestamp": int(time.time())}
+        elif action == "get":
+            response = {"state": shadow["state"], "version": shadow["version"], "timestamp": int(time.time())}
+        elif action == "delete":
+            self._shadows.pop(thing_name, None)
+            response = {"version": shadow["version"], "timestamp": int(time.time())}
+        else:
+            return
+        if "clientToken" in request:
+            response["clientToken"] = request["clientToken"]
+        self._deliver(topic + "/accepted", json.dumps(response).encode("utf-8"))
+
+    def _flush(self, connection):
+        if connection.out_buffer:
+            try:
+                sent = connection.sock.send(connection.out_buffer)
+                del connection.out_buffer[:sent]
+            except (BlockingIOError, InterruptedError):
+                pass
+            except OSError:
+                self._close(connection)
+                return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if connection.out_buffer else 0)
+        self._selector.modify(connection.sock, events, connection)
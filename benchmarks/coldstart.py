@@ -0,0 +1,133 @@
+"""Cold start profiler for the cat feeder thing Lambda.
+
+Imports the handler module in fresh interpreters under python -X importtime and
+breaks the init cost down by top level package and by module. It also times
+creating the SSM client, which loads the botocore service model. Each run is
+repeated and the median is reported, once with eager and once with lazy
+imports (the LazyImports environment variable of the function):
+
+    python benchmarks/coldstart.py
+    python benchmarks/coldstart.py --repeat 10 --top 30 --output coldstart.json
+    python benchmarks/coldstart.py --asset /tmp/pruned-asset
+
+Nothing talks to AWS, the function's environment variables are filled in with
+placeholders.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+DEFAULT_ASSET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambdas", "cat-feeder", "thing")
+
+PLACEHOLDER_ENVIRONMENT = {
+    "Topic": "cat-feeder/action",
+    "ThingName": "coldstart-profiler",
+    "IoTEndpoint": "localhost",
+    "AmazonRootCAParameter": "ca",
+    "CertificatePemParameter": "cert",
+    "PrivateKeySecretParameter": "key",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "coldstart",
+    "AWS_SECRET_ACCESS_KEY": "coldstart"
+}
+
+# Runs in the child interpreter: import the handler, then do what the first invocation does before any network I/O
+CHILD_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import app
+init_sec = time.perf_counter() - start
+start = time.perf_counter()
+app.boto3.client('ssm')
+ssm_client_sec = time.perf_counter() - start
+start = time.perf_counter()
+app.mqtt_lib.AWSIoTMQTTClient
+mqtt_import_sec = time.perf_counter() - start
+print(json.dumps({"init_sec": init_sec, "ssm_client_sec": ssm_client_sec, "mqtt_import_sec": mqtt_import_sec}))
+"""
+
+
+def parse_importtime(stderr):
+    """Returns {module: (self_us, cumulative_us)} from python -X importtime output."""
+    modules = dict()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def profile_once(asset_path, lazy):
+    environment = dict(os.environ)
+    environment.update(PLACEHOLDER_ENVIRONMENT)
+    environment["LazyImports"] = "true" if lazy else "false"
+    environment["PYTHONDONTWRITEBYTECODE"] = "1"
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD_SCRIPT], cwd=asset_path,
+                               env=environment, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    timings = json.loads(completed.stdout.strip().splitlines()[-1])
+    return timings, parse_importtime(completed.stderr)
+
+
+def profile(asset_path, lazy, repeat):
+    runs = [profile_once(asset_path, lazy) for _ in range(repeat)]
+    timings = dict((key, statistics.median(run[0][key] for run in runs)) for key in runs[0][0])
+
+    module_self_us = defaultdict(list)
+    module_cumulative_us = defaultdict(list)
+    for _, modules in runs:
+        for name, (self_us, cumulative_us) in modules.items():
+            module_self_us[name].append(self_us)
+            module_cumulative_us[name].append(cumulative_us)
+    packages = defaultdict(float)
+    modules = []
+    for name in module_self_us:
+        self_us = statistics.median(module_self_us[name])
+        packages[name.split(".")[0]] += self_us
+        modules.append((name, self_us, statistics.median(module_cumulative_us[name])))
+    return {
+        "lazy_imports": lazy,
+        "init_ms": round(timings["init_sec"] * 1000, 2),
+        "ssm_client_ms": round(timings["ssm_client_sec"] * 1000, 2),
+        "mqtt_import_ms": round(timings["mqtt_import_sec"] * 1000, 2),
+        "packages_ms": dict((name, round(us / 1000, 2)) for name, us in sorted(packages.items(), key=lambda item: -item[1])),
+        "modules": [{"module": name, "self_ms": round(self_us / 1000, 2), "cumulative_ms": round(cumulative_us / 1000, 2)}
+                    for name, self_us, cumulative_us in sorted(modules, key=lambda module: -module[2])]
+    }
+
+
+def print_report(report, top):
+    print("LazyImports=%s: handler import %.1f ms, SSM client %.1f ms, MQTT stack import %.1f ms" % (
+        str(report["lazy_imports"]).lower(), report["init_ms"], report["ssm_client_ms"], report["mqtt_import_ms"]))
+    print("  Self import time by package (ms):")
+    for name, ms in list(report["packages_ms"].items())[:top]:
+        print("    %-40s %8.2f" % (name, ms))
+    print("  Slowest modules by cumulative import time (ms):")
+    for module in report["modules"][:top]:
+        print("    %-60s %8.2f %8.2f" % (module["module"], module["self_ms"], module["cumulative_ms"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--asset", default=DEFAULT_ASSET_PATH, help="Lambda asset directory holding app.py")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per mode, the median is reported")
+    parser.add_argument("--top", type=int, default=15, help="Packages and modules to list")
+    parser.add_argument("--output", help="Write the full breakdown to this JSON file")
+    options = parser.parse_args(argv)
+
+    reports = [profile(options.asset, lazy, options.repeat) for lazy in (False, True)]
+    for report in reports:
+        print_report(report, options.top)
+    if options.output:
+        with open(options.output, "w") as output:
+            json.dump({"asset": os.path.abspath(options.asset), "python": sys.version.split()[0], "reports": reports},
+                      output, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
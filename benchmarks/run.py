@@ -0,0 +1,160 @@
+"""Fleet load generator and benchmark runner for the cat feeder MQTT client stack.
+
+Runs the scenarios from scenarios.py against the in-process broker stand-in and
+reports throughput, latency percentiles, CPU time and allocations per message.
+Results can be saved as JSON and compared against an earlier run:
+
+    python benchmarks/run.py --scenario all --output results.json
+    python benchmarks/run.py --scenario all --baseline results.json --tolerance 0.2
+
+The comparison exits with status 1 when a metric regressed by more than the
+tolerance.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambdas", "cat-feeder", "thing"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from broker import BrokerStandIn  # noqa: E402
+from scenarios import SCENARIOS  # noqa: E402
+
+# Metrics checked against a baseline, and whether a higher value is better
+COMPARED_METRICS = {
+    "throughput_per_sec": True,
+    "latency_p50_ms": False,
+    "latency_p99_ms": False,
+    "cpu_us_per_message": False,
+    "alloc_peak_bytes_per_message": False
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def _ms(value):
+    return round(value * 1000, 3) if value is not None else None
+
+
+def run_scenario(name, options):
+    # CPU time and allocations cover the whole scenario including connecting, use enough messages to amortise it
+    broker = BrokerStandIn().start()
+    try:
+        gc.collect()
+        if options.trace_allocations:
+            tracemalloc.start()
+            traced_before = tracemalloc.get_traced_memory()[0]
+        broker_cpu_before = broker.get_cpu_sec()
+        cpu_before = time.process_time()
+        result = SCENARIOS[name](broker, options)
+        # The broker shares the process, its own CPU time is not the client's
+        cpu_sec = (time.process_time() - cpu_before) - (broker.get_cpu_sec() - broker_cpu_before)
+        if options.trace_allocations:
+            traced_after, traced_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    finally:
+        broker.stop()
+
+    messages = result.pop("messages")
+    latencies = sorted(result.pop("latencies"))
+    elapsed = result.pop("elapsed_sec")
+    summary = {
+        "scenario": name,
+        "messages": messages,
+        "elapsed_sec": round(elapsed, 4),
+        "throughput_per_sec": round(messages / elapsed, 1) if elapsed > 0 else None,
+        "latency_p50_ms": _ms(percentile(latencies, 0.5)),
+        "latency_p90_ms": _ms(percentile(latencies, 0.9)),
+        "latency_p99_ms": _ms(percentile(latencies, 0.99)),
+        "latency_max_ms": _ms(latencies[-1] if latencies else None),
+        "cpu_us_per_message": round(cpu_sec * 1e6 / messages, 1) if messages else None
+    }
+    if options.trace_allocations and messages:
+        summary["alloc_peak_bytes_per_message"] = round((traced_peak - traced_before) / float(messages), 1)
+        summary["alloc_retained_bytes_per_message"] = round((traced_after - traced_before) / float(messages), 1)
+    summary.update(result)
+    return summary
+
+
+def compare(results, baseline, tolerance):
+    """Returns one line per metric that got worse than the baseline by more than the tolerance."""
+    regressions = []
+    baseline_by_scenario = dict((entry["scenario"], entry) for entry in baseline["results"])
+    for entry in results:
+        previous = baseline_by_scenario.get(entry["scenario"])
+        if previous is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = previous.get(metric), entry.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / float(old)
+            if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                regressions.append("%s %s: %s -> %s (%+.1f%%)" % (entry["scenario"], metric, old, new, change * 100))
+    return regressions
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS) + ["all"], default="pubsub")
+    parser.add_argument("--clients", type=int, default=1, help="Number of simulated devices")
+    parser.add_argument("--messages", type=int, default=1000, help="Messages or shadow requests per client")
+    parser.add_argument("--rate", type=float, default=0, help="Messages per second per client, 0 for as fast as possible")
+    parser.add_argument("--qos", type=int, choices=[0, 1], default=1)
+    parser.add_argument("--payload-size", type=int, default=64, help="Publish payload size in bytes")
+    parser.add_argument("--reactor-threads", type=int, default=0,
+                        help="Share a network reactor with this many threads between the pubsub clients, 0 for one loop thread per client")
+    parser.add_argument("--drain-frequency", type=float, default=100, help="Offline queue draining frequency in Hz")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for a scenario to complete")
+    parser.add_argument("--trace-allocations", action="store_true", help="Measure allocations with tracemalloc, slows the run down")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against the results in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression against the baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    names = sorted(SCENARIOS) if options.scenario == "all" else [options.scenario]
+    results = []
+    for name in names:
+        summary = run_scenario(name, options)
+        results.append(summary)
+        print(json.dumps(summary, sort_keys=True))
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": vars(options),
+        "results": results
+    }
+    if options.output:
+        with open(options.output, "w") as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+
+    status = 0
+    if any(not entry["completed"] for entry in results):
+        print("Incomplete: some scenarios timed out before every message arrived", file=sys.stderr)
+        status = 1
+    if options.baseline:
+        with open(options.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), options.tolerance)
+        for line in regressions:
+            print("Regression: " + line, file=sys.stderr)
+        if regressions:
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
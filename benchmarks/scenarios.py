@@ -0,0 +1,260 @@
+"""Benchmark scenarios driving the vendored AWS IoT SDK against the broker stand-in.
+
+Every scenario takes the running broker and the parsed command line options.
+It returns the number of messages it measured, the wall clock time they took,
+and one latency sample per message. run.py adds the CPU time and allocation
+figures around it.
+"""
+import json
+import struct
+import threading
+import time
+
+from AWSIoTPythonSDK.MQTTLib import AWSIoTMQTTClient
+from AWSIoTPythonSDK.MQTTLib import AWSIoTMQTTShadowClient
+from AWSIoTPythonSDK.core.protocol.connection.reactor import NetworkReactor
+
+SEND_TIME = struct.Struct("!d")
+SHADOW_TIMEOUT_SEC = 30
+
+
+class LatencyRecorder(object):
+    """Collects latency samples from callback threads and signals once the expected count arrived."""
+
+    def __init__(self, expected):
+        self._expected = expected
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self.latencies = []
+        self.last_time = None
+
+    def record(self, latency_sec):
+        with self._lock:
+            self.latencies.append(latency_sec)
+            self.last_time = time.perf_counter()
+            if len(self.latencies) >= self._expected:
+                self._done.set()
+
+    def wait(self, timeout_sec):
+        return self._done.wait(timeout_sec)
+
+
+class RateLimiter(object):
+    """Paces a sending loop to a fixed number of operations per second, 0 means unlimited."""
+
+    def __init__(self, rate):
+        self._interval = 1.0 / rate if rate > 0 else 0
+        self._next = time.perf_counter()
+
+    def wait(self):
+        if not self._interval:
+            return
+        self._next += self._interval
+        delay = self._next - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _make_payload(size):
+    padding = b"x" * max(0, size - SEND_TIME.size)
+    return lambda: bytearray(SEND_TIME.pack(time.perf_counter()) + padding)
+
+
+def _configure(client, broker, options, reactor=None):
+    client.configureEndpoint(broker.host, broker.port)
+    client.configureConnectDisconnectTimeout(10)
+    client.configureMQTTOperationTimeout(10)
+    if reactor is not None:
+        client.configureNetworkReactor(reactor)
+
+
+def _make_reactor(options):
+    return NetworkReactor(options.reactor_threads) if options.reactor_threads > 0 else None
+
+
+def _send_from_threads(clients, send, options):
+    # One sending thread per client, each paced to the per client rate
+    def _sender(index, client):
+        limiter = RateLimiter(options.rate)
+        for sequence in range(options.messages):
+            limiter.wait()
+            send(index, client, sequence)
+
+    threads = [threading.Thread(target=_sender, args=(index, client)) for index, client in enumerate(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_pubsub(broker, options):
+    """Every client subscribes to its own topic and publishes timestamped messages to it.
+
+    Latency runs from just before publishAsync() to the subscription callback.
+    """
+    reactor = _make_reactor(options)
+    expected = options.clients * options.messages
+    recorder = LatencyRecorder(expected)
+
+    def _on_message(client, userdata, message):
+        recorder.record(time.perf_counter() - SEND_TIME.unpack_from(message.payload)[0])
+
+    clients = []
+    for index in range(options.clients):
+        client = AWSIoTMQTTClient("bench-pubsub-%d" % index)
+        _configure(client, broker, options, reactor)
+        client.connect()
+        client.subscribe("bench/%d" % index, options.qos, _on_message)
+        clients.append(client)
+
+    payload = _make_payload(options.payload_size)
+    start = time.perf_counter()
+    _send_from_threads(clients, lambda index, client, sequence: client.publishAsync("bench/%d" % index, payload(), options.qos), options)
+    completed = recorder.wait(options.timeout)
+    elapsed = (recorder.last_time or time.perf_counter()) - start
+
+    for client in clients:
+        client.disconnect()
+    return {
+        "messages": len(recorder.latencies),
+        "expected": expected,
+        "completed": completed,
+        "elapsed_sec": elapsed,
+        "latencies": recorder.latencies
+    }
+
+
+def run_shadow(broker, options):
+    """Every client alternates shadow updates and gets on its own thing shadow.
+
+    Latency runs from the request to its accepted callback. Connecting and the
+    first get and update of every client, which subscribe to the response
+    topics, happen before the measurement starts.
+    """
+    expected = options.clients * options.messages
+    recorder = LatencyRecorder(expected)
+    send_times = dict()
+    send_times_lock = threading.Lock()
+
+    def _on_response(payload, response_status, token):
+        with send_times_lock:
+            send_time = send_times.pop(token, None)
+        if send_time is not None:
+            recorder.record(time.perf_counter() - send_time)
+
+    clients = []
+    handlers = []
+    for index in range(options.clients):
+        client = AWSIoTMQTTShadowClient("bench-shadow-%d" % index)
+        _configure(client, broker, options)
+        client.connect()
+        clients.append(client)
+        handlers.append(client.createShadowHandlerWithName("bench-thing-%d" % index, True))
+
+    warmed_up = LatencyRecorder(2 * len(handlers))
+    warm_up_callback = lambda payload, response_status, token: warmed_up.record(0)
+    warm_up_threads = [threading.Thread(target=_warm_up_shadow, args=(handler, warm_up_callback)) for handler in handlers]
+    for thread in warm_up_threads:
+        thread.start()
+    for thread in warm_up_threads:
+        thread.join()
+    warmed_up.wait(options.timeout)
+
+    def _send(index, handler, sequence):
+        # Register the send time under the token before the response can race us to the callback
+        with send_times_lock:
+            send_time = time.perf_counter()
+            if sequence % 2:
+                token = handler.shadowGet(_on_response, SHADOW_TIMEOUT_SEC)
+            else:
+                document = {"state": {"reported": {"sequence": sequence, "client": index}}}
+                token = handler.shadowUpdate(json.dumps(document), _on_response, SHADOW_TIMEOUT_SEC)
+            send_times[token] = send_time
+
+    start = time.perf_counter()
+    _send_from_threads(handlers, _send, options)
+    completed = recorder.wait(options.timeout)
+    elapsed = (recorder.last_time or time.perf_counter()) - start
+
+    for client in clients:
+        client.disconnect()
+    return {
+        "messages": len(recorder.latencies),
+        "expected": expected,
+        "completed": completed,
+        "elapsed_sec": elapsed,
+        "latencies": recorder.latencies
+    }
+
+
+def _warm_up_shadow(handler, callback):
+    handler.shadowGet(callback, SHADOW_TIMEOUT_SEC)
+    handler.shadowUpdate(json.dumps({"state": {"reported": {"sequence": -1}}}), callback, SHADOW_TIMEOUT_SEC)
+
+
+def run_drain(broker, options):
+    """Every client queues messages while the broker is down and drains them once it is back.
+
+    Latency runs from the broker resuming to each queued message reaching it, so
+    it shows both the reconnect time and the draining rate.
+    """
+    expected = options.clients * options.messages
+    recorder = LatencyRecorder(expected)
+    resume_time = [None]
+    online = threading.Semaphore(0)
+    offline = threading.Semaphore(0)
+
+    def _on_publish(topic, payload):
+        if topic.startswith("drain/"):
+            recorder.record(time.perf_counter() - resume_time[0])
+
+    clients = []
+    for index in range(options.clients):
+        client = AWSIoTMQTTClient("bench-drain-%d" % index)
+        _configure(client, broker, options)
+        client.configureOfflinePublishQueueing(-1)
+        client.configureDrainingFrequency(options.drain_frequency)
+        client.configureAutoReconnectBackoffTime(1, 4, 2)
+        client.onOnline = online.release
+        client.onOffline = offline.release
+        client.connect()
+        clients.append(client)
+    for _ in clients:
+        online.acquire()
+
+    broker.on_publish = _on_publish
+    broker.pause()
+    for _ in clients:
+        offline.acquire()
+
+    payload = _make_payload(options.payload_size)
+    for index, client in enumerate(clients):
+        for _ in range(options.messages):
+            client.publishAsync("drain/%d" % index, payload(), options.qos)
+
+    resume_time[0] = time.perf_counter()
+    broker.resume()
+    for _ in clients:
+        online.acquire()
+    reconnect_sec = time.perf_counter() - resume_time[0]
+    completed = recorder.wait(options.timeout)
+    elapsed = (recorder.last_time or time.perf_counter()) - resume_time[0]
+    broker.on_publish = None
+
+    for client in clients:
+        client.disconnect()
+    return {
+        "messages": len(recorder.latencies),
+        "expected": expected,
+        "completed": completed,
+        "elapsed_sec": elapsed,
+        "reconnect_sec": reconnect_sec,
+        "latencies": recorder.latencies
+    }
+
+
+SCENARIOS = {
+    "pubsub": run_pubsub,
+    "shadow": run_shadow,
+    "drain": run_drain
+}
@@ -0,0 +1,68 @@
+"""Compares the websocket payload masking paths of SecuredWebSocketCore across payload sizes.
+
+    python benchmarks/wss_masking.py
+    python benchmarks/wss_masking.py --sizes 64 1024 65536 --output masking.json
+
+Every path is first checked to produce the same bytes as the byte by byte
+loop. The NumPy path is skipped when NumPy is not installed.
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambdas", "cat-feeder", "thing"))
+
+from AWSIoTPythonSDK.core.protocol.connection import cores  # noqa: E402
+
+DEFAULT_SIZES = [16, 128, 1024, 4096, 16384, 131072, 1048576]
+
+
+def get_paths():
+    paths = {"bytewise": cores._maskPayloadBytewise, "int": cores._maskPayloadInt}
+    if cores._getNumpy() is not None:
+        paths["numpy"] = cores._maskPayloadNumpy
+    paths["selected"] = cores._maskPayload
+    return paths
+
+
+def measure(function, payload, mask_key, min_time_sec):
+    timer = timeit.Timer(lambda: function(payload, mask_key))
+    number, _ = timer.autorange()
+    number = max(number, int(number * min_time_sec / 0.2))
+    return min(timer.repeat(repeat=3, number=number)) / number
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Payload sizes in bytes")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Seconds to spend on each measurement")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    options = parser.parse_args(argv)
+
+    paths = get_paths()
+    mask_key = bytearray(os.urandom(4))
+    results = []
+    print("%10s" % "bytes" + "".join("%14s" % (name + " us") for name in paths) + "%12s" % "speedup")
+    for size in options.sizes:
+        payload = os.urandom(size)
+        expected = cores._maskPayloadBytewise(payload, mask_key)
+        for name, function in paths.items():
+            if function(payload, mask_key) != expected:
+                raise AssertionError("%s masking differs from the byte by byte loop at %d bytes" % (name, size))
+        timings = dict((name, measure(function, payload, mask_key, options.min_time)) for name, function in paths.items())
+        speedup = timings["bytewise"] / timings["selected"]
+        results.append({"bytes": size, "us": dict((name, round(sec * 1e6, 3)) for name, sec in timings.items()),
+                        "speedup": round(speedup, 1)})
+        print("%10d" % size + "".join("%14.2f" % (timings[name] * 1e6) for name in paths) + "%11.1fx" % speedup)
+
+    if options.output:
+        with open(options.output, "w") as output:
+            json.dump({"python": sys.version.split()[0], "numpy": cores._getNumpy().__version__ if cores._getNumpy() is not None else None,
+                       "results": results}, output, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
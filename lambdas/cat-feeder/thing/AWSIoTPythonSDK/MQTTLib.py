@@ -15,6 +15,7 @@
 # */
 
 from AWSIoTPythonSDK.core.util.providers import CertificateCredentialsProvider
+from AWSIoTPythonSDK.core.util.providers import MemoryCertificateCredentialsProvider
 from AWSIoTPythonSDK.core.util.providers import CiphersProvider
 from AWSIoTPythonSDK.core.util.providers import IAMCredentialsProvider
 from AWSIoTPythonSDK.core.util.providers import EndpointProvider
@@ -245,6 +246,50 @@ class AWSIoTMQTTClient:
 
         self._mqtt_core.configure_cert_credentials(cert_credentials_provider, cipher_provider)
 
+    def configureCredentialsFromMemory(self, CAPem, KeyPem="", CertificatePem="", Ciphers=None):
+        """
+        **Description**
+
+        Used to configure the rootCA, private key and certificate from PEM strings already held in memory,
+        so they never have to be written to disk first. The resulting SSLContext is cached and shared between
+        clients configured with the same credentials and is reused on every reconnect. Should be called
+        before connect.
+
+        **Syntax**
+
+        .. code:: python
+
+          myAWSIoTMQTTClient.configureCredentialsFromMemory(rootCAPem, privateKeyPem, certificatePem)
+
+          # Inspect how often the cached SSLContext has been reused
+          from AWSIoTPythonSDK.core.protocol.connection.ssl_contexts import shared_ssl_context_cache
+          shared_ssl_context_cache.get_stats()
+
+        **Parameters**
+
+        *CAPem* - PEM encoded root CA. Required for all connection types.
+
+        *KeyPem* - PEM encoded private key. Required for X.509 certificate based connection.
+
+        *CertificatePem* - PEM encoded certificate. Required for X.509 certificate based connection.
+
+        *Ciphers* - String of colon split SSL ciphers to use.  If not passed, default ciphers will be used.
+
+        **Returns**
+
+        None
+
+        """
+        memory_cert_credentials_provider = MemoryCertificateCredentialsProvider()
+        memory_cert_credentials_provider.set_ca_pem(CAPem)
+        memory_cert_credentials_provider.set_key_pem(KeyPem)
+        memory_cert_credentials_provider.set_cert_pem(CertificatePem)
+
+        cipher_provider = CiphersProvider()
+        cipher_provider.set_ciphers(Ciphers)
+
+        self._mqtt_core.configure_memory_cert_credentials(memory_cert_credentials_provider, cipher_provider)
+
     def configureAutoReconnectBackoffTime(self, baseReconnectQuietTimeSecond, maxReconnectQuietTimeSecond, stableConnectionTimeSecond):
         """
         **Description**
@@ -276,7 +321,7 @@ class AWSIoTMQTTClient:
         """
         self._mqtt_core.configure_reconnect_back_off(baseReconnectQuietTimeSecond, maxReconnectQuietTimeSecond, stableConnectionTimeSecond)
 
-    def configureOfflinePublishQueueing(self, queueSize, dropBehavior=DROP_NEWEST):
+    def configureOfflinePublishQueueing(self, queueSize, dropBehavior=DROP_NEWEST, queueSizeBytes=-1, persistenceDirectory=None):
         """
         **Description**
 
@@ -292,6 +337,10 @@ class AWSIoTMQTTClient:
           # Configure the offline queue for publish requests to be 20 in size and drop the oldest
            request when the queue is full.
           myAWSIoTMQTTClient.configureOfflinePublishQueueing(20, AWSIoTPyMQTT.DROP_OLDEST)
+          # Configure an infinite offline queue that holds at most 1 MB of topics and payloads
+          myAWSIoTMQTTClient.configureOfflinePublishQueueing(-1, queueSizeBytes=1024 * 1024)
+          # Keep queued publish requests on disk so that they survive a process restart
+          myAWSIoTMQTTClient.configureOfflinePublishQueueing(-1, persistenceDirectory="/var/lib/my-thing")
 
         **Parameters**
 
@@ -302,19 +351,29 @@ class AWSIoTMQTTClient:
          Could be :code:`AWSIoTPythonSDK.core.util.enums.DropBehaviorTypes.DROP_OLDEST` or
          :code:`AWSIoTPythonSDK.core.util.enums.DropBehaviorTypes.DROP_NEWEST`.
 
+        *queueSizeBytes* - Maximum total size, in bytes, of the topics and payloads held in the queue. Applies
+         in addition to *queueSize*. If set to -1 (default), only *queueSize* limits the queue.
+
+        *persistenceDirectory* - Directory for a SQLite log of the queued publish requests, one file per client id.
+         Requests are removed from the log once delivered, so after a restart the requests that were never
+         acknowledged are loaded back into the queue and drained on connect. Appends are group-committed.
+         Subscribe/unsubscribe requests are not persisted. If None (default), the queue lives in memory only.
+
         **Returns**
 
         None
 
         """
-        self._mqtt_core.configure_offline_requests_queue(queueSize, dropBehavior)
+        self._mqtt_core.configure_offline_requests_queue(queueSize, dropBehavior, queueSizeBytes, persistenceDirectory)
 
     def configureDrainingFrequency(self, frequencyInHz):
         """
         **Description**
 
         Used to configure the draining speed to clear up the queued requests when the connection is back.
-        Should be called before connect.
+        Should be called before connect. This is the speed draining starts with: queued requests are sent in
+        bursts and the speed is raised while PUBACKs keep coming back fast, up to the limit configured through
+        :code:`configureAdaptiveDraining`, and lowered again when acknowledgements lag behind.
 
         **Syntax**
 
@@ -339,6 +398,185 @@ class AWSIoTMQTTClient:
         """
         self._mqtt_core.configure_draining_interval_sec(1/float(frequencyInHz))
 
+    def configureAdaptiveDraining(self, maxFrequencyInHz=100, ackLatencyTargetSecond=0.5, maxInflightRequests=20):
+        """
+        **Description**
+
+        Used to configure how far the draining speed may adapt. Draining speeds up while PUBACKs for the
+        drained QoS1 requests come back within the latency target, and backs off when acknowledgements are
+        slower than the target, too many are outstanding, or a request is rejected. Should be called before connect.
+
+        **Syntax**
+
+        .. code:: python
+
+          # Never drain faster than 50 requests/second, and slow down once PUBACKs take longer than 200 ms
+          myAWSIoTMQTTClient.configureAdaptiveDraining(50, 0.2)
+          # Keep draining at exactly the speed configured through configureDrainingFrequency
+          myAWSIoTMQTTClient.configureDrainingFrequency(2)
+          myAWSIoTMQTTClient.configureAdaptiveDraining(2)
+
+        **Parameters**
+
+        *maxFrequencyInHz* - The maximum draining speed, in requests/second. Defaults to the AWS IoT limit of
+        100 publish requests per second per connection.
+
+        *ackLatencyTargetSecond* - PUBACK latency, in seconds, above which draining slows down.
+
+        *maxInflightRequests* - Maximum number of drained QoS1 requests waiting for their PUBACK.
+
+        **Returns**
+
+        None
+
+        """
+        self._mqtt_core.configure_adaptive_draining(maxFrequencyInHz, ackLatencyTargetSecond, maxInflightRequests)
+
+    def getDrainingMetrics(self):
+        """
+        **Description**
+
+        Get the metrics of the latest offline requests draining.
+
+        **Syntax**
+
+        .. code:: python
+
+          metrics = myAWSIoTMQTTClient.getDrainingMetrics()
+          print(metrics["backlog"], metrics["throughput_hz"])
+
+        **Parameters**
+
+        None
+
+        **Returns**
+
+        Dictionary with :code:`backlog` (requests still queued), :code:`drained` (requests sent in the latest
+        draining), :code:`throughput_hz` (requests/second achieved), :code:`rate_hz` (current draining speed),
+        :code:`inflight` (drained requests waiting for a PUBACK), :code:`ack_latency_sec` (smoothed PUBACK
+        latency) and :code:`throttled` (rejected requests).
+
+        """
+        return self._mqtt_core.get_draining_metrics()
+
+    def configureCallbackExecutor(self, maxWorkers=4, maxQueueSize=1000):
+        """
+        **Description**
+
+        Used to configure the worker pool that runs message callbacks and device shadow callbacks. Callbacks
+        for the same topic always run one at a time, in the order the messages arrived, while callbacks for
+        different topics run in parallel on up to :code:`maxWorkers` threads. When :code:`maxQueueSize`
+        callbacks are waiting, message dispatching blocks until the workers catch up.
+
+        **Syntax**
+
+        .. code:: python
+
+          # Run callbacks on up to 8 threads and hold at most 500 pending callbacks
+          myAWSIoTMQTTClient.configureCallbackExecutor(8, 500)
+          # Run every callback on a single thread, in arrival order
+          myAWSIoTMQTTClient.configureCallbackExecutor(1)
+
+        **Parameters**
+
+        *maxWorkers* - Maximum number of threads running callbacks. Must be at least 1.
+
+        *maxQueueSize* - Maximum number of callbacks waiting for a worker. If set to 0 or a negative value,
+        the number of pending callbacks is not limited.
+
+        **Returns**
+
+        None
+
+        """
+        self._mqtt_core.configure_callback_executor(maxWorkers, maxQueueSize)
+
+    def getCallbackExecutorMetrics(self):
+        """
+        **Description**
+
+        Get the metrics of the worker pool that runs message and device shadow callbacks.
+
+        **Syntax**
+
+        .. code:: python
+
+          metrics = myAWSIoTMQTTClient.getCallbackExecutorMetrics()
+          print(metrics["queue_depth"], metrics["max_queue_wait_sec"])
+
+        **Parameters**
+
+        None
+
+        **Returns**
+
+        Dictionary with :code:`workers` (threads started), :code:`queue_depth` (callbacks waiting for a worker),
+        :code:`submitted`, :code:`completed` and :code:`failed` (callbacks that raised) counters,
+        :code:`blocked_submits` (times dispatching waited for room in the queue), and :code:`avg_queue_wait_sec`
+        and :code:`max_queue_wait_sec` (time callbacks spent waiting for a worker).
+
+        """
+        return self._mqtt_core.get_callback_executor_metrics()
+
+    def getDispatchMetrics(self):
+        """
+        **Description**
+
+        Get the metrics of the event dispatching loop that hands network events (acks, messages, connection
+        state changes) over from the network thread to the callbacks.
+
+        **Syntax**
+
+        .. code:: python
+
+          metrics = myAWSIoTMQTTClient.getDispatchMetrics()
+          print(metrics["latency_p99_sec"])
+
+        **Parameters**
+
+        None
+
+        **Returns**
+
+        Dictionary with :code:`queue_depth` (events waiting to be dispatched), :code:`dispatched` (events
+        dispatched so far), :code:`batches` and :code:`max_batch_size` (events handed over per wakeup), and
+        :code:`latency_p50_sec`, :code:`latency_p90_sec`, :code:`latency_p99_sec` and :code:`latency_max_sec`
+        (time the last 1000 events waited between being received and being dispatched).
+
+        """
+        return self._mqtt_core.get_dispatch_metrics()
+
+    def configureNetworkReactor(self, networkReactor):
+        """
+        **Description**
+
+        Used to serve the network I/O of this client from a shared network reactor instead of a network thread of
+        its own. One reactor can serve hundreds of clients from a few threads, including keep-alive pings, QoS
+        retries and reconnects with the configured backoff. Should be called before connect.
+
+        **Syntax**
+
+        .. code:: python
+
+          from AWSIoTPythonSDK.core.protocol.connection.reactor import NetworkReactor
+
+          # Serve all the clients of this process from two network threads
+          networkReactor = NetworkReactor(2)
+          for myAWSIoTMQTTClient in myAWSIoTMQTTClients:
+              myAWSIoTMQTTClient.configureNetworkReactor(networkReactor)
+
+        **Parameters**
+
+        *networkReactor* - :code:`AWSIoTPythonSDK.core.protocol.connection.reactor.NetworkReactor` object. If set to
+        None, the client runs its own network thread again.
+
+        **Returns**
+
+        None
+
+        """
+        self._mqtt_core.configure_network_reactor(networkReactor)
+
     def configureConnectDisconnectTimeout(self, timeoutSecond):
         """
         **Description**
@@ -604,6 +842,33 @@ class AWSIoTMQTTClient:
         """
         return self._mqtt_core.disconnect_async(ackCallback)
 
+    def getClientStatus(self):
+        """
+        **Description**
+
+        Get the current connection status of the client. This is a cheap, in-memory lookup that does not
+        touch the network, so it can be used to decide whether an existing connection can be reused.
+
+        **Syntax**
+
+        .. code:: python
+
+          from AWSIoTPythonSDK.core.protocol.internal.clients import ClientStatus
+
+          if myAWSIoTMQTTClient.getClientStatus() == ClientStatus.STABLE:
+              myAWSIoTMQTTClient.publish("myTopic", "myPayload", 0)
+
+        **Parameters**
+
+        None
+
+        **Returns**
+
+        One of the :code:`AWSIoTPythonSDK.core.protocol.internal.clients.ClientStatus` values.
+
+        """
+        return self._mqtt_core.get_client_status()
+
     def publish(self, topic, payload, QoS):
         """
         **Description**
@@ -668,6 +933,36 @@ class AWSIoTMQTTClient:
         """
         return self._mqtt_core.publish_async(topic, payload, QoS, False, ackCallback)
 
+    def publishBatch(self, messages):
+        """
+        **Description**
+
+        Publish a batch of messages over the current connection. All requests are sent back to back without
+        waiting in between, then the PUBACKs for the QoS1 messages are awaited together, bounded by the MQTT
+        operation timeout.
+
+        **Syntax**
+
+        .. code:: python
+
+          # Publish three messages and wait for the two QoS1 PUBACKs together
+          results = myAWSIoTMQTTClient.publishBatch([("myTopic", "payload1", 1),
+                                                     ("myTopic", "payload2", 1),
+                                                     ("myTopic/sub", "payload3", 0)])
+
+        **Parameters**
+
+        *messages* - Iterable of :code:`(topic, payload, QoS)` tuples.
+
+        **Returns**
+
+        List of :code:`(mid, result)` tuples in request order, where :code:`result` is one of the
+        :code:`AWSIoTPythonSDK.core.protocol.internal.requests.PublishResults` values and :code:`mid` is None
+        for requests that were queued offline or failed.
+
+        """
+        return self._mqtt_core.publish_batch((topic, payload, QoS, False) for topic, payload, QoS in messages)  # Disable retain for publish by now
+
     def subscribe(self, topic, QoS, callback):
         """
         **Description**
@@ -0,0 +1,336 @@
+#
+#/*
+# * Copyright 2010-2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# *
+# * Licensed under the Apache License, Version 2.0 (the "License").
+# * You may not use this file except in compliance with the License.
+# * A copy of the License is located at
+# *
+# *  http://aws.amazon.com/apache2.0
+# *
+# * or in the "license" file accompanying this file. This file is distributed
+# * on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# * express or implied. See the License for the specific language governing
+# * permissions and limitations under the License.
+# */
+
+from AWSIoTPythonSDK.MQTTLib import AWSIoTMQTTClient
+from AWSIoTPythonSDK.MQTTLib import MQTTv3_1_1
+from AWSIoTPythonSDK.core.protocol.async_mqtt_core import AsyncMqttCore
+
+
+class AsyncAWSIoTMQTTClient(object):
+
+    def __init__(self, clientID, protocolType=MQTTv3_1_1, useWebsocket=False, cleanSession=True):
+        """
+
+        The asyncio client class that connects to and accesses AWS IoT over MQTT v3.1/3.1.1.
+
+        It supports the same connection types and configurations as :code:`AWSIoTPythonSDK.MQTTLib.AWSIoTMQTTClient`,
+        but its MQTT operations are coroutines and its network I/O is driven by the running asyncio event loop
+        instead of a background thread per client, so one process can multiplex many device connections.
+        The client must be used from the event loop it connected on.
+
+        - Auto reconnect/resubscribe
+
+        - Progressive reconnect backoff
+
+        Offline requests queueing is not available: operations fail right away while the client is offline.
+
+        **Syntax**
+
+        .. code:: python
+
+          import AWSIoTPythonSDK.MQTTLibAsync as AWSIoTPyMQTTAsync
+
+          # Create an asyncio AWS IoT MQTT Client using TLSv1.2 Mutual Authentication
+          myAWSIoTMQTTClient = AWSIoTPyMQTTAsync.AsyncAWSIoTMQTTClient("testIoTPySDK")
+
+        **Parameters**
+
+        *clientID* - String that denotes the client identifier used to connect to AWS IoT.
+        If empty string were provided, client id for this connection will be randomly generated
+        n server side.
+
+        *protocolType* - MQTT version in use for this connection. Could be :code:`AWSIoTPythonSDK.MQTTLib.MQTTv3_1` or :code:`AWSIoTPythonSDK.MQTTLib.MQTTv3_1_1`
+
+        *useWebsocket* - Boolean that denotes enabling MQTT over Websocket SigV4 or not.
+
+        **Returns**
+
+        :code:`AWSIoTPythonSDK.MQTTLibAsync.AsyncAWSIoTMQTTClient` object
+
+        """
+        self._mqtt_core = AsyncMqttCore(clientID, cleanSession, protocolType, useWebsocket)
+
+    # Configuration APIs, identical to the ones of the synchronous client
+    configureLastWill = AWSIoTMQTTClient.configureLastWill
+    clearLastWill = AWSIoTMQTTClient.clearLastWill
+    configureEndpoint = AWSIoTMQTTClient.configureEndpoint
+    configureIAMCredentials = AWSIoTMQTTClient.configureIAMCredentials
+    configureCredentials = AWSIoTMQTTClient.configureCredentials
+    configureCredentialsFromMemory = AWSIoTMQTTClient.configureCredentialsFromMemory
+    configureAutoReconnectBackoffTime = AWSIoTMQTTClient.configureAutoReconnectBackoffTime
+    configureConnectDisconnectTimeout = AWSIoTMQTTClient.configureConnectDisconnectTimeout
+    configureMQTTOperationTimeout = AWSIoTMQTTClient.configureMQTTOperationTimeout
+    configureUsernamePassword = AWSIoTMQTTClient.configureUsernamePassword
+    configureSocketFactory = AWSIoTMQTTClient.configureSocketFactory
+    enableMetricsCollection = AWSIoTMQTTClient.enableMetricsCollection
+    disableMetricsCollection = AWSIoTMQTTClient.disableMetricsCollection
+    getClientStatus = AWSIoTMQTTClient.getClientStatus
+
+    # MQTT functionality APIs
+    async def connect(self, keepAliveIntervalSecond=600):
+        """
+        **Description**
+
+        Connect to AWS IoT, with user-specific keepalive interval configuration. Completes once the CONNACK
+        has been received.
+
+        **Syntax**
+
+        .. code:: python
+
+          # Connect to AWS IoT with default keepalive set to 600 seconds
+          await myAWSIoTMQTTClient.connect()
+          # Connect to AWS IoT with keepalive interval set to 1200 seconds
+          await myAWSIoTMQTTClient.connect(1200)
+
+        **Parameters**
+
+        *keepAliveIntervalSecond* - Time in seconds for interval of sending MQTT ping request.
+        Default set to 600 seconds.
+
+        **Returns**
+
+        True if the connect attempt succeeded. False if failed.
+
+        """
+        self._load_callbacks()
+        return await self._mqtt_core.connect(keepAliveIntervalSecond)
+
+    def _load_callbacks(self):
+        self._mqtt_core.on_online = self.onOnline
+        self._mqtt_core.on_offline = self.onOffline
+        self._mqtt_core.on_message = self.onMessage
+
+    async def disconnect(self):
+        """
+        **Description**
+
+        Disconnect from AWS IoT. Completes once the DISCONNECT packet has been sent. Open message streams
+        stop iterating.
+
+        **Syntax**
+
+        .. code:: python
+
+          await myAWSIoTMQTTClient.disconnect()
+
+        **Parameters**
+
+        None
+
+        **Returns**
+
+        True if the disconnect attempt succeeded. False if failed.
+
+        """
+        return await self._mqtt_core.disconnect()
+
+    async def publish(self, topic, payload, QoS):
+        """
+        **Description**
+
+        Publish a new message to the desired topic with QoS. For QoS1, completes once the PUBACK has been received.
+
+        **Syntax**
+
+        .. code:: python
+
+          # Publish a QoS0 message "myPayload" to topic "myTopic"
+          await myAWSIoTMQTTClient.publish("myTopic", "myPayload", 0)
+          # Publish many QoS1 messages over the same connection at once
+          await asyncio.gather(*[myAWSIoTMQTTClient.publish("myTopic", payload, 1) for payload in payloads])
+
+        **Parameters**
+
+        *topic* - Topic name to publish to.
+
+        *payload* - Payload to publish.
+
+        *QoS* - Quality of Service. Could be 0 or 1.
+
+        **Returns**
+
+        True if the publish request has been sent to paho. False if the request did not reach paho.
+
+        """
+        return await self._mqtt_core.publish(topic, payload, QoS, False)  # Disable retain for publish by now
+
+    async def subscribe(self, topic, QoS, callback=None):
+        """
+        **Description**
+
+        Subscribe to the desired topic and register a callback. Completes once the SUBACK has been received.
+
+        **Syntax**
+
+        .. code:: python
+
+          # Subscribe to "myTopic" with QoS0 and register a callback
+          await myAWSIoTMQTTClient.subscribe("myTopic", 0, customCallback)
+          # Subscribe to "myTopic/#" with QoS1 and consume the messages from a message stream instead
+          await myAWSIoTMQTTClient.subscribe("myTopic/#", 1)
+
+        **Parameters**
+
+        *topic* - Topic name or filter to subscribe to.
+
+        *QoS* - Quality of Service. Could be 0 or 1.
+
+        *callback* - Function or coroutine function to be called when a new message for the subscribed topic
+        comes in. Should be in form :code:`customCallback(client, userdata, message)`, where
+        :code:`message` contains :code:`topic` and :code:`payload`. Note that :code:`client` and :code:`userdata` are
+        here just to be aligned with the underneath Paho callback function signature. These fields are pending to be
+        deprecated and should not be depended on. Plain functions run on the event loop and should return quickly.
+
+        **Returns**
+
+        True if the subscribe attempt succeeded. False if failed.
+
+        """
+        return await self._mqtt_core.subscribe(topic, QoS, callback)
+
+    async def unsubscribe(self, topic):
+        """
+        **Description**
+
+        Unsubscribe to the desired topic. Completes once the UNSUBACK has been received.
+
+        **Syntax**
+
+        .. code:: python
+
+          await myAWSIoTMQTTClient.unsubscribe("myTopic")
+
+        **Parameters**
+
+        *topic* - Topic name or filter to unsubscribe to.
+
+        **Returns**
+
+        True if the unsubscribe attempt succeeded. False if failed.
+
+        """
+        return await self._mqtt_core.unsubscribe(topic)
+
+    def messages(self, topicFilter=None, maxQueueSize=0):
+        """
+        **Description**
+
+        Create an async iterator over the incoming messages on the subscribed topics. Iteration ends when the
+        client disconnects or the stream is closed.
+
+        **Syntax**
+
+        .. code:: python
+
+          stream = myAWSIoTMQTTClient.messages("myTopic/#")
+          async for message in stream:
+              print(message.topic, message.payload)
+          # Stop receiving messages on this stream
+          stream.close()
+
+        **Parameters**
+
+        *topicFilter* - Only messages on topics matching this filter are delivered. All messages are delivered
+        if not set.
+
+        *maxQueueSize* - Maximum number of messages waiting to be consumed. When exceeded, the oldest message is
+        dropped. If set to 0, the number of waiting messages is not limited.
+
+        **Returns**
+
+        :code:`AWSIoTPythonSDK.core.protocol.async_mqtt_core.MessageStream` object
+
+        """
+        return self._mqtt_core.create_message_stream(topicFilter, maxQueueSize)
+
+    def onOnline(self):
+        """
+        **Description**
+
+        Callback that gets called when the client is online. The callback registration should happen before calling
+        connect.
+
+        **Syntax**
+
+        .. code:: python
+
+          # Register an onOnline callback
+          myAWSIoTMQTTClient.onOnline = myOnOnlineCallback
+
+        **Parameters**
+
+        None
+
+        **Returns**
+
+        None
+
+        """
+        pass
+
+    def onOffline(self):
+        """
+        **Description**
+
+        Callback that gets called when the client is offline. The callback registration should happen before calling
+        connect.
+
+        **Syntax**
+
+        .. code:: python
+
+          # Register an onOffline callback
+          myAWSIoTMQTTClient.onOffline = myOnOfflineCallback
+
+        **Parameters**
+
+        None
+
+        **Returns**
+
+        None
+
+        """
+        pass
+
+    def onMessage(self, message):
+        """
+        **Description**
+
+        Callback that gets called when the client receives a new message. The callback registration should happen
+        before calling connect. This callback, if present, will always be triggered regardless of whether there is
+        any message callback registered upon subscribe API call. It is for the purpose to aggregating the processing
+        of received messages in one function.
+
+        **Syntax**
+
+        .. code:: python
+
+          # Register an onMessage callback
+          myAWSIoTMQTTClient.onMessage = myOnMessageCallback
+
+        **Parameters**
+
+        *message* - Received MQTT message. It contains the source topic as :code:`message.topic`, and the payload as
+        :code:`message.payload`.
+
+        **Returns**
+
+        None
+
+        """
+        pass
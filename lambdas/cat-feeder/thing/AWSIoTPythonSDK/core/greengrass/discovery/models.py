@@ -299,6 +299,11 @@ class DiscoveryInfo(object):
     """
     def __init__(self, rawJson):
         self._raw_json = rawJson
+        # Decoded on first use and kept, see _decode
+        self._groups_dict = None
+        self._core_list = None
+        self._core_dict = None
+        self._ca_list = None
 
     @property
     def rawJson(self):
@@ -335,13 +340,8 @@ class DiscoveryInfo(object):
         List of :code:`AWSIoTPythonSDK.core.greengrass.discovery.models.CoreConnectivtyInfo` object.
 
         """
-        groups_list = self.getAllGroups()
-        core_list = list()
-
-        for group in groups_list:
-            core_list.extend(group.coreConnectivityInfoList)
-
-        return core_list
+        self._decode()
+        return list(self._core_list)
 
     def getAllCas(self):
         """
@@ -368,14 +368,8 @@ class DiscoveryInfo(object):
         :code:`groupId` is the group id that this CA belongs to.
 
         """
-        group_list = self.getAllGroups()
-        ca_list = list()
-
-        for group in group_list:
-            for ca in group.caList:
-                ca_list.append((group.groupId, ca))
-
-        return ca_list
+        self._decode()
+        return list(self._ca_list)
 
     def getAllGroups(self):
         """
@@ -401,8 +395,35 @@ class DiscoveryInfo(object):
         List of :code:`AWSIoTPythonSDK.core.greengrass.discovery.models.GroupConnectivityInfo` object.
 
         """
-        groups_dict = self.toObjectAtGroupLevel()
-        return list(groups_dict.values())
+        self._decode()
+        return list(self._groups_dict.values())
+
+    def getCoreConnectivityInfo(self, coreThingArn):
+        """
+
+        **Description**
+
+        Used to retrieve the :code:`AWSIoTPythonSDK.core.greengrass.discovery.models.CoreConnectivityInfo` object of a
+        core by its thing arn, regardless of which group the core is in.
+
+        **Syntax**
+
+        .. code:: python
+
+          myDiscoveryInfo.getCoreConnectivityInfo("YourOwnArnString")
+
+        **Parameters**
+
+        *coreThingArn* - Thing arn for the desired Greengrass core.
+
+        **Returns**
+
+        :code:`AWSIoTPythonSDK.core.greengrass.discovery.models.CoreConnectivityInfo` object, None if there is no core
+        with this thing arn.
+
+        """
+        self._decode()
+        return self._core_dict.get(coreThingArn)
 
     def toObjectAtGroupLevel(self):
         """
@@ -431,14 +452,32 @@ class DiscoveryInfo(object):
           # Actual connecting logic follows...
 
         """
+        self._decode()
+        return dict(self._groups_dict)
+
+    def _decode(self):
+        # The response is decoded once, all getters share the resulting objects and indexes
+        if self._groups_dict is not None:
+            return
         groups_object = json.loads(self._raw_json)
         groups_dict = dict()
+        core_list = list()
+        core_dict = dict()
+        ca_list = list()
 
         for group_object in groups_object[KEY_GROUP_LIST]:
             group_info = self._decode_group_info(group_object)
             groups_dict[group_info.groupId] = group_info
-
-        return groups_dict
+            for core_info in group_info.coreConnectivityInfoList:
+                core_list.append(core_info)
+                core_dict.setdefault(core_info.coreThingArn, core_info)
+            for ca in group_info.caList:
+                ca_list.append((group_info.groupId, ca))
+
+        self._core_list = core_list
+        self._core_dict = core_dict
+        self._ca_list = ca_list
+        self._groups_dict = groups_dict  # Set last, it marks the decoding as done
 
     def _decode_group_info(self, group_object):
         group_id = group_object[KEY_GROUP_ID]
@@ -27,14 +27,20 @@ import sys
 import ssl
 import time
 import errno
+import select
 import logging
 import socket
 import platform
+import threading
+from collections import deque
 if platform.system() == 'Windows':
     EAGAIN = errno.WSAEWOULDBLOCK
 else:
     EAGAIN = errno.EAGAIN
 
+# Largest single read of the discovery response
+DISCOVERY_READ_CHUNK_BYTES = 16384
+
 
 class DiscoveryInfoProvider(object):
 
@@ -46,6 +52,8 @@ class DiscoveryInfoProvider(object):
     HTTP_PROTOCOL = r"HTTP/1.1 "
     CONTENT_LENGTH = r"content-length: "
     CONTENT_LENGTH_PATTERN = CONTENT_LENGTH + r"([0-9]+)\r\n"
+    CONNECTION_CLOSE_PATTERN = r"connection: *close\r\n"
+    HEADER_END = b"\r\n\r\n"
     HTTP_RESPONSE_CODE_PATTERN = HTTP_PROTOCOL + r"([0-9]+) "
 
     HTTP_SC_200 = "200"
@@ -59,7 +67,7 @@ class DiscoveryInfoProvider(object):
 
     _logger = logging.getLogger(__name__)
 
-    def __init__(self, caPath="", certPath="", keyPath="", host="", port=8443, timeoutSec=120):
+    def __init__(self, caPath="", certPath="", keyPath="", host="", port=8443, timeoutSec=120, cacheTtlSec=0):
         """
 
         The class that provides functionality to perform a Greengrass discovery process to the cloud.
@@ -77,6 +85,8 @@ class DiscoveryInfoProvider(object):
           myDiscoveryInfoProvider = DiscoveryInfoProvider()
           # Create a discovery information provider with custom configuration
           myDiscoveryInfoProvider = DiscoveryInfoProvider(caPath=myCAPath, certPath=myCertPath, keyPath=myKeyPath, host=myHost, timeoutSec=myTimeoutSec)
+          # Create a discovery information provider that reuses results for 5 minutes
+          myDiscoveryInfoProvider = DiscoveryInfoProvider(caPath=myCAPath, certPath=myCertPath, keyPath=myKeyPath, host=myHost, cacheTtlSec=300)
 
         **Parameters**
 
@@ -93,6 +103,9 @@ class DiscoveryInfoProvider(object):
         *timeoutSec* - Time out configuration in seconds to consider a discovery request sending/response waiting has
         been timed out.
 
+        *cacheTtlSec* - Time in seconds to reuse the discovery information of a thing for before requesting it again.
+        0 by default, which disables the cache.
+
         **Returns**
 
         AWSIoTPythonSDK.core.greengrass.discovery.providers.DiscoveryInfoProvider object
@@ -104,6 +117,13 @@ class DiscoveryInfoProvider(object):
         self._host = host
         self._port = port
         self._timeout_sec = timeoutSec
+        self._cache_ttl_sec = cacheTtlSec
+        # Kept alive between discover calls, see _request_discovery
+        self._ssl_context = None
+        self._ssl_sock = None
+        self._tls_session = None
+        self._discovery_info_cache = dict()  # thing name -> (expiry time, DiscoveryInfo)
+        self._lock = threading.Lock()
         self._expected_exception_map = {
             self.HTTP_SC_400 : DiscoveryInvalidRequestException(),
             self.HTTP_SC_401 : DiscoveryUnauthorizedException(),
@@ -139,8 +159,10 @@ class DiscoveryInfoProvider(object):
         None
 
         """
-        self._host = host
-        self._port = port
+        with self._lock:
+            self._host = host
+            self._port = port
+            self._reset()
 
     def configureCredentials(self, caPath, certPath, keyPath):
         """
@@ -168,9 +190,11 @@ class DiscoveryInfoProvider(object):
         None
 
         """
-        self._ca_path = caPath
-        self._cert_path = certPath
-        self._key_path = keyPath
+        with self._lock:
+            self._ca_path = caPath
+            self._cert_path = certPath
+            self._key_path = keyPath
+            self._reset()
 
     def configureTimeout(self, timeoutSec):
         """
@@ -199,6 +223,61 @@ class DiscoveryInfoProvider(object):
         """
         self._timeout_sec = timeoutSec
 
+    def configureCacheTtl(self, cacheTtlSec):
+        """
+
+        **Description**
+
+        Used to configure for how long in seconds the discovery information of a thing is reused before it is requested
+        again. Only successful discovery results are cached.
+
+        **Syntax**
+
+        .. code:: python
+
+          # Reuse discovery information for 5 minutes
+          myDiscoveryInfoProvider.configureCacheTtl(300)
+          # Disable the cache
+          myDiscoveryInfoProvider.configureCacheTtl(0)
+
+        **Parameters**
+
+        *cacheTtlSec* - Time in seconds to cache discovery information for. 0 disables the cache.
+
+        **Returns**
+
+        None
+
+        """
+        with self._lock:
+            self._cache_ttl_sec = cacheTtlSec
+            self._discovery_info_cache.clear()
+
+    def close(self):
+        """
+
+        **Description**
+
+        Close the connection that is kept open between discovery requests. The next discovery request opens a new one.
+
+        **Syntax**
+
+        .. code:: python
+
+          myDiscoveryInfoProvider.close()
+
+        **Parameters**
+
+        None
+
+        **Returns**
+
+        None
+
+        """
+        with self._lock:
+            self._close_connection()
+
     def discover(self, thingName):
         """
 
@@ -224,12 +303,72 @@ class DiscoveryInfoProvider(object):
         self._logger.info("Starting discover request...")
         self._logger.info("Endpoint: " + self._host + ":" + str(self._port))
         self._logger.info("Target thing: " + thingName)
+        with self._lock:
+            discovery_info = self._get_cached_discovery_info(thingName)
+            if discovery_info is not None:
+                self._logger.info("Using cached discovery information.")
+                return discovery_info
+            status_code, response_body = self._request_discovery(thingName)
+            discovery_info = self._raise_if_not_200(status_code, response_body)
+            if self._cache_ttl_sec > 0:
+                self._discovery_info_cache[thingName] = (time.time() + self._cache_ttl_sec, discovery_info)
+            return discovery_info
+
+    def _get_cached_discovery_info(self, thing_name):
+        cached = self._discovery_info_cache.get(thing_name)
+        if cached is None:
+            return None
+        expiry_time, discovery_info = cached
+        if time.time() >= expiry_time:
+            del self._discovery_info_cache[thing_name]
+            return None
+        return discovery_info
+
+    def _request_discovery(self, thing_name):
+        # The connection stays open for the next request unless the server asks to close it. The server may also
+        # drop it while idle, a request on a reused connection that fails is retried once on a new connection.
+        while True:
+            reused = self._ssl_sock is not None
+            if not reused:
+                self._open_connection()
+            try:
+                deadline = time.time() + self._timeout_sec
+                self._raise_on_timeout(self._send_discovery_request(self._ssl_sock, thing_name, deadline))
+                status_code, response_body, keep_alive = self._receive_discovery_response(self._ssl_sock, deadline)
+            except socket.error:
+                self._close_connection()
+                if not reused:
+                    raise
+                self._logger.debug("Kept alive connection is gone, reconnecting...")
+                continue
+            except Exception:
+                self._close_connection()
+                raise
+            # Resumes the TLS session on the next connect
+            self._tls_session = getattr(self._ssl_sock, "session", None)
+            if not keep_alive:
+                self._close_connection()
+            return status_code, response_body
+
+    def _open_connection(self):
         sock = self._create_tcp_connection()
-        ssl_sock = self._create_ssl_connection(sock)
-        self._raise_on_timeout(self._send_discovery_request(ssl_sock, thingName))
-        status_code, response_body = self._receive_discovery_response(ssl_sock)
+        self._ssl_sock = self._create_ssl_connection(sock)
+        self._ssl_sock.setblocking(False)
 
-        return self._raise_if_not_200(status_code, response_body)
+    def _close_connection(self):
+        if self._ssl_sock is not None:
+            try:
+                self._ssl_sock.close()
+            except socket.error:
+                pass
+            self._ssl_sock = None
+
+    def _reset(self):
+        # Endpoint or credentials changed, nothing from the previous configuration can be reused
+        self._close_connection()
+        self._ssl_context = None
+        self._tls_session = None
+        self._discovery_info_cache.clear()
 
     def _create_tcp_connection(self):
         self._logger.debug("Creating tcp connection...")
@@ -247,26 +386,25 @@ class DiscoveryInfoProvider(object):
     def _create_ssl_connection(self, sock):
         self._logger.debug("Creating ssl connection...")
 
-        ssl_protocol_version = ssl.PROTOCOL_SSLv23
-
-        if self._port == 443:
-            ssl_context = SSLContextBuilder()\
+        # One context for all connections, so that a TLS session from an earlier connection can be resumed
+        if self._ssl_context is None:
+            ssl_context_builder = SSLContextBuilder()\
                 .with_ca_certs(self._ca_path)\
                 .with_cert_key_pair(self._cert_path, self._key_path)\
                 .with_cert_reqs(ssl.CERT_REQUIRED)\
                 .with_check_hostname(True)\
-                .with_ciphers(None)\
-                .with_alpn_protocols(['x-amzn-http-ca'])\
-                .build()
-            ssl_sock = ssl_context.wrap_socket(sock, server_hostname=self._host, do_handshake_on_connect=False)
-            ssl_sock.do_handshake()
+                .with_ciphers(None)
+            if self._port == 443:
+                ssl_context_builder.with_alpn_protocols(['x-amzn-http-ca'])
+            self._ssl_context = ssl_context_builder.build()
+
+        if self._tls_session is not None:
+            ssl_sock = self._ssl_context.wrap_socket(sock, server_hostname=self._host, do_handshake_on_connect=False,
+                                                     session=self._tls_session)
         else:
-            ssl_sock = ssl.wrap_socket(sock,
-                                       certfile=self._cert_path,
-                                       keyfile=self._key_path,
-                                       ca_certs=self._ca_path,
-                                       cert_reqs=ssl.CERT_REQUIRED,
-                                       ssl_version=ssl_protocol_version)
+            ssl_sock = self._ssl_context.wrap_socket(sock, server_hostname=self._host, do_handshake_on_connect=False)
+        ssl_sock.do_handshake()
+        self._logger.debug("TLS session reused: " + str(getattr(ssl_sock, "session_reused", False)))
 
         self._logger.debug("Matching host name...")
         if sys.version_info[0] < 3 or (sys.version_info[0] == 3 and sys.version_info[1] < 2):
@@ -326,7 +464,7 @@ class DiscoveryInfoProvider(object):
             else:
                 return False
 
-    def _send_discovery_request(self, ssl_sock, thing_name):
+    def _send_discovery_request(self, ssl_sock, thing_name, deadline):
         request = self.REQUEST_TYPE_PREFIX + \
                   self.PAYLOAD_PREFIX + \
                   thing_name + \
@@ -336,74 +474,65 @@ class DiscoveryInfoProvider(object):
                   self.HOST_SUFFIX
         self._logger.debug("Sending discover request: " + request)
 
-        start_time = time.time()
-        desired_length_to_write = len(request)
-        actual_length_written = 0
-        while True:
-            try:
-                length_written = ssl_sock.write(request.encode("utf-8"))
-                actual_length_written += length_written
-            except socket.error as err:
-                if err.errno == ssl.SSL_ERROR_WANT_READ or err.errno == ssl.SSL_ERROR_WANT_WRITE:
-                    pass
-            if actual_length_written == desired_length_to_write:
-                return self.LOW_LEVEL_RC_COMPLETE
-            if start_time + self._timeout_sec < time.time():
+        remaining_request = memoryview(request.encode("utf-8"))
+        while len(remaining_request) > 0:
+            length_written = self._call_when_ready(ssl_sock, ssl_sock.send, remaining_request, deadline, True)
+            if length_written is None:
                 return self.LOW_LEVEL_RC_TIMEOUT
+            remaining_request = remaining_request[length_written:]
+        return self.LOW_LEVEL_RC_COMPLETE
 
-    def _receive_discovery_response(self, ssl_sock):
+    def _receive_discovery_response(self, ssl_sock, deadline):
         self._logger.debug("Receiving discover response header...")
-        rc1, response_header = self._receive_until(ssl_sock, self._got_two_crlfs)
-        status_code, body_length = self._handle_discovery_response_header(rc1, response_header.decode("utf-8"))
+        response = bytearray()
+        rc1 = self._receive_until(ssl_sock, response, lambda: response.find(self.HEADER_END) >= 0, deadline)
+        self._raise_on_timeout(rc1)
+        header_length = response.find(self.HEADER_END) + len(self.HEADER_END)
+        response_header = bytes(response[:header_length]).decode("utf-8")
+        status_code, body_length = self._handle_discovery_response_header(rc1, response_header)
+        keep_alive = re.search(self.CONNECTION_CLOSE_PATTERN, response_header, re.IGNORECASE) is None
 
         self._logger.debug("Receiving discover response body...")
-        rc2, response_body = self._receive_until(ssl_sock, self._got_enough_bytes, body_length)
-        response_body = self._handle_discovery_response_body(rc2, response_body.decode("utf-8"))
+        body_length = int(body_length)
+        del response[:header_length]  # Whatever came with the header is the start of the body
+        rc2 = self._receive_until(ssl_sock, response, lambda: len(response) >= body_length, deadline)
+        response_body = self._handle_discovery_response_body(rc2, bytes(response[:body_length]).decode("utf-8"))
 
-        return status_code, response_body
+        return status_code, response_body, keep_alive
 
-    def _receive_until(self, ssl_sock, criteria_function, extra_data=None):
-        start_time = time.time()
-        response = bytearray()
-        number_bytes_read = 0
-        ssl_sock_tmp = None
-        while True:  # Python does not have do-while
+    def _receive_until(self, ssl_sock, response, criteria_function, deadline):
+        while not criteria_function():
+            data = self._call_when_ready(ssl_sock, ssl_sock.recv, DISCOVERY_READ_CHUNK_BYTES, deadline, False)
+            if data is None:
+                return self.LOW_LEVEL_RC_TIMEOUT
+            if not data:
+                raise socket.error(errno.ECONNABORTED, "Discovery connection closed by the server")
+            response.extend(data)
+        return self.LOW_LEVEL_RC_COMPLETE
+
+    def _call_when_ready(self, ssl_sock, function, argument, deadline, wait_for_write):
+        # Calls a send/recv function of the non-blocking socket, waiting in select until the socket is ready.
+        # Returns None once the deadline has passed.
+        while True:
             try:
-                ssl_sock_tmp = self._convert_to_int_py3(ssl_sock.read(1))
-                if isinstance(ssl_sock_tmp, list):
-                    response.extend(ssl_sock_tmp)
+                return function(argument)
+            except ssl.SSLError as err:
+                if err.errno == ssl.SSL_ERROR_WANT_READ:
+                    wait_for_write = False
+                elif err.errno == ssl.SSL_ERROR_WANT_WRITE:
+                    wait_for_write = True
                 else:
-                    response.append(ssl_sock_tmp)
-                number_bytes_read += 1
+                    raise
             except socket.error as err:
-                if err.errno == ssl.SSL_ERROR_WANT_READ or err.errno == ssl.SSL_ERROR_WANT_WRITE:
-                    pass
-
-            if criteria_function((number_bytes_read, response, extra_data)):
-                return self.LOW_LEVEL_RC_COMPLETE, response
-            if start_time + self._timeout_sec < time.time():
-                return self.LOW_LEVEL_RC_TIMEOUT, response
-
-    def _convert_to_int_py3(self, input_char):
-        try:
-            return ord(input_char)
-        except:
-            return input_char
-
-    def _got_enough_bytes(self, data):
-        number_bytes_read, response, target_length = data
-        return number_bytes_read == int(target_length)
-
-    def _got_two_crlfs(self, data):
-        number_bytes_read, response, extra_data_unused = data
-        number_of_crlf = 2
-        has_enough_bytes = number_bytes_read > number_of_crlf * 2 - 1
-        if has_enough_bytes:
-            end_of_received = response[number_bytes_read - number_of_crlf * 2 : number_bytes_read]
-            expected_end_of_response = b"\r\n" * number_of_crlf
-            return end_of_received == expected_end_of_response
-        else:
-            return False
+                if err.errno != errno.EWOULDBLOCK and err.errno != EAGAIN:
+                    raise
+            remaining_sec = deadline - time.time()
+            if remaining_sec <= 0:
+                return None
+            if wait_for_write:
+                select.select([], [ssl_sock], [], remaining_sec)
+            else:
+                select.select([ssl_sock], [], [], remaining_sec)
 
     def _handle_discovery_response_header(self, rc, response):
         self._raise_on_timeout(rc)
@@ -429,3 +558,168 @@ class DiscoveryInfoProvider(object):
             else:
                 raise DiscoveryFailure(response_body)
         return DiscoveryInfo(response_body)
+
+
+class ConnectivityInfoSelector(object):
+
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, timeoutSec=5, maxConcurrentProbes=16):
+        """
+
+        The class that picks the Greengrass core endpoint to connect to out of the discovery information.
+
+        Every connectivity information of the given cores is probed with a TCP connect, several at the same time, and
+        the endpoint with the lowest measured connect latency is returned. Once an endpoint has been reached, the
+        remaining probes only wait as long as that endpoint took to connect, since a slower one cannot win.
+
+        **Syntax**
+
+        .. code:: python
+
+          from AWSIoTPythonSDK.core.greengrass.discovery.providers import ConnectivityInfoSelector
+
+          # Create a connectivity information selector
+          myConnectivityInfoSelector = ConnectivityInfoSelector()
+          # Create a connectivity information selector with custom configuration
+          myConnectivityInfoSelector = ConnectivityInfoSelector(timeoutSec=2, maxConcurrentProbes=32)
+
+        **Parameters**
+
+        *timeoutSec* - Time out configuration in seconds for the whole selection. Endpoints that do not accept the
+        connection within this time are considered unreachable.
+
+        *maxConcurrentProbes* - Maximum number of endpoints that are probed at the same time.
+
+        **Returns**
+
+        AWSIoTPythonSDK.core.greengrass.discovery.providers.ConnectivityInfoSelector object
+
+        """
+        self._timeout_sec = timeoutSec
+        self._max_concurrent_probes = maxConcurrentProbes
+
+    def selectFastest(self, coreConnectivityInfoList):
+        """
+
+        **Description**
+
+        Probe the connectivity information of the given Greengrass cores concurrently and return the one that is
+        reachable with the lowest connect latency. Endpoints that have not been probed by the time out are not
+        considered.
+
+        **Syntax**
+
+        .. code:: python
+
+          selected = myConnectivityInfoSelector.selectFastest(myDiscoveryInfo.getAllCores())
+          if selected is not None:
+              coreConnectivityInfo, connectivityInfo = selected
+              host = connectivityInfo.host
+              port = connectivityInfo.port
+
+        **Parameters**
+
+        *coreConnectivityInfoList* - List of :code:`AWSIoTPythonSDK.core.greengrass.discovery.models.CoreConnectivityInfo`
+        object, as returned by :code:`getAllCores`.
+
+        **Returns**
+
+        :code:`(coreConnectivityInfo, connectivityInfo)` pair of the endpoint with the lowest latency, None if no
+        endpoint could be reached.
+
+        """
+        pending = deque()
+        for core_info in coreConnectivityInfoList:
+            for connectivity_info in core_info.connectivityInfoList:
+                pending.append((core_info, connectivity_info))
+        candidate_count = len(pending)
+        if candidate_count == 0:
+            return None
+
+        probe_round = _ProbeRound(pending, time.time() + self._timeout_sec)
+        for _ in range(min(self._max_concurrent_probes, candidate_count)):
+            probe_thread = threading.Thread(target=self._probe_candidates, args=(probe_round,))
+            probe_thread.daemon = True
+            probe_thread.start()
+
+        try:
+            best = None
+            reported_count = 0
+            with probe_round.condition:
+                while reported_count < candidate_count:
+                    now = time.time()
+                    wait_sec = probe_round.deadline - now
+                    if wait_sec <= 0:
+                        break
+                    if not probe_round.results:
+                        if best is not None and not probe_round.pending:
+                            # The running probes can only win by connecting within the best latency from their start
+                            last_chance = max(probe_round.running_start_times.values() or [now]) + best[0]
+                            if last_chance <= now:
+                                break
+                            wait_sec = min(wait_sec, last_chance - now)
+                        probe_round.condition.wait(wait_sec)
+                        continue
+                    result = probe_round.results.popleft()
+                    reported_count += 1
+                    if result[0] is not None and (best is None or result[0] < best[0]):
+                        # Probes that are still queued start late, the first to connect is not necessarily the fastest
+                        best = result
+                        probe_round.best_latency_sec = result[0]
+        finally:
+            # Probes still running finish by themselves, no new ones are started
+            probe_round.done.set()
+
+        if best is None:
+            self._logger.warn("None of the %d Greengrass core endpoints could be reached." % candidate_count)
+            return None
+        latency_sec, core_info, connectivity_info = best
+        self._logger.info("Selected " + connectivity_info.host + ":" + str(connectivity_info.port) +
+                          " of core " + core_info.coreThingArn + ", connected in %.1f ms" % (latency_sec * 1000))
+        return core_info, connectivity_info
+
+    def _probe_candidates(self, probe_round):
+        while True:
+            with probe_round.condition:
+                if probe_round.done.is_set() or not probe_round.pending:
+                    return
+                candidate = probe_round.pending.popleft()
+                start_time = time.time()
+                probe_round.running_start_times[id(candidate)] = start_time
+                timeout_sec = probe_round.deadline - start_time
+                if probe_round.best_latency_sec is not None:
+                    timeout_sec = min(timeout_sec, probe_round.best_latency_sec)
+            core_info, connectivity_info = candidate
+            latency_sec = self._probe(connectivity_info, max(timeout_sec, 0.001))
+            if latency_sec is not None and latency_sec > timeout_sec:
+                latency_sec = None  # Name resolution alone took longer than allowed
+            with probe_round.condition:
+                del probe_round.running_start_times[id(candidate)]
+                probe_round.results.append((latency_sec, core_info, connectivity_info))
+                probe_round.condition.notify()
+
+    def _probe(self, connectivity_info, timeout_sec):
+        # Name resolution is not bounded by the timeout, selectFastest stops waiting at the deadline regardless
+        start_time = time.time()
+        try:
+            sock = socket.create_connection((connectivity_info.host, int(connectivity_info.port)), timeout_sec)
+        except (socket.error, ValueError) as err:
+            self._logger.debug("Cannot reach " + str(connectivity_info.host) + ":" + str(connectivity_info.port) + ": " + str(err))
+            return None
+        latency_sec = time.time() - start_time
+        sock.close()
+        return latency_sec
+
+
+class _ProbeRound(object):
+    # State shared by the probe threads of one selectFastest call
+
+    def __init__(self, pending, deadline):
+        self.pending = pending  # (core, connectivity information) pairs not probed yet, guarded by condition
+        self.running_start_times = dict()  # id of a pair being probed -> probe start time, guarded by condition
+        self.deadline = deadline
+        self.results = deque()  # (latency or None, core, connectivity information), guarded by condition
+        self.condition = threading.Condition()
+        self.done = threading.Event()
+        self.best_latency_sec = None  # Guarded by condition
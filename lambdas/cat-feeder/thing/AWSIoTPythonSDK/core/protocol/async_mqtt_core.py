@@ -0,0 +1,482 @@
+# /*
+# * Copyright 2010-2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# *
+# * Licensed under the Apache License, Version 2.0 (the "License").
+# * You may not use this file except in compliance with the License.
+# * A copy of the License is located at
+# *
+# *  http://aws.amazon.com/apache2.0
+# *
+# * or in the "license" file accompanying this file. This file is distributed
+# * on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# * express or implied. See the License for the specific language governing
+# * permissions and limitations under the License.
+# */
+
+import asyncio
+import logging
+import time
+import AWSIoTPythonSDK
+from AWSIoTPythonSDK.core.protocol.internal.clients import InternalAsyncMqttClient
+from AWSIoTPythonSDK.core.protocol.internal.clients import ClientStatusContainer
+from AWSIoTPythonSDK.core.protocol.internal.clients import ClientStatus
+from AWSIoTPythonSDK.core.protocol.internal.workers import SubscriptionManager
+from AWSIoTPythonSDK.core.protocol.internal.workers import TopicTrie
+from AWSIoTPythonSDK.core.protocol.internal.defaults import DEFAULT_CONNECT_DISCONNECT_TIMEOUT_SEC
+from AWSIoTPythonSDK.core.protocol.internal.defaults import DEFAULT_OPERATION_TIMEOUT_SEC
+from AWSIoTPythonSDK.core.protocol.internal.defaults import METRICS_PREFIX
+from AWSIoTPythonSDK.core.protocol.internal.defaults import ALPN_PROTCOLS
+from AWSIoTPythonSDK.core.protocol.paho.client import MQTT_ERR_SUCCESS
+from AWSIoTPythonSDK.core.protocol.paho.client import MQTTv31
+from AWSIoTPythonSDK.exception.AWSIoTExceptions import connectError
+from AWSIoTPythonSDK.exception.AWSIoTExceptions import connectTimeoutException
+from AWSIoTPythonSDK.exception.AWSIoTExceptions import disconnectError
+from AWSIoTPythonSDK.exception.AWSIoTExceptions import disconnectTimeoutException
+from AWSIoTPythonSDK.exception.AWSIoTExceptions import publishError
+from AWSIoTPythonSDK.exception.AWSIoTExceptions import publishTimeoutException
+from AWSIoTPythonSDK.exception.AWSIoTExceptions import publishQueueDisabledException
+from AWSIoTPythonSDK.exception.AWSIoTExceptions import subscribeError
+from AWSIoTPythonSDK.exception.AWSIoTExceptions import subscribeTimeoutException
+from AWSIoTPythonSDK.exception.AWSIoTExceptions import subscribeQueueDisabledException
+from AWSIoTPythonSDK.exception.AWSIoTExceptions import unsubscribeError
+from AWSIoTPythonSDK.exception.AWSIoTExceptions import unsubscribeTimeoutException
+from AWSIoTPythonSDK.exception.AWSIoTExceptions import unsubscribeQueueDisabledException
+
+
+class AsyncMqttCore(object):
+    """Drives the paho packet logic from an asyncio event loop.
+
+    The socket is registered with the loop instead of being served by a network thread, and
+    keep-alive/retry housekeeping runs on a loop timer, so any number of clients can share one
+    thread. Everything except the blocking TCP connect and TLS handshake happens on the loop.
+    """
+
+    HOUSEKEEPING_INTERVAL_SEC = 1
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, client_id, clean_session, protocol, use_wss):
+        self._use_wss = use_wss
+        self._username = ""
+        self._password = None
+        self._enable_metrics_collection = True
+        self._client_status = ClientStatusContainer()
+        self._internal_async_client = InternalAsyncMqttClient(client_id, clean_session, protocol, use_wss)
+        self._paho_client = self._internal_async_client.get_paho_client()
+        self._paho_client.stable_connection_timer_set(False)  # Backoff is reset in _handle_disconnect instead
+        self._subscription_manager = SubscriptionManager()
+        self._endpoint_provider = None
+        self._connect_disconnect_timeout_sec = DEFAULT_CONNECT_DISCONNECT_TIMEOUT_SEC
+        self._operation_timeout_sec = DEFAULT_OPERATION_TIMEOUT_SEC
+        self._base_reconnect_quiet_sec = 1
+        self._max_reconnect_quiet_sec = 32
+        self._stable_connection_sec = 20
+        self._reconnect_quiet_sec = self._base_reconnect_quiet_sec
+        self._keep_alive_sec = None
+        self._loop = None
+        self._fd = None
+        self._is_writing = False
+        self._housekeeping_handle = None
+        self._reconnect_task = None
+        self._connack_future = None
+        self._disconnect_future = None
+        self._ack_futures = dict()
+        self._message_streams = set()
+        self._connected_time = None
+        self._init_paho_callbacks()
+        self._logger.info("AsyncMqttCore initialized")
+        self._logger.info("Client id: %s" % client_id)
+        self._logger.info("Protocol version: %s" % ("MQTTv3.1" if protocol == MQTTv31 else "MQTTv3.1.1"))
+        self._logger.info("Authentication type: %s" % ("SigV4 WebSocket" if use_wss else "TLSv1.2 certificate based Mutual Auth."))
+
+    def _init_paho_callbacks(self):
+        self._paho_client.on_connect = self._on_connect
+        self._paho_client.on_disconnect = self._on_disconnect
+        self._paho_client.on_publish = self._on_ack
+        self._paho_client.on_subscribe = self._on_suback
+        self._paho_client.on_unsubscribe = self._on_ack
+        self._paho_client.on_message = self._on_message
+
+    def use_wss(self):
+        return self._use_wss
+
+    def get_client_status(self):
+        return self._client_status.get_status()
+
+    # Used for general message event reception
+    def on_message(self, message):
+        pass
+
+    # Used for general online event notification
+    def on_online(self):
+        pass
+
+    # Used for general offline event notification
+    def on_offline(self):
+        pass
+
+    def configure_cert_credentials(self, cert_credentials_provider, ciphers_provider):
+        self._logger.info("Configuring certificates and ciphers...")
+        self._internal_async_client.set_cert_credentials_provider(cert_credentials_provider, ciphers_provider)
+
+    def configure_memory_cert_credentials(self, memory_cert_credentials_provider, ciphers_provider):
+        self._logger.info("Configuring in-memory certificates and ciphers...")
+        self._internal_async_client.set_memory_cert_credentials_provider(memory_cert_credentials_provider, ciphers_provider)
+
+    def configure_iam_credentials(self, iam_credentials_provider):
+        self._logger.info("Configuring custom IAM credentials...")
+        self._internal_async_client.set_iam_credentials_provider(iam_credentials_provider)
+
+    def configure_endpoint(self, endpoint_provider):
+        self._logger.info("Configuring endpoint...")
+        self._endpoint_provider = endpoint_provider
+
+    def configure_connect_disconnect_timeout_sec(self, connect_disconnect_timeout_sec):
+        self._logger.info("Configuring connect/disconnect time out: %f sec" % connect_disconnect_timeout_sec)
+        self._connect_disconnect_timeout_sec = connect_disconnect_timeout_sec
+
+    def configure_operation_timeout_sec(self, operation_timeout_sec):
+        self._logger.info("Configuring MQTT operation time out: %f sec" % operation_timeout_sec)
+        self._operation_timeout_sec = operation_timeout_sec
+
+    def configure_reconnect_back_off(self, base_reconnect_quiet_sec, max_reconnect_quiet_sec, stable_connection_sec):
+        self._logger.info("Configuring reconnect back off timing...")
+        self._logger.info("Base quiet time: %f sec" % base_reconnect_quiet_sec)
+        self._logger.info("Max quiet time: %f sec" % max_reconnect_quiet_sec)
+        self._logger.info("Stable connection time: %f sec" % stable_connection_sec)
+        self._base_reconnect_quiet_sec = base_reconnect_quiet_sec
+        self._max_reconnect_quiet_sec = max_reconnect_quiet_sec
+        self._stable_connection_sec = stable_connection_sec
+        self._reconnect_quiet_sec = base_reconnect_quiet_sec
+
+    def configure_alpn_protocols(self):
+        self._logger.info("Configuring alpn protocols...")
+        self._internal_async_client.configure_alpn_protocols([ALPN_PROTCOLS])
+
+    def configure_last_will(self, topic, payload, qos, retain=False):
+        self._logger.info("Configuring last will...")
+        self._internal_async_client.configure_last_will(topic, payload, qos, retain)
+
+    def clear_last_will(self):
+        self._logger.info("Clearing last will...")
+        self._internal_async_client.clear_last_will()
+
+    def configure_username_password(self, username, password=None):
+        self._logger.info("Configuring username and password...")
+        self._username = username
+        self._password = password
+
+    def configure_socket_factory(self, socket_factory):
+        self._logger.info("Configuring socket factory...")
+        self._internal_async_client.set_socket_factory(socket_factory)
+
+    def enable_metrics_collection(self):
+        self._enable_metrics_collection = True
+
+    def disable_metrics_collection(self):
+        self._enable_metrics_collection = False
+
+    async def connect(self, keep_alive_sec):
+        self._logger.info("Performing async connect...")
+        self._logger.info("Keep-alive: %f sec" % keep_alive_sec)
+        self._loop = asyncio.get_event_loop()
+        self._keep_alive_sec = keep_alive_sec
+        self._load_username_password()
+        self._client_status.set_status(ClientStatus.CONNECT)
+        try:
+            await self._connect_once()
+        except Exception:
+            self._stop_io()
+            self._client_status.set_status(ClientStatus.IDLE)
+            raise
+        return True
+
+    def _load_username_password(self):
+        username_candidate = self._username
+        if self._enable_metrics_collection:
+            username_candidate += METRICS_PREFIX
+            username_candidate += AWSIoTPythonSDK.__version__
+        self._internal_async_client.set_username_password(username_candidate, self._password)
+
+    async def _connect_once(self):
+        self._connack_future = self._loop.create_future()
+        host = self._endpoint_provider.get_host()
+        port = self._endpoint_provider.get_port()
+        try:
+            # TCP connect and the TLS/WebSocket handshakes are blocking inside paho, keep them off the loop
+            rc = await asyncio.wait_for(self._loop.run_in_executor(None, self._paho_client.connect, host, port, self._keep_alive_sec),
+                                        self._connect_disconnect_timeout_sec)
+            if MQTT_ERR_SUCCESS != rc:
+                self._logger.error("Connect error: %d", rc)
+                raise connectError(rc)
+            self._start_io()
+            await asyncio.wait_for(asyncio.shield(self._connack_future), self._connect_disconnect_timeout_sec)
+        except asyncio.TimeoutError:
+            self._logger.error("Connect timed out")
+            self._connack_future.cancel()
+            raise connectTimeoutException()
+
+    async def disconnect(self):
+        self._logger.info("Performing async disconnect...")
+        self._client_status.set_status(ClientStatus.USER_DISCONNECT)
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        if self._fd is None:  # Not connected, nothing to say goodbye to
+            self._close_message_streams()
+            return True
+        self._disconnect_future = self._loop.create_future()
+        rc = self._paho_client.disconnect()
+        if MQTT_ERR_SUCCESS != rc:
+            self._logger.error("Disconnect error: %d", rc)
+            raise disconnectError(rc)
+        self._update_io()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._disconnect_future), self._connect_disconnect_timeout_sec)
+        except asyncio.TimeoutError:
+            self._logger.error("Disconnect timed out")
+            raise disconnectTimeoutException()
+        return True
+
+    async def publish(self, topic, payload, qos, retain=False):
+        self._logger.info("Performing async publish...")
+        if ClientStatus.STABLE != self._client_status.get_status():
+            raise publishQueueDisabledException()
+        rc, mid = self._paho_client.publish(topic, payload, qos, retain)
+        if MQTT_ERR_SUCCESS != rc:
+            self._logger.error("Publish error: %d", rc)
+            raise publishError(rc)
+        self._update_io()
+        if qos > 0:
+            await self._wait_for_ack(mid, publishTimeoutException)
+        return True
+
+    async def subscribe(self, topic, qos, message_callback=None):
+        self._logger.info("Performing async subscribe...")
+        if ClientStatus.STABLE != self._client_status.get_status():
+            raise subscribeQueueDisabledException()
+        self._subscription_manager.add_record(topic, qos, message_callback, None)
+        rc, mid = self._paho_client.subscribe(topic, qos)
+        if MQTT_ERR_SUCCESS != rc:
+            self._logger.error("Subscribe error: %d", rc)
+            raise subscribeError(rc)
+        self._update_io()
+        await self._wait_for_ack(mid, subscribeTimeoutException)
+        return True
+
+    async def unsubscribe(self, topic):
+        self._logger.info("Performing async unsubscribe...")
+        if ClientStatus.STABLE != self._client_status.get_status():
+            raise unsubscribeQueueDisabledException()
+        self._subscription_manager.remove_record(topic)
+        rc, mid = self._paho_client.unsubscribe(topic)
+        if MQTT_ERR_SUCCESS != rc:
+            self._logger.error("Unsubscribe error: %d", rc)
+            raise unsubscribeError(rc)
+        self._update_io()
+        await self._wait_for_ack(mid, unsubscribeTimeoutException)
+        return True
+
+    def create_message_stream(self, topic_filter=None, max_size=0):
+        message_stream = MessageStream(self, topic_filter, max_size)
+        self._message_streams.add(message_stream)
+        return message_stream
+
+    def remove_message_stream(self, message_stream):
+        self._message_streams.discard(message_stream)
+
+    async def _wait_for_ack(self, mid, timeout_exception):
+        future = self._loop.create_future()
+        self._ack_futures[mid] = future
+        try:
+            await asyncio.wait_for(future, self._operation_timeout_sec)
+        except asyncio.TimeoutError:
+            self._logger.error("Timed out waiting for the ack of request %d", mid)
+            raise timeout_exception()
+        finally:
+            self._ack_futures.pop(mid, None)
+
+    def _start_io(self):
+        self._fd = self._paho_client.socket().fileno()
+        self._loop.add_reader(self._fd, self._on_readable)
+        self._is_writing = False
+        self._update_io()
+        self._housekeeping_handle = self._loop.call_later(self.HOUSEKEEPING_INTERVAL_SEC, self._on_housekeeping)
+
+    def _stop_io(self):
+        if self._housekeeping_handle is not None:
+            self._housekeeping_handle.cancel()
+            self._housekeeping_handle = None
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            if self._is_writing:
+                self._loop.remove_writer(self._fd)
+            self._fd = None
+            self._is_writing = False
+
+    def _update_io(self):
+        # Called after every interaction with paho: stop watching a socket paho has closed, and only
+        # watch for writability while there are outgoing packets paho could not write right away
+        if self._fd is None:
+            return
+        if self._paho_client.socket() is None:
+            self._stop_io()
+            return
+        want_write = self._paho_client.want_write()
+        if want_write and not self._is_writing:
+            self._loop.add_writer(self._fd, self._on_writable)
+            self._is_writing = True
+        elif not want_write and self._is_writing:
+            self._loop.remove_writer(self._fd)
+            self._is_writing = False
+
+    def _on_readable(self):
+        rc = self._paho_client.loop_read()
+        # Decrypted or decoded bytes already pulled off the socket will not make it readable again
+        while MQTT_ERR_SUCCESS == rc and self._has_pending_bytes():
+            rc = self._paho_client.loop_read()
+        self._update_io()
+
+    def _on_writable(self):
+        self._paho_client.loop_write()
+        self._update_io()
+
+    def _on_housekeeping(self):
+        rc = self._paho_client.loop_misc()  # Keep-alive pings and QoS retries
+        self._update_io()
+        if MQTT_ERR_SUCCESS == rc and self._fd is not None:
+            self._housekeeping_handle = self._loop.call_later(self.HOUSEKEEPING_INTERVAL_SEC, self._on_housekeeping)
+
+    def _has_pending_bytes(self):
+        return self._paho_client.data_pending() > 0
+
+    def _on_connect(self, client, user_data, flags, rc):
+        if self._connack_future is None or self._connack_future.done():
+            return
+        if rc != 0:
+            self._connack_future.set_exception(connectError(rc))
+            return
+        self._connected_time = time.time()
+        self._client_status.set_status(ClientStatus.STABLE)
+        self.on_online()
+        self._connack_future.set_result(True)
+
+    def _on_disconnect(self, client, user_data, rc):
+        # Paho may report this from the connect executor thread or while it is closing the socket
+        self._loop.call_soon_threadsafe(self._handle_disconnect, rc)
+
+    def _handle_disconnect(self, rc):
+        self._stop_io()
+        if self._connack_future is not None and not self._connack_future.done():
+            self._connack_future.set_exception(connectError(rc))  # Lost the connection while connecting
+            return
+        status = self._client_status.get_status()
+        if ClientStatus.USER_DISCONNECT == status:
+            if self._disconnect_future is not None and not self._disconnect_future.done():
+                self._disconnect_future.set_result(True)
+            self.on_offline()
+            self._close_message_streams()
+            return
+        if status not in (ClientStatus.STABLE, ClientStatus.RESUBSCRIBE):
+            return
+        self._logger.warn("Connection lost, rc: %d", rc)
+        self._client_status.set_status(ClientStatus.ABNORMAL_DISCONNECT)
+        self.on_offline()
+        if self._connected_time is not None and time.time() - self._connected_time >= self._stable_connection_sec:
+            self._reconnect_quiet_sec = self._base_reconnect_quiet_sec
+        self._reconnect_task = self._loop.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        while ClientStatus.USER_DISCONNECT != self._client_status.get_status():
+            self._logger.debug("Reconnecting in %f sec", self._reconnect_quiet_sec)
+            await asyncio.sleep(self._reconnect_quiet_sec)
+            self._reconnect_quiet_sec = min(self._reconnect_quiet_sec * 2, self._max_reconnect_quiet_sec)
+            self._client_status.set_status(ClientStatus.CONNECT)
+            try:
+                await self._connect_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._logger.warn("Reconnect failed: %s", e)
+                self._stop_io()
+                continue
+            self._resubscribe()
+            self._reconnect_task = None
+            return
+
+    def _resubscribe(self):
+        self._client_status.set_status(ClientStatus.RESUBSCRIBE)
+        for topic, (qos, _, _) in self._subscription_manager.list_records():
+            self._logger.debug("Resubscribing to topic: %s", topic)
+            self._paho_client.subscribe(topic, qos)
+        self._update_io()
+        self._client_status.set_status(ClientStatus.STABLE)
+
+    def _on_ack(self, client, user_data, mid):
+        future = self._ack_futures.get(mid)
+        if future is not None and not future.done():
+            future.set_result(mid)
+
+    def _on_suback(self, client, user_data, mid, granted_qos):
+        self._on_ack(client, user_data, mid)
+
+    def _on_message(self, client, user_data, message):
+        self.on_message(message)
+        for topic, (_, message_callback, _) in self._subscription_manager.match_records(message.topic):
+            if message_callback is None:
+                continue
+            if asyncio.iscoroutinefunction(message_callback):
+                self._loop.create_task(message_callback(None, None, message))
+            else:
+                message_callback(None, None, message)  # message_callback(client, userdata, message)
+        for message_stream in list(self._message_streams):
+            message_stream.put(message)
+
+    def _close_message_streams(self):
+        for message_stream in list(self._message_streams):
+            message_stream.close()
+
+
+class MessageStream(object):
+    """Async iterator over the messages received by an AsyncMqttCore.
+
+    If max_size messages are waiting to be consumed, the oldest one is dropped to make room.
+    """
+
+    _END = object()
+
+    def __init__(self, async_mqtt_core, topic_filter=None, max_size=0):
+        self._async_mqtt_core = async_mqtt_core
+        self._topic_trie = None
+        if topic_filter is not None:
+            self._topic_trie = TopicTrie()
+            self._topic_trie.add(topic_filter)
+        self._queue = asyncio.Queue(max_size)
+        self._is_closed = False
+        self.dropped = 0
+
+    def put(self, message):
+        if self._is_closed or (self._topic_trie is not None and not self._topic_trie.match(message.topic)):
+            return
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(message)
+
+    def close(self):
+        if self._is_closed:
+            return
+        self._is_closed = True
+        self._async_mqtt_core.remove_message_stream(self)
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(self._END)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self._queue.get()
+        if message is self._END:
+            self._queue.put_nowait(self._END)  # Let other consumers of this stream stop as well
+            raise StopAsyncIteration
+        return message
@@ -49,6 +49,85 @@ except ImportError:
     from ConfigParser import ConfigParser
     from ConfigParser import NoOptionError
     from ConfigParser import NoSectionError
+# Optional, only used to mask large websocket payloads. Imported on the first such payload, see _getNumpy,
+# importing it takes longer than the rest of the SDK and most clients never mask a websocket frame.
+_numpy = None
+_numpyImportAttempted = False
+
+# Largest single SSL read of the wss transport, big enough for many MQTT frames at once
+WSS_READ_CHUNK_BYTES = 65536
+# Presigned websocket URLs are valid for this long, see X-Amz-Expires
+WSS_PRESIGNED_URL_EXPIRES_SEC = 86400
+# A cached presigned URL is signed again once less than this is left of its validity
+WSS_PRESIGNED_URL_REFRESH_MARGIN_SEC = 300
+# Entries kept by each of the SigV4 caches, a cache is emptied when it is full
+SIGV4_CACHE_MAX_ENTRIES = 64
+# Below this size the integer XOR beats the NumPy call overhead
+WSS_NUMPY_MASK_MIN_BYTES = 512
+# Big integer XOR slows down on very long integers, larger payloads are masked in chunks of this size
+WSS_MASK_CHUNK_BYTES = 16384
+
+
+def _getNumpy():
+    # The numpy module, None when it is not installed
+    global _numpy, _numpyImportAttempted
+    if not _numpyImportAttempted:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = None
+        _numpyImportAttempted = True
+    return _numpy
+
+
+def _maskPayloadBytewise(payload, maskKey):
+    payloadBytes = bytearray(payload)
+    for i in range(0, len(payloadBytes)):
+        payloadBytes[i] ^= maskKey[i % 4]
+    return payloadBytes
+
+
+def _maskPayloadInt(payload, maskKey):
+    # XOR the payload against the repeated mask key as big integers, C speed and byte exact
+    payloadView = memoryview(payload)
+    payloadLength = len(payloadView)
+    ret = bytearray()
+    chunkMask = None
+    for start in range(0, payloadLength, WSS_MASK_CHUNK_BYTES):
+        chunk = payloadView[start:start + WSS_MASK_CHUNK_BYTES]
+        chunkLength = len(chunk)
+        if chunkLength == WSS_MASK_CHUNK_BYTES:
+            if chunkMask is None:
+                chunkMask = int.from_bytes(bytes(maskKey) * (WSS_MASK_CHUNK_BYTES // 4), "big")
+            mask = chunkMask
+        else:
+            mask = int.from_bytes(bytes(maskKey) * (chunkLength // 4) + bytes(maskKey[:chunkLength % 4]), "big")
+        ret += (int.from_bytes(chunk, "big") ^ mask).to_bytes(chunkLength, "big")
+    return ret
+
+
+def _maskPayloadNumpy(payload, maskKey):
+    # XOR 8 bytes at a time in place, the mask key repeats every 4 bytes so each word takes it twice
+    numpy = _getNumpy()
+    payloadBytes = bytearray(payload)
+    wordCount = len(payloadBytes) // 8
+    if wordCount:
+        words = numpy.frombuffer(payloadBytes, dtype=numpy.uint64, count=wordCount)
+        words ^= numpy.frombuffer(bytes(maskKey) * 2, dtype=numpy.uint64)[0]
+        del words  # Release the buffer export so the bytearray can be resized again
+    for i in range(wordCount * 8, len(payloadBytes)):
+        payloadBytes[i] ^= maskKey[i % 4]
+    return payloadBytes
+
+
+def _maskPayload(payload, maskKey):
+    # Websocket masking (RFC 6455 5.3), also its own inverse for unmasking
+    if sys.version_info[0] < 3:
+        return _maskPayloadBytewise(payload, maskKey)
+    if len(payload) >= WSS_NUMPY_MASK_MIN_BYTES and _getNumpy() is not None:
+        return _maskPayloadNumpy(payload, maskKey)
+    return _maskPayloadInt(payload, maskKey)
 
 
 class ProgressiveBackOffCore:
@@ -86,12 +165,17 @@ class ProgressiveBackOffCore:
     # Cancel the in-waiting timer for resetting backOff time
     # This should get called only when a disconnect/reconnect happens
     def backOff(self):
+        # Block the reconnect logic
+        time.sleep(self.nextBackOffTimeSecond())
+
+    # Same as backOff, without blocking: return the time to wait before reconnecting
+    # and update the currentBackoffTimeSecond for the next reconnect
+    def nextBackOffTimeSecond(self):
         self._logger.debug("backOff: current backoff time is: " + str(self._currentBackoffTimeSecond) + " sec.")
         if self._resetBackoffTimer is not None:
             # Cancel the timer
             self._resetBackoffTimer.cancel()
-        # Block the reconnect logic
-        time.sleep(self._currentBackoffTimeSecond)
+        backOffTimeSecond = self._currentBackoffTimeSecond
         # Update the backoff time
         if self._currentBackoffTimeSecond == 0:
             # This is the first attempt to connect, set it to base
@@ -99,6 +183,7 @@ class ProgressiveBackOffCore:
         else:
             # r_cur = min(2^n*r_base, r_max)
             self._currentBackoffTimeSecond = min(self._maximumReconnectTimeSecond, self._currentBackoffTimeSecond * 2)
+        return backOffTimeSecond
 
     # Start the timer for resetting _currentBackoffTimeSecond
     # Will be cancelled upon calling backOff
@@ -107,6 +192,12 @@ class ProgressiveBackOffCore:
                                                   self._connectionStableThenResetBackoffTime)
         self._resetBackoffTimer.start()
 
+    # Reset the backoff time if a connection that has been lost was up for longer than
+    # _minimumConnectTimeSecond, for callers that do not run the stable connection timer
+    def resetIfStable(self, connectedTimeSecond):
+        if connectedTimeSecond >= self._minimumConnectTimeSecond:
+            self._connectionStableThenResetBackoffTime()
+
     def stopStableConnectionTimer(self):
         if self._resetBackoffTimer is not None:
             # Cancel the timer
@@ -121,6 +212,38 @@ class ProgressiveBackOffCore:
         self._currentBackoffTimeSecond = self._baseReconnectTimeSecond
 
 
+class _BoundedCache(object):
+    # A small thread safe dict that is emptied when full, the SigV4 caches only ever hold a handful of live entries
+
+    def __init__(self, maxEntries=SIGV4_CACHE_MAX_ENTRIES):
+        self._maxEntries = maxEntries
+        self._entries = dict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, key, value):
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self._maxEntries:
+                self._entries.clear()
+            self._entries[key] = value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Shared by all SigV4Core instances, a new one is created for every websocket (re)connect
+# (secret key, date, region, service) -> signing key
+_signingKeyCache = _BoundedCache()
+# Credential file path -> ((mtime, size), credentials)
+_credentialFileCache = _BoundedCache()
+# (host, port, region, method, service, path, credentials) -> (url, expiry time)
+_presignedURLCache = _BoundedCache()
+
+
 class SigV4Core:
 
     _logger = logging.getLogger(__name__)
@@ -152,10 +275,16 @@ class SigV4Core:
 
     def _getSignatureKey(self, key, dateStamp, regionName, serviceName):
         # Returned as a utf-8 byte string in Py3.x
+        # The key only changes with the date, derive it once per day for each secret, region and service
+        cacheKey = (key, dateStamp, regionName, serviceName)
+        kSigning = _signingKeyCache.get(cacheKey)
+        if kSigning is not None:
+            return kSigning
         kDate = self._sign(('AWS4' + key).encode('utf-8'), dateStamp)
         kRegion = self._sign(kDate, regionName)
         kService = self._sign(kRegion, serviceName)
         kSigning = self._sign(kService, 'aws4_request')
+        _signingKeyCache.put(cacheKey, kSigning)
         return kSigning
 
     def _checkIAMCredentials(self):
@@ -202,7 +331,26 @@ class SigV4Core:
         return ret
 
     def _checkKeyInFiles(self):
-        credentialFile = None
+        credentialFilePath = os.path.expanduser(self._credentialConfigFilePath)  # Is it compatible with windows? \/
+        # Only parse the file again when it has changed since the last read
+        fileSignature = self._getFileSignature(credentialFilePath)
+        cached = _credentialFileCache.get(credentialFilePath)
+        if cached is not None and cached[0] == fileSignature:
+            self._logger.debug("IAM credentials from file, unchanged since the last read.")
+            return dict(cached[1])
+        ret = self._readKeyInFile(credentialFilePath)
+        _credentialFileCache.put(credentialFilePath, (fileSignature, dict(ret)))
+        return ret
+
+    def _getFileSignature(self, filePath):
+        # None for a missing file, so that creating it is noticed as a change
+        try:
+            fileStat = os.stat(filePath)
+        except OSError:
+            return None
+        return fileStat.st_mtime, fileStat.st_size
+
+    def _readKeyInFile(self, credentialFilePath):
         credentialConfig = None
         ret = dict()
         # Should be compatible with aws cli default credential configuration
@@ -210,7 +358,6 @@ class SigV4Core:
         try:
             # See if we get the file
             credentialConfig = ConfigParser()
-            credentialFilePath = os.path.expanduser(self._credentialConfigFilePath)  # Is it compatible with windows? \/
             credentialConfig.read(credentialFilePath)
             # Now we have the file, start looking for credentials...
             # 'default' section
@@ -239,9 +386,6 @@ class SigV4Core:
     def createWebsocketEndpoint(self, host, port, region, method, awsServiceName, path):
         # Return the endpoint as unicode string in 3.x
         # Gather all the facts
-        amazonDate = self._createAmazonDate()
-        amazonDateSimple = amazonDate[0]  # Unicode in 3.x
-        amazonDateComplex = amazonDate[1]  # Unicode in 3.x
         allKeys = self._checkIAMCredentials()  # Unicode in 3.x
         if not self._hasCredentialsNecessaryForWebsocket(allKeys):
             raise wssNoKeyInEnvironmentError()
@@ -249,11 +393,21 @@ class SigV4Core:
             # Because of self._hasCredentialsNecessaryForWebsocket(...), keyID and secretKey should not be None from here
             keyID = allKeys["aws_access_key_id"]
             secretKey = allKeys["aws_secret_access_key"]
+            # A presigned URL can be used for any number of connects until it expires, reconnects reuse it
+            cacheKey = (host, port, region, method, awsServiceName, path, keyID, secretKey, allKeys.get("aws_session_token"))
+            cached = _presignedURLCache.get(cacheKey)
+            if cached is not None and time.time() < cached[1] - WSS_PRESIGNED_URL_REFRESH_MARGIN_SEC:
+                self._logger.debug("createWebsocketEndpoint: Reusing the presigned websocket URL.")
+                return cached[0]
+            signedTime = time.time()
+            amazonDate = self._createAmazonDate()
+            amazonDateSimple = amazonDate[0]  # Unicode in 3.x
+            amazonDateComplex = amazonDate[1]  # Unicode in 3.x
             # amazonDateSimple and amazonDateComplex are guaranteed not to be None
             queryParameters = "X-Amz-Algorithm=AWS4-HMAC-SHA256" + \
                 "&X-Amz-Credential=" + keyID + "%2F" + amazonDateSimple + "%2F" + region + "%2F" + awsServiceName + "%2Faws4_request" + \
                 "&X-Amz-Date=" + amazonDateComplex + \
-                "&X-Amz-Expires=86400" + \
+                "&X-Amz-Expires=" + str(WSS_PRESIGNED_URL_EXPIRES_SEC) + \
                 "&X-Amz-SignedHeaders=host"  # Unicode in 3.x
             hashedPayload = hashlib.sha256(str("").encode('utf-8')).hexdigest()  # Unicode in 3.x
             # Create the string to sign
@@ -273,6 +427,7 @@ class SigV4Core:
                 aws_session_token = allKeys["aws_session_token"]
                 url += "&X-Amz-Security-Token=" + quote(aws_session_token.encode("utf-8"))  # Unicode in 3.x
             self._logger.debug("createWebsocketEndpoint: Websocket URL: " + url)
+            _presignedURLCache.put(cacheKey, (url, signedTime + WSS_PRESIGNED_URL_EXPIRES_SEC))
             return url
 
     def _hasCredentialsNecessaryForWebsocket(self, allKeys):
@@ -286,54 +441,6 @@ class SigV4Core:
         return validEntries
 
 
-# This is an internal class that buffers the incoming bytes into an
-# internal buffer until it gets the full desired length of bytes.
-# At that time, this bufferedReader will be reset.
-# *Error handling:
-# For retry errors (ssl.SSL_ERROR_WANT_READ, ssl.SSL_ERROR_WANT_WRITE, EAGAIN),
-# leave them to the paho _packet_read for further handling (ignored and try
-# again when data is available.
-# For other errors, leave them to the paho _packet_read for error reporting.
-
-
-class _BufferedReader:
-    _sslSocket = None
-    _internalBuffer = None
-    _remainedLength = -1
-    _bufferingInProgress = False
-
-    def __init__(self, sslSocket):
-        self._sslSocket = sslSocket
-        self._internalBuffer = bytearray()
-        self._bufferingInProgress = False
-
-    def _reset(self):
-        self._internalBuffer = bytearray()
-        self._remainedLength = -1
-        self._bufferingInProgress = False
-
-    def read(self, numberOfBytesToBeBuffered):
-        if not self._bufferingInProgress:  # If last read is completed...
-            self._remainedLength = numberOfBytesToBeBuffered
-            self._bufferingInProgress = True  # Now we start buffering a new length of bytes
-
-        while self._remainedLength > 0:  # Read in a loop, always try to read in the remained length
-            # If the data is temporarily not available, socket.error will be raised and catched by paho
-            dataChunk = self._sslSocket.read(self._remainedLength)
-            # There is a chance where the server terminates the connection without closing the socket.
-            # If that happens, let's raise an exception and enter the reconnect flow.
-            if not dataChunk:
-                raise socket.error(errno.ECONNABORTED, 0)
-            self._internalBuffer.extend(dataChunk)  # Buffer the data
-            self._remainedLength -= len(dataChunk)  # Update the remained length
-
-        # The requested length of bytes is buffered, recover the context and return it
-        # Otherwise error should be raised
-        ret = self._internalBuffer
-        self._reset()
-        return ret  # This should always be bytearray
-
-
 # This is the internal class that sends requested data out chunk by chunk according
 # to the availablity of the socket write operation. If the requested bytes of data
 # (after encoding) needs to be sent out in separate socket write operations (most
@@ -409,21 +516,12 @@ class SecuredWebSocketCore:
         # Endpoint Info
         self._hostAddress = hostAddress
         self._portNumber = portNumber
-        # Section Flags
-        self._hasOpByte = False
-        self._hasPayloadLengthFirst = False
-        self._hasPayloadLengthExtended = False
-        self._hasMaskKey = False
-        self._hasPayload = False
-        # Properties for current websocket frame
-        self._isFIN = False
-        self._RSVBits = None
-        self._opCode = None
-        self._needMaskKey = False
-        self._payloadLengthBytesLength = 1
-        self._payloadLength = 0
-        self._maskKey = None
+        # Raw wss bytes read from the socket, frames are decoded from _frameBufferStart on
+        self._frameBuffer = bytearray()
+        self._frameBufferStart = 0
+        # Decoded MQTT bytes, handed to paho from _payloadDataStart on
         self._payloadDataBuffer = bytearray()  # Once the whole wss connection is lost, there is no need to keep the buffered payload
+        self._payloadDataStart = 0
         try:
             self._handShake(hostAddress, portNumber)
         except wssNoKeyInEnvironmentError:  # Handle SigV4 signing and websocket handshaking errors
@@ -433,7 +531,6 @@ class SecuredWebSocketCore:
         except ClientError as e:
             raise ValueError(e.message)
         # Now we have a socket with secured websocket...
-        self._bufferedReader = _BufferedReader(self._sslSocket)
         self._bufferedWriter = _BufferedWriter(self._sslSocket)
 
     def _createSigV4Core(self):
@@ -444,23 +541,6 @@ class SecuredWebSocketCore:
         # os.urandom returns ascii str in 2.x, converted to bytearray
         # os.urandom returns bytes in 3.x, converted to bytearray
 
-    def _reset(self):  # Reset the context for wss frame reception
-        # Control info
-        self._hasOpByte = False
-        self._hasPayloadLengthFirst = False
-        self._hasPayloadLengthExtended = False
-        self._hasMaskKey = False
-        self._hasPayload = False
-        # Frame Info
-        self._isFIN = False
-        self._RSVBits = None
-        self._opCode = None
-        self._needMaskKey = False
-        self._payloadLengthBytesLength = 1
-        self._payloadLength = 0
-        self._maskKey = None
-        # Never reset the payloadData since we might have fragmented MQTT data from the pervious frame
-
     def _generateWSSKey(self):
         return base64.b64encode(os.urandom(128))  # Bytes
 
@@ -554,11 +634,10 @@ class SecuredWebSocketCore:
             maskKey = self._generateMaskKey()
             ret.extend(maskKey)
         # Mask the payload
-        payloadBytes = bytearray(rawPayload)
         if maskBit == 1:
-            for i in range(0, payloadLength):
-                payloadBytes[i] ^= maskKey[i % 4]
-        ret.extend(payloadBytes)
+            ret.extend(_maskPayload(rawPayload, maskKey))
+        else:
+            ret.extend(rawPayload)
         # Return the assembled wss frame
         return ret
 
@@ -574,106 +653,116 @@ class SecuredWebSocketCore:
         # Frames sent from client to server must be masked
         self._sslSocket.write(self._encodeFrame(b"", self._OP_PONG, masked=1))
 
-    # Override sslSocket read. Always read from the wss internal payload buffer, which
-    # contains the masked MQTT packet. This read will decode ONE wss frame every time
-    # and load in the payload for MQTT _packet_read. At any time, MQTT _packet_read
-    # should be able to read a complete MQTT packet from the payload (buffered per wss
-    # frame payload). If the MQTT packet is break into separate wss frames, different
-    # chunks will be buffered in separate frames and MQTT _packet_read will not be able
-    # to collect a complete MQTT packet to operate on until the necessary payload is
-    # fully buffered.
-    # If the requested number of bytes are not available, SSL_ERROR_WANT_READ will be
-    # raised to trigger another call of _packet_read when the data is available again.
+    # Override sslSocket read. MQTT bytes are handed out from the decoded payload buffer
+    # through a read cursor. Once it runs dry, one large read from the SSL socket can
+    # bring in many wss frames (or part of one), every complete frame in it is decoded
+    # and its payload appended to the payload buffer. Bytes of an incomplete frame stay
+    # in the frame buffer until a later read completes it.
+    # If no MQTT bytes are available, SSL_ERROR_WANT_READ will be raised to trigger
+    # another call of _packet_read when the data is available again.
+    def recv_into(self, buffer, numberOfBytes=0):
+        if numberOfBytes <= 0:
+            numberOfBytes = len(buffer)
+        if self._payloadDataStart == len(self._payloadDataBuffer):
+            self._receiveFrames()
+        count = min(numberOfBytes, len(self._payloadDataBuffer) - self._payloadDataStart)
+        buffer[0:count] = memoryview(self._payloadDataBuffer)[self._payloadDataStart:self._payloadDataStart + count]
+        self._payloadDataStart += count
+        if self._payloadDataStart == len(self._payloadDataBuffer):
+            del self._payloadDataBuffer[:]
+            self._payloadDataStart = 0
+        return count
+
+    # Returns exactly numberOfBytes MQTT bytes, or raises SSL_ERROR_WANT_READ until that many are available
     def read(self, numberOfBytes):
-        # Check if we have enough data for paho
-        # _payloadDataBuffer will not be empty ony when the payload of a new wss frame
-        # has been unmasked.
-        if len(self._payloadDataBuffer) >= numberOfBytes:
-            ret = self._payloadDataBuffer[0:numberOfBytes]
-            self._payloadDataBuffer = self._payloadDataBuffer[numberOfBytes:]
-            # struct.unpack(fmt, string) # Py2.x
-            # struct.unpack(fmt, buffer) # Py3.x
-            # Here ret is always in bytes (buffer interface)
-            if sys.version_info[0] < 3:  # Py2.x
-                ret = str(ret)
-            return ret
-        # Emmm, We don't. Try to buffer from the socket (It's a new wss frame).
-        if not self._hasOpByte:  # Check if we need to buffer OpByte
-            opByte = self._bufferedReader.read(1)
-            self._isFIN = (opByte[0] & 0x80) == 0x80
-            self._RSVBits = (opByte[0] & 0x70)
-            self._opCode = (opByte[0] & 0x0f)
-            self._hasOpByte = True  # Finished buffering opByte
+        while len(self._payloadDataBuffer) - self._payloadDataStart < numberOfBytes:
+            self._receiveFrames()
+        ret = bytearray(numberOfBytes)
+        self.recv_into(ret, numberOfBytes)
+        if sys.version_info[0] < 3:  # Py2.x
+            ret = str(ret)
+        return ret
+
+    # Number of decoded MQTT bytes and TLS bytes that can be read without the socket becoming readable
+    def pending(self):
+        if self._sslSocket is None:
+            return 0
+        return len(self._payloadDataBuffer) - self._payloadDataStart + self._sslSocket.pending()
+
+    def _receiveFrames(self):
+        # If the data is temporarily not available, socket.error will be raised and catched by paho
+        dataChunk = self._sslSocket.read(WSS_READ_CHUNK_BYTES)
+        # There is a chance where the server terminates the connection without closing the socket.
+        # If that happens, let's raise an exception and enter the reconnect flow.
+        if not dataChunk:
+            raise socket.error(errno.ECONNABORTED, 0)
+        self._frameBuffer.extend(dataChunk)
+        payloadLengthBefore = len(self._payloadDataBuffer)
+        self._decodeFrames()
+        if len(self._payloadDataBuffer) == payloadLengthBefore:  # Fragmented wss frame or control frames only
+            raise socket.error(ssl.SSL_ERROR_WANT_READ, "Not a complete MQTT packet payload within this wss frame.")
+
+    def _decodeFrames(self):
+        frameBuffer = self._frameBuffer
+        pos = self._frameBufferStart
+        end = len(frameBuffer)
+        while end - pos >= 2:
+            opByte = frameBuffer[pos]
+            payloadLengthFirst = frameBuffer[pos + 1]
+            payloadLength = payloadLengthFirst & 0x7f
+            headerLength = 2
+            if payloadLength == 126:
+                if end - pos < 4:
+                    break
+                payloadLength = struct.unpack_from("!H", frameBuffer, pos + 2)[0]
+                headerLength = 4
+            elif payloadLength == 127:
+                if end - pos < 10:
+                    break
+                payloadLength = struct.unpack_from("!Q", frameBuffer, pos + 2)[0]
+                headerLength = 10
             # Check if any of the RSV bits are set, if so, close the connection
             # since client never sends negotiated extensions
-            if self._RSVBits != 0x0:
-                self._closeWssConnection()
-                self._connectStatus = self._WebsocketDisconnected
-                self._payloadDataBuffer = bytearray()
-                raise socket.error(ssl.SSL_ERROR_WANT_READ, "RSV bits set with NO negotiated extensions.")
-        if not self._hasPayloadLengthFirst:  # Check if we need to buffer First Payload Length byte
-            payloadLengthFirst = self._bufferedReader.read(1)
-            self._hasPayloadLengthFirst = True  # Finished buffering first byte of payload length
-            self._needMaskKey = (payloadLengthFirst[0] & 0x80) == 0x80
-            payloadLengthFirstByteArray = bytearray()
-            payloadLengthFirstByteArray.extend(payloadLengthFirst)
-            self._payloadLength = (payloadLengthFirstByteArray[0] & 0x7f)
-
-            if self._payloadLength == 126:
-                self._payloadLengthBytesLength = 2
-                self._hasPayloadLengthExtended = False  # Force to buffer the extended
-            elif self._payloadLength == 127:
-                self._payloadLengthBytesLength = 8
-                self._hasPayloadLengthExtended = False  # Force to buffer the extended
-            else:  # _payloadLength <= 125:
-                self._hasPayloadLengthExtended = True  # No need to buffer extended payload length
-        if not self._hasPayloadLengthExtended:  # Check if we need to buffer Extended Payload Length bytes
-            payloadLengthExtended = self._bufferedReader.read(self._payloadLengthBytesLength)
-            self._hasPayloadLengthExtended = True
-            if sys.version_info[0] < 3:
-                payloadLengthExtended = str(payloadLengthExtended)
-            if self._payloadLengthBytesLength == 2:
-                self._payloadLength = struct.unpack("!H", payloadLengthExtended)[0]
-            else:  # _payloadLengthBytesLength == 8
-                self._payloadLength = struct.unpack("!Q", payloadLengthExtended)[0]
-
-        if self._needMaskKey:  # Response from server is masked, close the connection
-            self._closeWssConnection()
-            self._connectStatus = self._WebsocketDisconnected
-            self._payloadDataBuffer = bytearray()
-            raise socket.error(ssl.SSL_ERROR_WANT_READ, "Server response masked, closing connection and try again.")
-
-        if not self._hasPayload:  # Check if we need to buffer the payload
-            payloadForThisFrame = self._bufferedReader.read(self._payloadLength)
-            self._hasPayload = True
+            if opByte & 0x70:
+                self._closeOnProtocolError("RSV bits set with NO negotiated extensions.")
             # Client side should never received a masked packet from the server side
-            # Unmask it as needed
-            #if self._needMaskKey:
-            #    for i in range(0, self._payloadLength):
-            #        payloadForThisFrame[i] ^= self._maskKey[i % 4]
-            # Append it to the internal payload buffer
-            self._payloadDataBuffer.extend(payloadForThisFrame)
-        # Now we have the complete wss frame, reset the context
-        # Check to see if it is a wss closing frame
-        if self._opCode == self._OP_CONNECTION_CLOSE:
-            self._connectStatus = self._WebsocketDisconnected
-            self._payloadDataBuffer = bytearray()  # Ensure that once the wss closing frame comes, we have nothing to read and start all over again
-        # Check to see if it is a wss PING frame
-        if self._opCode == self._OP_PING:
-            self._sendPONG()  # Nothing more to do here, if the transmission of the last wssMQTT packet is not finished, it will continue
-        self._reset()
-        # Check again if we have enough data for paho
-        if len(self._payloadDataBuffer) >= numberOfBytes:
-            ret = self._payloadDataBuffer[0:numberOfBytes]
-            self._payloadDataBuffer = self._payloadDataBuffer[numberOfBytes:]
-            # struct.unpack(fmt, string) # Py2.x
-            # struct.unpack(fmt, buffer) # Py3.x
-            # Here ret is always in bytes (buffer interface)
-            if sys.version_info[0] < 3:  # Py2.x
-                ret = str(ret)
-            return ret
-        else:  # Fragmented MQTT packets in separate wss frames
-            raise socket.error(ssl.SSL_ERROR_WANT_READ, "Not a complete MQTT packet payload within this wss frame.")
+            if payloadLengthFirst & 0x80:
+                self._closeOnProtocolError("Server response masked, closing connection and try again.")
+            if end - pos < headerLength + payloadLength:
+                break  # Wait for the rest of this frame
+            payloadStart = pos + headerLength
+            pos = payloadStart + payloadLength
+            opCode = opByte & 0x0f
+            # Check to see if it is a wss closing frame
+            if opCode == self._OP_CONNECTION_CLOSE:
+                self._connectStatus = self._WebsocketDisconnected
+                self._clearBuffers()  # Ensure that once the wss closing frame comes, we have nothing to read and start all over again
+                return
+            # Check to see if it is a wss PING frame
+            if opCode == self._OP_PING:
+                self._sendPONG()  # Nothing more to do here, if the transmission of the last wssMQTT packet is not finished, it will continue
+            elif opCode != self._OP_PONG:
+                self._payloadDataBuffer += memoryview(frameBuffer)[payloadStart:pos]
+        # Drop the decoded frames, keep an incomplete one for the next read
+        if pos == end:
+            del frameBuffer[:]
+            pos = 0
+        elif pos >= WSS_READ_CHUNK_BYTES:
+            del frameBuffer[:pos]
+            pos = 0
+        self._frameBufferStart = pos
+
+    def _closeOnProtocolError(self, message):
+        self._closeWssConnection()
+        self._connectStatus = self._WebsocketDisconnected
+        self._clearBuffers()
+        raise socket.error(ssl.SSL_ERROR_WANT_READ, message)
+
+    def _clearBuffers(self):
+        self._frameBuffer = bytearray()
+        self._frameBufferStart = 0
+        self._payloadDataBuffer = bytearray()
+        self._payloadDataStart = 0
 
     def write(self, bytesToBeSent):
         # When there is a disconnection, select will report a TypeError which triggers the reconnect.
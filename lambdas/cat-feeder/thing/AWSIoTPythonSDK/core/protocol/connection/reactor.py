@@ -0,0 +1,293 @@
+# /*
+# * Copyright 2010-2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# *
+# * Licensed under the Apache License, Version 2.0 (the "License").
+# * You may not use this file except in compliance with the License.
+# * A copy of the License is located at
+# *
+# *  http://aws.amazon.com/apache2.0
+# *
+# * or in the "license" file accompanying this file. This file is distributed
+# * on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# * express or implied. See the License for the specific language governing
+# * permissions and limitations under the License.
+# */
+
+import heapq
+import itertools
+import logging
+import selectors
+import socket
+import time
+from collections import Counter
+from collections import deque
+from threading import Thread
+from threading import Event
+from threading import Lock
+from threading import current_thread
+from AWSIoTPythonSDK.core.protocol.internal.workers import CallbackExecutor
+from AWSIoTPythonSDK.core.protocol.paho.client import MQTT_ERR_SUCCESS
+
+
+class NetworkReactor(object):
+    """Serves the network I/O of many MQTT clients from a few threads.
+
+    Each thread watches the sockets of its clients with a selector instead of every client running
+    its own loop_forever() thread. Keep-alive pings and QoS retries run on a shared one second
+    housekeeping tick. Lost connections are re-established with the client's progressive backoff,
+    the blocking reconnects run on a small connector pool so they never stall the other clients.
+    """
+
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, num_threads=1, max_concurrent_reconnects=4):
+        if num_threads < 1:
+            raise ValueError("Network reactor needs at least one thread.")
+        self._lock = Lock()
+        self._loops = [_ReactorLoop(i) for i in range(num_threads)]
+        self._loop_of_client = dict()
+        self._connector = CallbackExecutor(max_concurrent_reconnects, 0)
+
+    def register(self, paho_client):
+        with self._lock:
+            sizes = Counter(self._loop_of_client.values())
+            loop = min(self._loops, key=lambda candidate: sizes[candidate])
+            self._loop_of_client[paho_client] = loop
+        loop.add(paho_client, self._connector)
+        self._logger.debug("Client registered with reactor thread %d", loop.get_index())
+
+    def unregister(self, paho_client):
+        with self._lock:
+            loop = self._loop_of_client.pop(paho_client, None)
+        if loop is not None:
+            loop.remove(paho_client)
+            self._logger.debug("Client unregistered from reactor thread %d", loop.get_index())
+
+    def get_metrics(self):
+        with self._lock:
+            clients = len(self._loop_of_client)
+        return {
+            "threads": len(self._loops),
+            "clients": clients,
+            "reconnects": sum(loop.get_reconnects() for loop in self._loops)
+        }
+
+
+class _ReactorSession(object):
+
+    def __init__(self, paho_client, connector):
+        self.paho_client = paho_client
+        self.connector = connector
+        self.fd = None
+        self.events = 0
+        self.connected_time = time.time()
+        self.removed = False
+
+
+class _ReactorLoop(object):
+
+    HOUSEKEEPING_INTERVAL_SEC = 1
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, index):
+        self._index = index
+        self._selector = selectors.DefaultSelector()
+        self._sessions = dict()
+        self._reconnects = 0
+        self._commands = deque()
+        self._timers = []  # Heap of (due time, sequence, function, args)
+        self._timer_seq = itertools.count()
+        self._waker_r, self._waker_w = socket.socketpair()
+        self._waker_r.setblocking(False)
+        self._waker_w.setblocking(False)
+        self._selector.register(self._waker_r, selectors.EVENT_READ, (self._on_waker_readable, None))
+        self._thread = Thread(target=self._run)
+        self._thread.daemon = True
+        self._started = False
+        self._start_lock = Lock()
+
+    def get_index(self):
+        return self._index
+
+    def get_reconnects(self):
+        return self._reconnects
+
+    def add(self, paho_client, connector):
+        with self._start_lock:
+            if not self._started:
+                self._thread.start()
+                self._started = True
+        # Requests made from now on only queue their packets and wake this loop up
+        paho_client.loop_thread_set(self._thread)
+        paho_client.stable_connection_timer_set(False)
+        self._call_soon(self._add_session, paho_client, connector)
+
+    def remove(self, paho_client):
+        if current_thread() is self._thread:
+            self._remove_session(paho_client, None)
+        else:
+            done = Event()
+            self._call_soon(self._remove_session, paho_client, done)
+            done.wait()
+
+    def _call_soon(self, function, *args):
+        self._commands.append((function, args))
+        try:
+            self._waker_w.send(b"\0")
+        except socket.error:
+            pass  # Waker already full, the loop is going to wake up anyway
+
+    def _call_later(self, delay_sec, function, *args):
+        heapq.heappush(self._timers, (time.time() + delay_sec, next(self._timer_seq), function, args))
+
+    def _run(self):
+        self._call_later(self.HOUSEKEEPING_INTERVAL_SEC, self._housekeeping)
+        while True:
+            timeout = max(0, self._timers[0][0] - time.time()) if self._timers else None
+            for key, mask in self._selector.select(timeout):
+                callback, session = key.data
+                try:
+                    callback(session, mask)
+                except Exception:
+                    self._logger.exception("Unhandled exception in reactor thread %d", self._index)
+            self._run_commands()
+            self._run_timers()
+
+    def _run_commands(self):
+        while self._commands:
+            function, args = self._commands.popleft()
+            try:
+                function(*args)
+            except Exception:
+                self._logger.exception("Unhandled exception in reactor thread %d", self._index)
+
+    def _run_timers(self):
+        now = time.time()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, function, args = heapq.heappop(self._timers)
+            try:
+                function(*args)
+            except Exception:
+                self._logger.exception("Unhandled exception in reactor thread %d", self._index)
+
+    def _on_waker_readable(self, session, mask):
+        try:
+            while self._waker_r.recv(4096):
+                pass
+        except socket.error:
+            pass
+
+    def _add_session(self, paho_client, connector):
+        session = _ReactorSession(paho_client, connector)
+        self._sessions[paho_client] = session
+        self._selector.register(paho_client.wakeup_socket(), selectors.EVENT_READ, (self._on_wakeup, session))
+        self._watch_socket(session)
+
+    def _remove_session(self, paho_client, done):
+        try:
+            session = self._sessions.pop(paho_client, None)
+            if session is not None:
+                session.removed = True
+                self._unwatch_socket(session)
+                self._selector.unregister(paho_client.wakeup_socket())
+        finally:
+            paho_client.loop_thread_set(None)
+            paho_client.stable_connection_timer_set(True)
+            if done is not None:
+                done.set()
+
+    def _watch_socket(self, session):
+        if not self._is_connected(session.paho_client):
+            self._on_connection_lost(session)
+            return
+        session.fd = session.paho_client.socket().fileno()
+        session.events = selectors.EVENT_READ
+        self._selector.register(session.fd, session.events, (self._on_socket_event, session))
+        self._update(session)
+
+    def _unwatch_socket(self, session):
+        if session.fd is not None:
+            self._selector.unregister(session.fd)
+            session.fd = None
+
+    def _update(self, session):
+        # Called after every interaction with paho: stop watching a socket paho has closed, and only
+        # watch for writability while there are outgoing packets paho could not write right away
+        if session.fd is None:
+            return
+        if not self._is_connected(session.paho_client):
+            self._unwatch_socket(session)
+            self._on_connection_lost(session)
+            return
+        events = selectors.EVENT_READ
+        if session.paho_client.want_write():
+            events |= selectors.EVENT_WRITE
+        if events != session.events:
+            session.events = events
+            self._selector.modify(session.fd, events, (self._on_socket_event, session))
+
+    def _on_socket_event(self, session, mask):
+        paho_client = session.paho_client
+        if mask & selectors.EVENT_READ:
+            rc = paho_client.loop_read()
+            # Decrypted or decoded bytes already pulled off the socket will not make it readable again
+            while MQTT_ERR_SUCCESS == rc and self._has_pending_bytes(paho_client):
+                rc = paho_client.loop_read()
+        if mask & selectors.EVENT_WRITE and self._is_connected(paho_client):
+            paho_client.loop_write()
+        self._update(session)
+
+    def _on_wakeup(self, session, mask):
+        try:
+            while session.paho_client.wakeup_socket().recv(4096):
+                pass
+        except socket.error:
+            pass
+        if session.fd is not None:
+            session.paho_client.loop_write()
+            self._update(session)
+
+    def _is_connected(self, paho_client):
+        # paho closes the TLS socket of a lost connection but may keep a reference to it
+        sock = paho_client.socket()
+        return sock is not None and sock.fileno() != -1
+
+    def _has_pending_bytes(self, paho_client):
+        return paho_client.data_pending() > 0
+
+    def _housekeeping(self):
+        for session in list(self._sessions.values()):
+            if session.fd is not None:
+                session.paho_client.loop_misc()  # Keep-alive pings and QoS retries
+                self._update(session)
+        self._call_later(self.HOUSEKEEPING_INTERVAL_SEC, self._housekeeping)
+
+    def _on_connection_lost(self, session):
+        if session.removed or not session.paho_client.want_reconnect():
+            return
+        delay_sec = session.paho_client.reconnect_delay_get(time.time() - session.connected_time)
+        self._logger.debug("Connection lost, reconnecting in %f sec", delay_sec)
+        self._call_later(delay_sec, self._start_reconnect, session)
+
+    def _start_reconnect(self, session):
+        if session.removed or not session.paho_client.want_reconnect():
+            return
+        # TCP connect and the TLS/WebSocket handshakes are blocking inside paho, keep them off this loop
+        session.connector.submit(None, self._reconnect, session)
+
+    def _reconnect(self, session):
+        try:
+            session.paho_client.reconnect()
+        except Exception as e:
+            self._logger.warn("Reconnect failed: %s", e)
+            session.connected_time = time.time()
+            self._call_soon(self._on_connection_lost, session)
+            return
+        self._call_soon(self._on_reconnected, session)
+
+    def _on_reconnected(self, session):
+        if session.removed:
+            return
+        self._reconnects += 1
+        session.connected_time = time.time()
+        self._watch_socket(session)
@@ -0,0 +1,125 @@
+# /*
+# * Copyright 2010-2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# *
+# * Licensed under the Apache License, Version 2.0 (the "License").
+# * You may not use this file except in compliance with the License.
+# * A copy of the License is located at
+# *
+# *  http://aws.amazon.com/apache2.0
+# *
+# * or in the "license" file accompanying this file. This file is distributed
+# * on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# * express or implied. See the License for the specific language governing
+# * permissions and limitations under the License.
+# */
+
+import os
+import hashlib
+import logging
+import tempfile
+from collections import OrderedDict
+from threading import Lock
+try:
+    import ssl
+except:
+    ssl = None
+
+
+def load_cert_chain_from_memory(ssl_context, cert_pem, key_pem):
+    # SSLContext.load_cert_chain only accepts paths. Where the platform supports it, hand it an
+    # anonymous in-memory file so that the private key never gets written to disk.
+    chain = (cert_pem.rstrip("\n") + "\n" + key_pem).encode("utf-8")
+    if hasattr(os, "memfd_create") and os.path.isdir("/proc/self/fd"):
+        fd = os.memfd_create("aws-iot-cert-chain")
+        try:
+            os.write(fd, chain)
+            ssl_context.load_cert_chain("/proc/self/fd/%d" % fd)
+        finally:
+            os.close(fd)
+    else:
+        fd, path = tempfile.mkstemp()  # Created with 0600 permissions
+        try:
+            os.write(fd, chain)
+            os.close(fd)
+            fd = None
+            ssl_context.load_cert_chain(path)
+        finally:
+            if fd is not None:
+                os.close(fd)
+            os.remove(path)
+
+
+# Each context pins its CA, certificate and key in memory. Rotated credentials add a new entry,
+# so only the most recently used ones are kept.
+SSL_CONTEXT_CACHE_MAX_ENTRIES = 8
+
+
+class SSLContextCache(object):
+
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, max_entries=SSL_CONTEXT_CACHE_MAX_ENTRIES):
+        self._max_entries = max_entries
+        self._contexts = OrderedDict()
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get_context(self, ca_pem, cert_pem=None, key_pem=None, cert_reqs=None, ciphers=None, alpn_protocols=None):
+        key = self._create_key(ca_pem, cert_pem, key_pem, cert_reqs, ciphers, alpn_protocols)
+        with self._lock:
+            ssl_context = self._contexts.get(key)
+            if ssl_context is not None:
+                self._contexts.move_to_end(key)
+                self._hits += 1
+                self._logger.debug("Reusing cached SSLContext")
+                return ssl_context
+            self._misses += 1
+            self._logger.debug("Building new SSLContext from in-memory credentials")
+            ssl_context = self._build(ca_pem, cert_pem, key_pem, cert_reqs, ciphers, alpn_protocols)
+            self._contexts[key] = ssl_context
+            while len(self._contexts) > self._max_entries:
+                self._contexts.popitem(last=False)
+                self._logger.debug("Evicted least recently used SSLContext")
+            return ssl_context
+
+    def get_stats(self):
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": float(self._hits) / total if total else 0.0,
+                "size": len(self._contexts)
+            }
+
+    def clear(self):
+        with self._lock:
+            self._contexts.clear()
+
+    def _create_key(self, *parts):
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(repr(part).encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _build(self, ca_pem, cert_pem, key_pem, cert_reqs, ciphers, alpn_protocols):
+        if ssl is None:
+            raise RuntimeError("This platform has no SSL/TLS.")
+        ssl_context = ssl.create_default_context(cadata=ca_pem)
+        if cert_pem and key_pem:
+            load_cert_chain_from_memory(ssl_context, cert_pem, key_pem)
+        if cert_reqs is not None:
+            if cert_reqs == ssl.CERT_NONE:
+                ssl_context.check_hostname = False  # Hostname checks are meaningless without verification
+            ssl_context.verify_mode = cert_reqs
+        if ciphers is not None:
+            ssl_context.set_ciphers(ciphers)
+        if alpn_protocols is not None:
+            ssl_context.set_alpn_protocols(alpn_protocols)
+        return ssl_context
+
+
+# Shared across every client in the process so that reconnects and sibling clients reuse one context
+shared_ssl_context_cache = SSLContextCache()
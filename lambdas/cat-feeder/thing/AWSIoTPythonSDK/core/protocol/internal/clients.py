@@ -58,11 +58,15 @@ class InternalAsyncMqttClient(object):
         self._use_wss = use_wss
         self._event_callback_map_lock = Lock()
         self._event_callback_map = dict()
+        self._network_reactor = None
 
     def _create_paho_client(self, client_id, clean_session, user_data, protocol, use_wss):
         self._logger.debug("Initializing MQTT layer...")
         return mqtt.Client(client_id, clean_session, user_data, protocol, use_wss)
 
+    def get_paho_client(self):
+        return self._paho_client
+
     #  TODO: Merge credentials providers configuration into one
     def set_cert_credentials_provider(self, cert_credentials_provider, ciphers_provider):
         # History issue from Yun SDK where AR9331 embedded Linux only have Python 2.7.3
@@ -86,6 +90,17 @@ class InternalAsyncMqttClient(object):
             self._paho_client.tls_set(ca_certs=ca_path,certfile=cert_path, keyfile=key_path,
                                       cert_reqs=ssl.CERT_REQUIRED, tls_version=ssl.PROTOCOL_SSLv23, ciphers=ciphers)
 
+    def set_memory_cert_credentials_provider(self, memory_cert_credentials_provider, ciphers_provider):
+        ca_pem = memory_cert_credentials_provider.get_ca_pem()
+        ciphers = ciphers_provider.get_ciphers()
+        if self._use_wss:
+            self._paho_client.tls_set_data(ca_data=ca_pem, cert_reqs=ssl.CERT_REQUIRED, ciphers=ciphers)
+        else:
+            cert_pem = memory_cert_credentials_provider.get_cert_pem()
+            key_pem = memory_cert_credentials_provider.get_key_pem()
+            self._paho_client.tls_set_data(ca_data=ca_pem, cert_data=cert_pem, key_data=key_pem,
+                                           cert_reqs=ssl.CERT_REQUIRED, ciphers=ciphers)
+
     def set_iam_credentials_provider(self, iam_credentials_provider):
         self._paho_client.configIAMCredentials(iam_credentials_provider.get_access_key_id(),
                                                iam_credentials_provider.get_secret_access_key(),
@@ -128,11 +143,22 @@ class InternalAsyncMqttClient(object):
 
             return rc
 
+    def set_network_reactor(self, network_reactor):
+        self._network_reactor = network_reactor
+
     def start_background_network_io(self):
+        if self._network_reactor is not None:
+            self._logger.debug("Registering with network reactor...")
+            self._network_reactor.register(self._paho_client)
+            return
         self._logger.debug("Starting network I/O thread...")
         self._paho_client.loop_start()
 
     def stop_background_network_io(self):
+        if self._network_reactor is not None:
+            self._logger.debug("Unregistering from network reactor...")
+            self._network_reactor.unregister(self._paho_client)
+            return
         self._logger.debug("Stopping network I/O thread...")
         self._paho_client.loop_stop()
 
@@ -16,5 +16,10 @@
 DEFAULT_CONNECT_DISCONNECT_TIMEOUT_SEC = 30
 DEFAULT_OPERATION_TIMEOUT_SEC = 5
 DEFAULT_DRAINING_INTERNAL_SEC = 0.5
+DEFAULT_DRAINING_MAX_RATE_HZ = 100  # AWS IoT limit on publish requests per second per connection
+DEFAULT_DRAINING_ACK_LATENCY_TARGET_SEC = 0.5
+DEFAULT_DRAINING_MAX_INFLIGHT = 20
+DEFAULT_CALLBACK_MAX_WORKERS = 4
+DEFAULT_CALLBACK_MAX_QUEUE_SIZE = 1000
 METRICS_PREFIX = "?SDK=Python&Version="
 ALPN_PROTCOLS = "x-amzn-mqtt-ca"
\ No newline at end of file
@@ -13,45 +13,76 @@
 # * permissions and limitations under the License.
 # */
 
+import os
 import logging
+import sqlite3
+from collections import deque
+from threading import Lock
+from threading import Thread
+from threading import Condition
 from AWSIoTPythonSDK.core.util.enums import DropBehaviorTypes
+from AWSIoTPythonSDK.core.protocol.internal.requests import RequestTypes
+from AWSIoTPythonSDK.core.protocol.internal.requests import QueueableRequest
 
 
 class AppendResults(object):
     APPEND_FAILURE_QUEUE_FULL = -1
     APPEND_FAILURE_QUEUE_DISABLED = -2
+    APPEND_FAILURE_PERSISTENCE = -3
     APPEND_SUCCESS = 0
 
 
-class OfflineRequestQueue(list):
+class OfflineRequestQueue(object):
     _logger = logging.getLogger(__name__)
 
-    def __init__(self, max_size, drop_behavior=DropBehaviorTypes.DROP_NEWEST):
-        if not isinstance(max_size, int) or not isinstance(drop_behavior, int):
-            self._logger.error("init: MaximumSize/DropBehavior must be integer.")
-            raise TypeError("MaximumSize/DropBehavior must be integer.")
+    def __init__(self, max_size, drop_behavior=DropBehaviorTypes.DROP_NEWEST, max_bytes=-1):
+        if not isinstance(max_size, int) or not isinstance(drop_behavior, int) or not isinstance(max_bytes, int):
+            self._logger.error("init: MaximumSize/DropBehavior/MaximumBytes must be integer.")
+            raise TypeError("MaximumSize/DropBehavior/MaximumBytes must be integer.")
         if drop_behavior != DropBehaviorTypes.DROP_OLDEST and drop_behavior != DropBehaviorTypes.DROP_NEWEST:
             self._logger.error("init: Drop behavior not supported.")
             raise ValueError("Drop behavior not supported.")
 
-        list.__init__([])
+        # Entries are (data, size in bytes) pairs so that dropping/draining never has to recompute sizes
+        self._entries = deque()
+        self._lock = Lock()
         self._drop_behavior = drop_behavior
         # When self._maximumSize > 0, queue is limited
         # When self._maximumSize == 0, queue is disabled
         # When self._maximumSize < 0. queue is infinite
         self._max_size = max_size
+        # When self._max_bytes > 0, the total size of queued payloads is limited as well
+        # When self._max_bytes <= 0, only the count limit applies
+        self._max_bytes = max_bytes
+        self._total_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_total_bytes(self):
+        return self._total_bytes
 
     def _is_enabled(self):
         return self._max_size != 0
 
-    def _need_drop_messages(self):
+    def _is_count_full(self, extra):
+        return self._max_size > 0 and len(self._entries) + extra > self._max_size
+
+    def _is_bytes_full(self, extra_bytes):
+        return self._max_bytes > 0 and self._total_bytes + extra_bytes > self._max_bytes
+
+    def _is_bytes_full_alone(self, size):
+        return self._max_bytes > 0 and size > self._max_bytes
+
+    def _need_drop_messages(self, size):
         # Need to drop messages when:
-        # 1. Queue is limited and full
+        # 1. Queue is limited and full, by count or by bytes
         # 2. Queue is disabled
-        is_queue_full = len(self) >= self._max_size
-        is_queue_limited = self._max_size > 0
-        is_queue_disabled = not self._is_enabled()
-        return (is_queue_full and is_queue_limited) or is_queue_disabled
+        return self._is_count_full(1) or self._is_bytes_full(size) or not self._is_enabled()
+
+    def _get_size(self, data):
+        get_size_bytes = getattr(data, "get_size_bytes", None)
+        return get_size_bytes() if get_size_bytes else 0
 
     def set_behavior_drop_newest(self):
         self._drop_behavior = DropBehaviorTypes.DROP_NEWEST
@@ -59,29 +90,210 @@ class OfflineRequestQueue(list):
     def set_behavior_drop_oldest(self):
         self._drop_behavior = DropBehaviorTypes.DROP_OLDEST
 
-    # Override
     # Append to a queue with a limited size.
     # Return APPEND_SUCCESS if the append is successful
     # Return APPEND_FAILURE_QUEUE_FULL if the append failed because the queue is full
     # Return APPEND_FAILURE_QUEUE_DISABLED if the append failed because the queue is disabled
     def append(self, data):
         ret = AppendResults.APPEND_SUCCESS
+        size = self._get_size(data)
         if self._is_enabled():
-            if self._need_drop_messages():
-                # We should drop the newest
-                if DropBehaviorTypes.DROP_NEWEST == self._drop_behavior:
-                    self._logger.warn("append: Full queue. Drop the newest: " + str(data))
+            with self._lock:
+                if self._need_drop_messages(size):
+                    # We should drop the newest, or the request can never fit in the byte budget anyway
+                    if DropBehaviorTypes.DROP_NEWEST == self._drop_behavior or self._is_bytes_full_alone(size):
+                        self._logger.warn("append: Full queue. Drop the newest: " + str(data))
+                    # We should drop the oldest
+                    else:
+                        while self._entries and (self._is_count_full(1) or self._is_bytes_full(size)):
+                            current_oldest, oldest_size = self._entries.popleft()
+                            self._total_bytes -= oldest_size
+                            self._on_dropped(current_oldest)
+                            self._logger.warn("append: Full queue. Drop the oldest: " + str(current_oldest))
+                        self._push(data, size)
                     ret = AppendResults.APPEND_FAILURE_QUEUE_FULL
-                # We should drop the oldest
                 else:
-                    current_oldest = super(OfflineRequestQueue, self).pop(0)
-                    self._logger.warn("append: Full queue. Drop the oldest: " + str(current_oldest))
-                    super(OfflineRequestQueue, self).append(data)
-                    ret = AppendResults.APPEND_FAILURE_QUEUE_FULL
-            else:
-                self._logger.debug("append: Add new element: " + str(data))
-                super(OfflineRequestQueue, self).append(data)
+                    self._logger.debug("append: Add new element: " + str(data))
+                    self._push(data, size)
         else:
             self._logger.debug("append: Queue is disabled. Drop the message: " + str(data))
             ret = AppendResults.APPEND_FAILURE_QUEUE_DISABLED
         return ret
+
+    def popleft(self):
+        with self._lock:
+            data, size = self._entries.popleft()
+            self._total_bytes -= size
+            return data
+
+    # Called once a drained request has been delivered (PUBACK for QoS1, handed to the network layer for QoS0)
+    def acknowledge(self, data):
+        pass
+
+    def close(self):
+        pass
+
+    def _push(self, data, size):
+        self._entries.append((data, size))
+        self._total_bytes += size
+        self._on_added(data)
+
+    def _on_added(self, data):
+        pass
+
+    def _on_dropped(self, data):
+        pass
+
+
+class PersistentOfflineRequestQueue(OfflineRequestQueue):
+    """Offline request queue whose publish requests are also kept in a SQLite log.
+
+    Publish requests are written on append and deleted once acknowledged, so
+    after a restart only the requests that never got delivered are replayed.
+    Subscribe/unsubscribe requests carry callbacks and stay in memory only.
+    """
+
+    def __init__(self, max_size, drop_behavior=DropBehaviorTypes.DROP_NEWEST, max_bytes=-1, path=None):
+        OfflineRequestQueue.__init__(self, max_size, drop_behavior, max_bytes)
+        self._writer = GroupCommitWriter(path)
+        self._next_id = 1
+        self._replay()
+
+    def _replay(self):
+        for request_id, topic, payload, qos, retain in self._writer.load():
+            request = QueueableRequest(RequestTypes.PUBLISH, (topic, payload, qos, bool(retain)))
+            request.persistent_id = request_id
+            self._entries.append((request, self._get_size(request)))
+            self._total_bytes += self._entries[-1][1]
+            self._next_id = request_id + 1
+        if self._entries:
+            self._logger.info("Replaying %d unacknowledged offline request(s) from %s", len(self._entries), self._writer.get_path())
+
+    # Also returns APPEND_FAILURE_PERSISTENCE if the request could not be written to the log. It is then taken out
+    # of the queue again, unless it has already been drained.
+    def append(self, data):
+        ret = OfflineRequestQueue.append(self, data)
+        if AppendResults.APPEND_FAILURE_QUEUE_DISABLED != ret:
+            # Group commit: one fsync covers every append waiting here
+            persisted = self._writer.wait_until_committed(getattr(data, "persistent_id", None))
+            if not persisted and self._remove(data):
+                ret = AppendResults.APPEND_FAILURE_PERSISTENCE
+        return ret
+
+    def _remove(self, data):
+        with self._lock:
+            for entry in self._entries:
+                if entry[0] is data:
+                    self._entries.remove(entry)
+                    self._total_bytes -= entry[1]
+                    return True
+        return False
+
+    def acknowledge(self, data):
+        if getattr(data, "persistent_id", None) is not None:
+            self._writer.delete(data.persistent_id)
+
+    def close(self):
+        self._writer.close()
+
+    def _on_added(self, data):
+        if isinstance(data, QueueableRequest) and RequestTypes.PUBLISH == data.type:
+            data.persistent_id = self._next_id
+            self._next_id += 1
+            topic, payload, qos, retain = data.data
+            self._writer.insert(data.persistent_id, topic, payload, qos, retain)
+
+    def _on_dropped(self, data):
+        self.acknowledge(data)
+
+
+class GroupCommitWriter(object):
+
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS requests ("
+                                 "id INTEGER PRIMARY KEY, topic TEXT, payload BLOB, is_text INTEGER, qos INTEGER, retain INTEGER)")
+        self._connection.commit()
+        self._cv = Condition()
+        self._pending = list()
+        self._failed_insert_ids = set()  # Request ids whose insert was rolled back, until their appender has waited
+        self._submitted_seq = 0
+        self._committed_seq = 0
+        self._is_running = True
+        self._committer = Thread(target=self._commit_loop)
+        self._committer.daemon = True
+        self._committer.start()
+
+    def get_path(self):
+        return self._path
+
+    def load(self):
+        rows = self._connection.execute("SELECT id, topic, payload, is_text, qos, retain FROM requests ORDER BY id").fetchall()
+        return [(request_id, topic, bytes(payload).decode("utf-8") if is_text else bytearray(payload), qos, retain)
+                for request_id, topic, payload, is_text, qos, retain in rows]
+
+    def insert(self, request_id, topic, payload, qos, retain):
+        is_text = not isinstance(payload, (bytes, bytearray))
+        blob = str(payload if payload is not None else "").encode("utf-8") if is_text else bytes(payload)
+        self._submit(("INSERT OR REPLACE INTO requests VALUES (?, ?, ?, ?, ?, ?)",
+                      (request_id, topic, sqlite3.Binary(blob), int(is_text), qos, int(retain)), request_id))
+
+    def delete(self, request_id):
+        self._submit(("DELETE FROM requests WHERE id = ?", (request_id,), None))
+
+    # Returns False if the insert of request_id was not committed
+    def wait_until_committed(self, request_id=None):
+        with self._cv:
+            target_seq = self._submitted_seq
+            while self._committed_seq < target_seq and self._is_running:
+                self._cv.wait()
+            if self._committed_seq < target_seq:
+                return False  # Closed before the commit
+            if request_id in self._failed_insert_ids:
+                self._failed_insert_ids.discard(request_id)
+                return False
+            return True
+
+    def close(self):
+        with self._cv:
+            self._is_running = False
+            self._cv.notify_all()
+        self._committer.join()
+        self._connection.close()
+
+    def _submit(self, statement):
+        with self._cv:
+            self._pending.append(statement)
+            self._submitted_seq += 1
+            self._cv.notify_all()
+
+    def _commit_loop(self):
+        while True:
+            with self._cv:
+                while not self._pending and self._is_running:
+                    self._cv.wait()
+                if not self._pending:
+                    break
+                batch, self._pending = self._pending, list()
+                batch_seq = self._submitted_seq
+            # Everything that piled up while the previous commit was in flight goes into one transaction/fsync
+            try:
+                with self._connection:
+                    for sql, parameters, insert_id in batch:
+                        self._connection.execute(sql, parameters)
+                failed_insert_ids = ()
+            except sqlite3.Error as e:
+                self._logger.error("Failed to persist %d offline request change(s): %s", len(batch), e)
+                failed_insert_ids = [insert_id for sql, parameters, insert_id in batch if insert_id is not None]
+            with self._cv:
+                self._failed_insert_ids.update(failed_insert_ids)
+                self._committed_seq = batch_seq
+                self._cv.notify_all()
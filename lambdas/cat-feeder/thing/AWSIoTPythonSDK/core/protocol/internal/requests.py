@@ -25,3 +25,27 @@ class QueueableRequest(object):
     def __init__(self, type, data):
         self.type = type
         self.data = data  # Can be a tuple
+        self.persistent_id = None  # Set when the request is backed by a persistent offline queue
+
+    def get_size_bytes(self):
+        # Approximate on-the-wire size used to enforce the offline queue byte budget
+        if RequestTypes.PUBLISH == self.type:
+            topic, payload = self.data[0], self.data[1]
+            return _get_length(topic) + _get_length(payload)
+        return _get_length(self.data[0])
+
+
+def _get_length(value):
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return len(str(value).encode("utf-8"))
+
+
+class PublishResults(object):
+    SENT = "SENT"  # QoS0, handed over to the network layer
+    ACKED = "ACKED"  # QoS1, PUBACK received
+    QUEUED = "QUEUED"  # Client offline, added to the offline requests queue
+    TIMEOUT = "TIMEOUT"  # QoS1, no PUBACK within the operation timeout
+    FAILED = "FAILED"
@@ -13,17 +13,29 @@
 # * permissions and limitations under the License.
 # */
 
+import heapq
+import itertools
 import time
 import logging
+from collections import deque
 from threading import Thread
+from threading import current_thread
 from threading import Event
+from threading import Lock
+from threading import Condition
 from AWSIoTPythonSDK.core.protocol.internal.events import EventTypes
 from AWSIoTPythonSDK.core.protocol.internal.events import FixedEventMids
 from AWSIoTPythonSDK.core.protocol.internal.clients import ClientStatus
 from AWSIoTPythonSDK.core.protocol.internal.queues import OfflineRequestQueue
+from AWSIoTPythonSDK.core.protocol.internal.queues import PersistentOfflineRequestQueue
 from AWSIoTPythonSDK.core.protocol.internal.requests import RequestTypes
-from AWSIoTPythonSDK.core.protocol.paho.client import topic_matches_sub
+from AWSIoTPythonSDK.core.protocol.paho.client import MQTT_ERR_SUCCESS
 from AWSIoTPythonSDK.core.protocol.internal.defaults import DEFAULT_DRAINING_INTERNAL_SEC
+from AWSIoTPythonSDK.core.protocol.internal.defaults import DEFAULT_DRAINING_MAX_RATE_HZ
+from AWSIoTPythonSDK.core.protocol.internal.defaults import DEFAULT_DRAINING_ACK_LATENCY_TARGET_SEC
+from AWSIoTPythonSDK.core.protocol.internal.defaults import DEFAULT_DRAINING_MAX_INFLIGHT
+from AWSIoTPythonSDK.core.protocol.internal.defaults import DEFAULT_CALLBACK_MAX_WORKERS
+from AWSIoTPythonSDK.core.protocol.internal.defaults import DEFAULT_CALLBACK_MAX_QUEUE_SIZE
 
 
 class EventProducer(object):
@@ -60,25 +72,27 @@ class EventProducer(object):
 
     def _add_to_queue(self, mid, event_type, data):
         with self._cv:
-            self._event_queue.put((mid, event_type, data))
+            self._event_queue.append((mid, event_type, data, time.time()))
             self._cv.notify()
 
 
 class EventConsumer(object):
 
-    MAX_DISPATCH_INTERNAL_SEC = 0.01
+    LATENCY_SAMPLE_SIZE = 1000
     _logger = logging.getLogger(__name__)
 
     def __init__(self, cv, event_queue, internal_async_client,
-                 subscription_manager, offline_requests_manager, client_status):
+                 subscription_manager, offline_requests_manager, client_status, callback_executor=None):
         self._cv = cv
         self._event_queue = event_queue
         self._internal_async_client = internal_async_client
         self._subscription_manager = subscription_manager
         self._offline_requests_manager = offline_requests_manager
         self._client_status = client_status
+        self._callback_executor = callback_executor or CallbackExecutor()
         self._is_running = False
         self._draining_interval_sec = DEFAULT_DRAINING_INTERNAL_SEC
+        self._drain_scheduler = AdaptiveDrainScheduler(1 / float(DEFAULT_DRAINING_INTERNAL_SEC))
         self._dispatch_methods = {
             EventTypes.CONNACK : self._dispatch_connack,
             EventTypes.DISCONNECT : self._dispatch_disconnect,
@@ -93,16 +107,49 @@ class EventConsumer(object):
             RequestTypes.UNSUBSCRIBE : self._handle_offline_unsubscribe
         }
         self._stopper = Event()
+        self._metrics_lock = Lock()
+        self._latency_samples = deque(maxlen=self.LATENCY_SAMPLE_SIZE)
+        self._dispatched = 0
+        self._batches = 0
+        self._max_batch_size = 0
 
     def update_offline_requests_manager(self, offline_requests_manager):
         self._offline_requests_manager = offline_requests_manager
 
     def update_draining_interval_sec(self, draining_interval_sec):
         self._draining_interval_sec = draining_interval_sec
+        self._drain_scheduler.update_base_rate_hz(1 / float(draining_interval_sec))
+
+    def update_adaptive_draining(self, max_rate_hz, ack_latency_target_sec, max_inflight):
+        self._drain_scheduler.update_limits(max_rate_hz, ack_latency_target_sec, max_inflight)
+
+    def get_draining_metrics(self):
+        return self._drain_scheduler.get_metrics(self._offline_requests_manager.get_size())
 
     def get_draining_interval_sec(self):
         return self._draining_interval_sec
 
+    def get_dispatch_metrics(self):
+        with self._cv:
+            queue_depth = len(self._event_queue)
+        with self._metrics_lock:
+            latencies = sorted(self._latency_samples)
+            return {
+                "queue_depth": queue_depth,
+                "dispatched": self._dispatched,
+                "batches": self._batches,
+                "max_batch_size": self._max_batch_size,
+                "latency_p50_sec": self._percentile(latencies, 0.5),
+                "latency_p90_sec": self._percentile(latencies, 0.9),
+                "latency_p99_sec": self._percentile(latencies, 0.99),
+                "latency_max_sec": latencies[-1] if latencies else 0.0
+            }
+
+    def _percentile(self, sorted_values, fraction):
+        if not sorted_values:
+            return 0.0
+        return sorted_values[int(round(fraction * (len(sorted_values) - 1)))]
+
     def is_running(self):
         return self._is_running
 
@@ -122,8 +169,9 @@ class EventConsumer(object):
 
     def _clean_up(self):
         self._logger.debug("Cleaning up before stopping event consuming")
-        with self._event_queue.mutex:
-            self._event_queue.queue.clear()
+        with self._cv:
+            self._event_queue.clear()
+            self._cv.notify_all()  # Wake the dispatching loop so it sees it has been stopped
             self._logger.debug("Event queue cleared")
         self._internal_async_client.stop_background_network_io()
         self._logger.debug("Network thread stopped")
@@ -139,17 +187,28 @@ class EventConsumer(object):
 
     def _dispatch(self):
         while self._is_running:
+            # Sleep until events are produced, then take all of them at once so the network
+            # thread is never held up on the lock while the callbacks run
             with self._cv:
-                if self._event_queue.empty():
-                    self._cv.wait(self.MAX_DISPATCH_INTERNAL_SEC)
-                else:
-                    while not self._event_queue.empty():
-                        self._dispatch_one()
+                while self._is_running and not self._event_queue:
+                    self._cv.wait()
+                events = list(self._event_queue)
+                self._event_queue.clear()
+            if events:
+                with self._metrics_lock:
+                    self._batches += 1
+                    self._max_batch_size = max(self._max_batch_size, len(events))
+            for event in events:
+                if not self._is_running:
+                    break  # Stopped by a disconnect event, the rest of the batch is dropped like the queue
+                self._dispatch_one(*event)
         self._stopper.set()
         self._logger.debug("Exiting dispatching loop...")
 
-    def _dispatch_one(self):
-        mid, event_type, data = self._event_queue.get()
+    def _dispatch_one(self, mid, event_type, data, enqueue_time):
+        with self._metrics_lock:
+            self._dispatched += 1
+            self._latency_samples.append(time.time() - enqueue_time)
         if mid:
             self._dispatch_methods[event_type](mid, data)
             self._internal_async_client.invoke_event_callback(mid, data=data)
@@ -197,14 +256,19 @@ class EventConsumer(object):
         if self._offline_requests_manager.has_more() and not self._has_user_disconnect_request():
             self._logger.debug("Start draining")
             self._client_status.set_status(ClientStatus.DRAINING)
+            self._drain_scheduler.start()
             while self._offline_requests_manager.has_more():
                 if self._has_user_disconnect_request():
                     self._logger.debug("User disconnect detected")
                     break
-                offline_request = self._offline_requests_manager.get_next()
-                if offline_request:
+                # Send a burst sized by the current drain rate, then let the scheduler adapt the rate
+                for _ in range(self._drain_scheduler.next_burst_size()):
+                    offline_request = self._offline_requests_manager.get_next()
+                    if offline_request is None:
+                        break
                     self._offline_request_handlers[offline_request.type](offline_request)
-                    time.sleep(self._draining_interval_sec)
+                self._drain_scheduler.wait_for_next_burst()
+            self._drain_scheduler.stop()
 
     def _has_user_disconnect_request(self):
         return ClientStatus.USER_DISCONNECT == self._client_status.get_status()
@@ -230,17 +294,32 @@ class EventConsumer(object):
 
     def _dispatch_message(self, mid, message):
         self._logger.debug("Dispatching [message] event")
-        subscriptions = self._subscription_manager.list_records()
-        if subscriptions:
-            for topic, (qos, message_callback, _) in subscriptions:
-                if topic_matches_sub(topic, message.topic) and message_callback:
-                    message_callback(None, None, message)  # message_callback(client, userdata, message)
+        for topic, (qos, message_callback, _) in self._subscription_manager.match_records(message.topic):
+            if message_callback:
+                # Callbacks for the same topic run in arrival order, other topics are not held up by them
+                self._callback_executor.submit(message.topic, message_callback, None, None, message)  # message_callback(client, userdata, message)
 
     def _handle_offline_publish(self, request):
         topic, payload, qos, retain = request.data
-        self._internal_async_client.publish(topic, payload, qos, retain)
+        ack_callback = self._create_offline_publish_ack_callback(request) if qos > 0 else None
+        rc, mid = self._internal_async_client.publish(topic, payload, qos, retain, ack_callback)
+        if MQTT_ERR_SUCCESS != rc:
+            self._drain_scheduler.on_publish_rejected(ack_callback)
+        else:
+            self._drain_scheduler.on_published()
+            if qos == 0:
+                self._offline_requests_manager.acknowledge(request)
         self._logger.debug("Processed offline publish request")
 
+    def _create_offline_publish_ack_callback(self, request):
+        drain_ack_callback = self._drain_scheduler.create_ack_callback()
+        offline_requests_manager = self._offline_requests_manager
+
+        def ack_callback(mid, data=None):
+            drain_ack_callback(mid, data)
+            offline_requests_manager.acknowledge(request)
+        return ack_callback
+
     def _handle_offline_subscribe(self, request):
         topic, qos, message_callback, ack_callback = request.data
         self._subscription_manager.add_record(topic, qos, message_callback, ack_callback)
@@ -260,37 +339,454 @@ class SubscriptionManager(object):
 
     def __init__(self):
         self._subscription_map = dict()
+        self._subscription_trie = TopicTrie()
+        self._lock = Lock()
 
     def add_record(self, topic, qos, message_callback, ack_callback):
         self._logger.debug("Adding a new subscription record: %s qos: %d", topic, qos)
-        self._subscription_map[topic] = qos, message_callback, ack_callback  # message_callback and/or ack_callback could be None
+        with self._lock:
+            self._subscription_map[topic] = qos, message_callback, ack_callback  # message_callback and/or ack_callback could be None
+            self._subscription_trie.add(topic)
 
     def remove_record(self, topic):
         self._logger.debug("Removing subscription record: %s", topic)
-        if self._subscription_map.get(topic):  # Ignore topics that are never subscribed to
-            del self._subscription_map[topic]
-        else:
-            self._logger.warn("Removing attempt for non-exist subscription record: %s", topic)
+        with self._lock:
+            if self._subscription_map.get(topic):  # Ignore topics that are never subscribed to
+                del self._subscription_map[topic]
+                self._subscription_trie.remove(topic)
+            else:
+                self._logger.warn("Removing attempt for non-exist subscription record: %s", topic)
 
     def list_records(self):
-        return list(self._subscription_map.items())
+        with self._lock:
+            return list(self._subscription_map.items())
+
+    def match_records(self, topic):
+        with self._lock:
+            return [(topic_filter, self._subscription_map[topic_filter]) for topic_filter in self._subscription_trie.match(topic)]
+
+
+class TopicTrie(object):
+    """Index of topic filters, one trie level per topic level.
+
+    Matching walks the levels of the incoming topic, so its cost depends on
+    the topic depth and on how many filters actually match, not on the total
+    number of filters. Supports the MQTT "+" and "#" wildcards.
+    """
+
+    def __init__(self):
+        self._root = _TopicTrieNode()
+
+    def add(self, topic_filter):
+        node = self._root
+        for level in topic_filter.split("/"):
+            node = node.children.setdefault(level, _TopicTrieNode())
+        node.topic_filter = topic_filter
+
+    def remove(self, topic_filter):
+        path = [self._root]
+        for level in topic_filter.split("/"):
+            node = path[-1].children.get(level)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].topic_filter = None
+        # Prune the branch that no longer leads to any filter
+        levels = topic_filter.split("/")
+        for depth in range(len(levels), 0, -1):
+            node = path[depth]
+            if node.topic_filter is not None or node.children:
+                break
+            del path[depth - 1].children[levels[depth - 1]]
+
+    def match(self, topic):
+        matches = list()
+        levels = topic.split("/")
+        # Topics starting with "$" are not matched by wildcards in the first level
+        is_system_topic = topic.startswith("$")
+        self._match(self._root, levels, 0, is_system_topic, matches)
+        return matches
+
+    def _match(self, node, levels, depth, is_system_topic, matches):
+        allow_wildcards = not (is_system_topic and depth == 0)
+        multi_level = node.children.get("#") if allow_wildcards else None
+        if multi_level is not None and multi_level.topic_filter is not None:
+            matches.append(multi_level.topic_filter)  # "a/#" matches "a", "a/b" and "a/b/c"
+        if depth == len(levels):
+            if node.topic_filter is not None:
+                matches.append(node.topic_filter)
+            return
+        child = node.children.get(levels[depth])
+        if child is not None:
+            self._match(child, levels, depth + 1, is_system_topic, matches)
+        single_level = node.children.get("+") if allow_wildcards else None
+        if single_level is not None:
+            self._match(single_level, levels, depth + 1, is_system_topic, matches)
+
+
+class _TopicTrieNode(object):
+
+    __slots__ = ("children", "topic_filter")
+
+    def __init__(self):
+        self.children = dict()
+        self.topic_filter = None
 
 
 class OfflineRequestsManager(object):
 
     _logger = logging.getLogger(__name__)
 
-    def __init__(self, max_size, drop_behavior):
-        self._queue = OfflineRequestQueue(max_size, drop_behavior)
+    def __init__(self, max_size, drop_behavior, max_bytes=-1, persistence_path=None):
+        if persistence_path:
+            self._queue = PersistentOfflineRequestQueue(max_size, drop_behavior, max_bytes, persistence_path)
+        else:
+            self._queue = OfflineRequestQueue(max_size, drop_behavior, max_bytes)
 
     def has_more(self):
         return len(self._queue) > 0
 
+    def get_size(self):
+        return len(self._queue)
+
     def add_one(self, request):
         return self._queue.append(request)
 
     def get_next(self):
         if self.has_more():
-            return self._queue.pop(0)
+            return self._queue.popleft()
         else:
             return None
+
+    def acknowledge(self, request):
+        self._queue.acknowledge(request)
+
+    def close(self):
+        self._queue.close()
+
+
+class AdaptiveDrainScheduler(object):
+
+    BURST_INTERVAL_SEC = 0.1
+    RATE_INCREASE_FACTOR = 1.25
+    RATE_DECREASE_FACTOR = 0.5
+    LATENCY_SMOOTHING = 0.2
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, base_rate_hz, max_rate_hz=DEFAULT_DRAINING_MAX_RATE_HZ,
+                 ack_latency_target_sec=DEFAULT_DRAINING_ACK_LATENCY_TARGET_SEC,
+                 max_inflight=DEFAULT_DRAINING_MAX_INFLIGHT):
+        self._lock = Lock()
+        self._base_rate_hz = base_rate_hz
+        self._max_rate_hz = max_rate_hz
+        self._ack_latency_target_sec = ack_latency_target_sec
+        self._max_inflight = max_inflight
+        self._rate_hz = base_rate_hz
+        self._credit = 0.0
+        self._inflight = 0
+        self._generation = 0  # Bumped by every start, ack callbacks of an earlier drain are ignored
+        self._ack_latency_sec = None
+        self._drained = 0
+        self._throttled = 0
+        self._start_time = None
+        self._stop_time = None
+
+    def update_base_rate_hz(self, base_rate_hz):
+        with self._lock:
+            self._base_rate_hz = base_rate_hz
+            self._rate_hz = base_rate_hz
+
+    def update_limits(self, max_rate_hz, ack_latency_target_sec, max_inflight):
+        with self._lock:
+            self._max_rate_hz = max_rate_hz
+            self._ack_latency_target_sec = ack_latency_target_sec
+            self._max_inflight = max_inflight
+
+    def start(self):
+        with self._lock:
+            self._rate_hz = self._base_rate_hz
+            self._credit = 1.0  # Always send the first request right away
+            # Acks of the previous drain may never come, a disconnect drops their callbacks
+            self._inflight = 0
+            self._generation += 1
+            self._ack_latency_sec = None
+            self._drained = 0
+            self._throttled = 0
+            self._start_time = time.time()
+            self._stop_time = None
+        self._logger.debug("Draining started at %f requests/sec", self._base_rate_hz)
+
+    def stop(self):
+        with self._lock:
+            self._stop_time = time.time()
+        self._logger.debug("Draining stopped after %d requests", self._drained)
+
+    def next_burst_size(self):
+        with self._lock:
+            self._credit += self._rate_hz * self.BURST_INTERVAL_SEC
+            burst = int(self._credit)
+            # Never have more unacknowledged publishes outstanding than the inflight window
+            burst = max(0, min(burst, self._max_inflight - self._inflight))
+            self._credit = min(self._credit - burst, max(1.0, self._rate_hz * self.BURST_INTERVAL_SEC))
+            return burst
+
+    def wait_for_next_burst(self):
+        time.sleep(self.BURST_INTERVAL_SEC)
+        with self._lock:
+            self._adapt_rate()
+
+    def _adapt_rate(self):
+        ack_backlog = self._inflight >= self._max_inflight
+        too_slow = self._ack_latency_sec is not None and self._ack_latency_sec > self._ack_latency_target_sec
+        if ack_backlog or too_slow:
+            self._rate_hz = max(self._base_rate_hz, self._rate_hz * self.RATE_DECREASE_FACTOR)
+        else:
+            self._rate_hz = min(max(self._max_rate_hz, self._base_rate_hz), self._rate_hz * self.RATE_INCREASE_FACTOR)
+
+    def create_ack_callback(self):
+        sent_time = time.time()
+        with self._lock:
+            self._inflight += 1
+            generation = self._generation
+
+        def ack_callback(mid, data=None):
+            latency_sec = time.time() - sent_time
+            with self._lock:
+                if generation != self._generation:
+                    return
+                self._inflight = max(0, self._inflight - 1)
+                if self._ack_latency_sec is None:
+                    self._ack_latency_sec = latency_sec
+                else:
+                    self._ack_latency_sec += self.LATENCY_SMOOTHING * (latency_sec - self._ack_latency_sec)
+        return ack_callback
+
+    def on_published(self):
+        with self._lock:
+            self._drained += 1
+
+    def on_publish_rejected(self, ack_callback=None):
+        # Treat a rejected publish as broker/client throttling: release the inflight slot and back off hard
+        with self._lock:
+            if ack_callback is not None:
+                self._inflight = max(0, self._inflight - 1)
+            self._throttled += 1
+            self._rate_hz = self._base_rate_hz
+            self._credit = 0.0
+
+    def get_metrics(self, backlog):
+        with self._lock:
+            elapsed_sec = 0.0
+            if self._start_time is not None:
+                elapsed_sec = (self._stop_time or time.time()) - self._start_time
+            return {
+                "backlog": backlog,
+                "drained": self._drained,
+                "throughput_hz": self._drained / elapsed_sec if elapsed_sec > 0 else 0.0,
+                "rate_hz": self._rate_hz,
+                "inflight": self._inflight,
+                "ack_latency_sec": self._ack_latency_sec,
+                "throttled": self._throttled
+            }
+
+
+class CallbackExecutor(object):
+
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, max_workers=DEFAULT_CALLBACK_MAX_WORKERS, max_queue_size=DEFAULT_CALLBACK_MAX_QUEUE_SIZE):
+        self._cv = Condition()
+        self._max_workers = max_workers
+        self._max_queue_size = max_queue_size
+        self._pending = dict()  # Ordering key -> deque of (callback, args, enqueue time), present while queued or running
+        self._ready_keys = deque()  # Keys with queued callbacks and none currently running
+        self._queue_depth = 0
+        self._workers = set()
+        self._idle_workers = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._blocked_submits = 0
+        self._total_queue_wait_sec = 0.0
+        self._max_queue_wait_sec = 0.0
+
+    def update_limits(self, max_workers, max_queue_size):
+        with self._cv:
+            self._max_workers = max_workers
+            self._max_queue_size = max_queue_size
+            self._cv.notify_all()
+
+    def submit(self, key, callback, *args):
+        # Callbacks sharing a key run one at a time in submission order. A key of None means no ordering.
+        if key is None:
+            key = object()
+        with self._cv:
+            # Block the submitter while the queue is full. Callbacks that submit follow-up work are never
+            # blocked, otherwise a full queue could stall the very workers that are supposed to drain it.
+            if current_thread() not in self._workers and self._is_full():
+                self._blocked_submits += 1
+                while self._is_full():
+                    self._cv.wait()
+            if key in self._pending:
+                self._pending[key].append((callback, args, time.time()))
+            else:
+                self._pending[key] = deque([(callback, args, time.time())])
+                self._ready_keys.append(key)
+            self._queue_depth += 1
+            self._submitted += 1
+            if self._idle_workers == 0 and len(self._workers) < self._max_workers:
+                self._start_worker()
+            else:
+                self._cv.notify()
+
+    def get_metrics(self):
+        with self._cv:
+            dequeued = self._submitted - self._queue_depth
+            return {
+                "workers": len(self._workers),
+                "queue_depth": self._queue_depth,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "blocked_submits": self._blocked_submits,
+                "avg_queue_wait_sec": self._total_queue_wait_sec / dequeued if dequeued else 0.0,
+                "max_queue_wait_sec": self._max_queue_wait_sec
+            }
+
+    def _is_full(self):
+        return 0 < self._max_queue_size <= self._queue_depth
+
+    def _start_worker(self):
+        worker = Thread(target=self._work)
+        worker.daemon = True
+        self._workers.add(worker)
+        worker.start()
+        self._logger.debug("Callback worker started, %d worker(s) running", len(self._workers))
+
+    def _work(self):
+        while True:
+            with self._cv:
+                self._idle_workers += 1
+                while not self._ready_keys and len(self._workers) <= self._max_workers:
+                    self._cv.wait()
+                self._idle_workers -= 1
+                if len(self._workers) > self._max_workers:
+                    self._workers.discard(current_thread())  # Shrunk by update_limits
+                    self._cv.notify()
+                    return
+                key = self._ready_keys.popleft()
+                callback, args, enqueue_time = self._pending[key].popleft()
+                self._queue_depth -= 1
+                queue_wait_sec = time.time() - enqueue_time
+                self._total_queue_wait_sec += queue_wait_sec
+                self._max_queue_wait_sec = max(self._max_queue_wait_sec, queue_wait_sec)
+                self._cv.notify_all()  # Wake submitters waiting for room
+            try:
+                callback(*args)
+                failed = False
+            except Exception:
+                self._logger.exception("Unhandled exception in callback")
+                failed = True
+            with self._cv:
+                self._completed += 1
+                if failed:
+                    self._failed += 1
+                if self._pending[key]:
+                    self._ready_keys.append(key)
+                    self._cv.notify()
+                else:
+                    del self._pending[key]
+
+
+class TimeoutScheduler(object):
+    """Runs the deadlines of many pending requests from one thread.
+
+    Deadlines sit in a heap ordered by due time. Cancelling only flags the entry,
+    which is O(1); flagged entries are dropped once they reach the top of the heap,
+    or all at once when they make up most of it. Due callbacks are handed to the
+    callback executor, so a slow one does not hold up the other deadlines.
+    """
+
+    COMPACT_MIN_CANCELLED = 1024
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, callback_executor):
+        self._callback_executor = callback_executor
+        self._cv = Condition()
+        self._heap = []  # (due time, sequence, ScheduledTimeout)
+        self._sequence = itertools.count()
+        self._cancelled = 0  # Cancelled entries still in the heap
+        self._thread = None
+
+    def new_timeout(self, delay_sec, callback, *args):
+        # Same life cycle as threading.Timer: start() it, then cancel() it if the response beats the deadline
+        return ScheduledTimeout(self, delay_sec, callback, args)
+
+    def get_pending(self):
+        with self._cv:
+            return len(self._heap) - self._cancelled
+
+    def _start(self, timeout):
+        with self._cv:
+            if timeout.state != ScheduledTimeout.NEW:
+                return
+            timeout.state = ScheduledTimeout.STARTED
+            heapq.heappush(self._heap, (time.time() + timeout.delay_sec, next(self._sequence), timeout))
+            if self._thread is None:
+                self._thread = Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+            elif self._heap[0][2] is timeout:
+                self._cv.notify()  # New earliest deadline
+
+    def _cancel(self, timeout):
+        with self._cv:
+            in_heap = timeout.state == ScheduledTimeout.STARTED
+            if timeout.state != ScheduledTimeout.FIRED:
+                # Marked before compacting, so that the compaction removes this entry as well
+                timeout.state = ScheduledTimeout.CANCELLED
+            if in_heap:
+                self._cancelled += 1
+                if self._cancelled >= self.COMPACT_MIN_CANCELLED and 2 * self._cancelled > len(self._heap):
+                    self._heap = [entry for entry in self._heap if entry[2].state != ScheduledTimeout.CANCELLED]
+                    heapq.heapify(self._heap)
+                    self._cancelled = 0
+
+    def _run(self):
+        while True:
+            with self._cv:
+                while True:
+                    while self._heap and self._heap[0][2].state == ScheduledTimeout.CANCELLED:
+                        heapq.heappop(self._heap)
+                        self._cancelled -= 1
+                    if not self._heap:
+                        self._cv.wait()
+                        continue
+                    delay_sec = self._heap[0][0] - time.time()
+                    if delay_sec <= 0:
+                        break
+                    self._cv.wait(delay_sec)
+                _, _, timeout = heapq.heappop(self._heap)
+                timeout.state = ScheduledTimeout.FIRED
+            self._callback_executor.submit(None, timeout.callback, *timeout.args)
+
+
+class ScheduledTimeout(object):
+
+    NEW = 0
+    STARTED = 1
+    CANCELLED = 2
+    FIRED = 3
+
+    def __init__(self, scheduler, delay_sec, callback, args):
+        self._scheduler = scheduler
+        self.delay_sec = delay_sec
+        self.callback = callback
+        self.args = args
+        self.state = ScheduledTimeout.NEW
+
+    def start(self):
+        self._scheduler._start(self)
+
+    def cancel(self):
+        self._scheduler._cancel(self)
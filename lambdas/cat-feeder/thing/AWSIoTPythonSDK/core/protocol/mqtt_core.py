@@ -21,8 +21,10 @@ from AWSIoTPythonSDK.core.protocol.internal.workers import EventProducer
 from AWSIoTPythonSDK.core.protocol.internal.workers import EventConsumer
 from AWSIoTPythonSDK.core.protocol.internal.workers import SubscriptionManager
 from AWSIoTPythonSDK.core.protocol.internal.workers import OfflineRequestsManager
+from AWSIoTPythonSDK.core.protocol.internal.workers import CallbackExecutor
 from AWSIoTPythonSDK.core.protocol.internal.requests import RequestTypes
 from AWSIoTPythonSDK.core.protocol.internal.requests import QueueableRequest
+from AWSIoTPythonSDK.core.protocol.internal.requests import PublishResults
 from AWSIoTPythonSDK.core.protocol.internal.defaults import DEFAULT_CONNECT_DISCONNECT_TIMEOUT_SEC
 from AWSIoTPythonSDK.core.protocol.internal.defaults import DEFAULT_OPERATION_TIMEOUT_SEC
 from AWSIoTPythonSDK.core.protocol.internal.defaults import METRICS_PREFIX
@@ -37,6 +39,7 @@ from AWSIoTPythonSDK.exception.AWSIoTExceptions import publishError
 from AWSIoTPythonSDK.exception.AWSIoTExceptions import publishTimeoutException
 from AWSIoTPythonSDK.exception.AWSIoTExceptions import publishQueueFullException
 from AWSIoTPythonSDK.exception.AWSIoTExceptions import publishQueueDisabledException
+from AWSIoTPythonSDK.exception.AWSIoTExceptions import publishQueuePersistenceException
 from AWSIoTPythonSDK.exception.AWSIoTExceptions import subscribeQueueFullException
 from AWSIoTPythonSDK.exception.AWSIoTExceptions import subscribeQueueDisabledException
 from AWSIoTPythonSDK.exception.AWSIoTExceptions import unsubscribeQueueFullException
@@ -50,12 +53,11 @@ from AWSIoTPythonSDK.core.util.enums import DropBehaviorTypes
 from AWSIoTPythonSDK.core.protocol.paho.client import MQTTv31
 from threading import Condition
 from threading import Event
+from threading import Lock
 import logging
-import sys
-if sys.version_info[0] < 3:
-    from Queue import Queue
-else:
-    from queue import Queue
+import os
+import re
+from collections import deque
 
 
 class MqttCore(object):
@@ -63,23 +65,26 @@ class MqttCore(object):
     _logger = logging.getLogger(__name__)
 
     def __init__(self, client_id, clean_session, protocol, use_wss):
+        self._client_id = client_id
         self._use_wss = use_wss
         self._username = ""
         self._password = None
         self._enable_metrics_collection = True
-        self._event_queue = Queue()
+        self._event_queue = deque()  # Guarded by the event condition variable
         self._event_cv = Condition()
         self._event_producer = EventProducer(self._event_cv, self._event_queue)
         self._client_status = ClientStatusContainer()
         self._internal_async_client = InternalAsyncMqttClient(client_id, clean_session, protocol, use_wss)
         self._subscription_manager = SubscriptionManager()
         self._offline_requests_manager = OfflineRequestsManager(-1, DropBehaviorTypes.DROP_NEWEST)  # Infinite queue
+        self._callback_executor = CallbackExecutor()
         self._event_consumer = EventConsumer(self._event_cv,
                                              self._event_queue,
                                              self._internal_async_client,
                                              self._subscription_manager,
                                              self._offline_requests_manager,
-                                             self._client_status)
+                                             self._client_status,
+                                             self._callback_executor)
         self._connect_disconnect_timeout_sec = DEFAULT_CONNECT_DISCONNECT_TIMEOUT_SEC
         self._operation_timeout_sec = DEFAULT_OPERATION_TIMEOUT_SEC
         self._init_offline_request_exceptions()
@@ -115,6 +120,9 @@ class MqttCore(object):
     def use_wss(self):
         return self._use_wss
 
+    def get_client_status(self):
+        return self._client_status.get_status()
+
     # Used for general message event reception
     def on_message(self, message):
         pass
@@ -131,6 +139,10 @@ class MqttCore(object):
         self._logger.info("Configuring certificates and ciphers...")
         self._internal_async_client.set_cert_credentials_provider(cert_credentials_provider, ciphers_provider)
 
+    def configure_memory_cert_credentials(self, memory_cert_credentials_provider, ciphers_provider):
+        self._logger.info("Configuring in-memory certificates and ciphers...")
+        self._internal_async_client.set_memory_cert_credentials_provider(memory_cert_credentials_provider, ciphers_provider)
+
     def configure_iam_credentials(self, iam_credentials_provider):
         self._logger.info("Configuring custom IAM credentials...")
         self._internal_async_client.set_iam_credentials_provider(iam_credentials_provider)
@@ -181,15 +193,51 @@ class MqttCore(object):
     def disable_metrics_collection(self):
         self._enable_metrics_collection = False
 
-    def configure_offline_requests_queue(self, max_size, drop_behavior):
-        self._logger.info("Configuring offline requests queueing: max queue size: %d", max_size)
-        self._offline_requests_manager = OfflineRequestsManager(max_size, drop_behavior)
+    def configure_offline_requests_queue(self, max_size, drop_behavior, max_bytes=-1, persistence_dir=None):
+        self._logger.info("Configuring offline requests queueing: max queue size: %d, max queue bytes: %d", max_size, max_bytes)
+        persistence_path = None
+        if persistence_dir:
+            persistence_path = os.path.join(persistence_dir, self._get_persistence_file_name())
+            self._logger.info("Persisting offline publish requests to: %s", persistence_path)
+        self._offline_requests_manager.close()
+        self._offline_requests_manager = OfflineRequestsManager(max_size, drop_behavior, max_bytes, persistence_path)
         self._event_consumer.update_offline_requests_manager(self._offline_requests_manager)
 
+    def _get_persistence_file_name(self):
+        safe_client_id = re.sub(r"[^A-Za-z0-9_.-]", "_", self._client_id or "default")
+        return "offline-requests-%s.sqlite3" % safe_client_id
+
     def configure_draining_interval_sec(self, draining_interval_sec):
         self._logger.info("Configuring offline requests queue draining interval: %f sec", draining_interval_sec)
         self._event_consumer.update_draining_interval_sec(draining_interval_sec)
 
+    def configure_adaptive_draining(self, max_rate_hz, ack_latency_target_sec, max_inflight):
+        self._logger.info("Configuring adaptive draining: max rate: %f requests/sec, ack latency target: %f sec, max inflight: %d",
+                          max_rate_hz, ack_latency_target_sec, max_inflight)
+        self._event_consumer.update_adaptive_draining(max_rate_hz, ack_latency_target_sec, max_inflight)
+
+    def get_draining_metrics(self):
+        return self._event_consumer.get_draining_metrics()
+
+    def configure_callback_executor(self, max_workers, max_queue_size):
+        if max_workers < 1:
+            raise ValueError("Callback executor needs at least one worker.")
+        self._logger.info("Configuring callback executor: max workers: %d, max queue size: %d", max_workers, max_queue_size)
+        self._callback_executor.update_limits(max_workers, max_queue_size)
+
+    def configure_network_reactor(self, network_reactor):
+        self._logger.info("Configuring network reactor...")
+        self._internal_async_client.set_network_reactor(network_reactor)
+
+    def get_callback_executor(self):
+        return self._callback_executor
+
+    def get_callback_executor_metrics(self):
+        return self._callback_executor.get_metrics()
+
+    def get_dispatch_metrics(self):
+        return self._event_consumer.get_dispatch_metrics()
+
     def connect(self, keep_alive_sec):
         self._logger.info("Performing sync connect...")
         event = Event()
@@ -285,6 +333,54 @@ class MqttCore(object):
             rc, mid = self._publish_async(topic, payload, qos, retain, ack_callback)
             return mid
 
+    def publish_batch(self, messages):
+        self._logger.info("Performing batch publish...")
+        results = list()
+        pending_mids = set()
+        acked_mids = set()
+        lock = Lock()
+        event = Event()
+        state = {"all_sent": False}
+
+        def ack_callback(mid, data=None):
+            with lock:
+                acked_mids.add(mid)
+                if state["all_sent"] and pending_mids <= acked_mids:
+                    event.set()
+
+        # Pipeline every request first, then wait for all the PUBACKs together
+        for topic, payload, qos, retain in messages:
+            try:
+                mid = self.publish_async(topic, payload, qos, retain, ack_callback)
+            except Exception as e:
+                self._logger.error("Batch publish error: %s", e)
+                results.append([None, PublishResults.FAILED])
+                continue
+            if FixedEventMids.QUEUED_MID == mid:
+                results.append([None, PublishResults.QUEUED])
+            elif qos > 0:
+                with lock:
+                    pending_mids.add(mid)
+                results.append([mid, PublishResults.TIMEOUT])
+            else:
+                results.append([mid, PublishResults.SENT])
+
+        with lock:
+            state["all_sent"] = True
+            if pending_mids <= acked_mids:
+                event.set()
+        if not event.wait(self._operation_timeout_sec):
+            self._logger.error("Batch publish timed out waiting for %d PUBACK(s)", len(pending_mids - acked_mids))
+
+        with lock:
+            for result in results:
+                if result[0] in pending_mids:
+                    if result[0] in acked_mids:
+                        result[1] = PublishResults.ACKED
+                    else:
+                        self._internal_async_client.remove_event_callback(result[0])
+        return [tuple(result) for result in results]
+
     def _publish_async(self, topic, payload, qos, retain=False, ack_callback=None):
         rc, mid = self._internal_async_client.publish(topic, payload, qos, retain, ack_callback)
         if MQTT_ERR_SUCCESS != rc:
@@ -324,6 +420,33 @@ class MqttCore(object):
             raise subscribeError(rc)
         return rc, mid
 
+    def subscribe_batch(self, topics, qos, message_callback=None):
+        # Subscribes to all the topics with one SUBSCRIBE packet and waits for its SUBACK
+        self._logger.info("Performing sync batch subscribe...")
+        ret = False
+        if ClientStatus.STABLE != self._client_status.get_status():
+            for topic in topics:
+                self._handle_offline_request(RequestTypes.SUBSCRIBE, (topic, qos, message_callback, None))
+        else:
+            event = Event()
+            rc, mid = self._subscribe_batch_async(topics, qos, self._create_blocking_ack_callback(event), message_callback)
+            if not event.wait(self._operation_timeout_sec):
+                self._internal_async_client.remove_event_callback(mid)
+                self._logger.error("Batch subscribe timed out")
+                raise subscribeTimeoutException()
+            ret = True
+        return ret
+
+    def _subscribe_batch_async(self, topics, qos, ack_callback=None, message_callback=None):
+        for topic in topics:
+            # Resubscribing after a reconnect goes topic by topic, the ack callback belongs to this packet only
+            self._subscription_manager.add_record(topic, qos, message_callback, None)
+        rc, mid = self._internal_async_client.subscribe([(topic, qos) for topic in topics], qos, ack_callback)
+        if MQTT_ERR_SUCCESS != rc:
+            self._logger.error("Batch subscribe error: %d", rc)
+            raise subscribeError(rc)
+        return rc, mid
+
     def unsubscribe(self, topic):
         self._logger.info("Performing sync unsubscribe...")
         ret = False
@@ -348,6 +471,21 @@ class MqttCore(object):
             rc, mid = self._unsubscribe_async(topic, ack_callback)
             return mid
 
+    def unsubscribe_batch_async(self, topics, ack_callback=None):
+        # Unsubscribes from all the topics with one UNSUBSCRIBE packet without waiting for its UNSUBACK
+        self._logger.info("Performing async batch unsubscribe...")
+        if ClientStatus.STABLE != self._client_status.get_status():
+            for topic in topics:
+                self._handle_offline_request(RequestTypes.UNSUBSCRIBE, (topic, None))
+            return FixedEventMids.QUEUED_MID
+        for topic in topics:
+            self._subscription_manager.remove_record(topic)
+        rc, mid = self._internal_async_client.unsubscribe(list(topics), ack_callback)
+        if MQTT_ERR_SUCCESS != rc:
+            self._logger.error("Batch unsubscribe error: %d", rc)
+            raise unsubscribeError(rc)
+        return mid
+
     def _unsubscribe_async(self, topic, ack_callback=None):
         self._subscription_manager.remove_record(topic)
         rc, mid = self._internal_async_client.unsubscribe(topic, ack_callback)
@@ -371,3 +509,6 @@ class MqttCore(object):
         if AppendResults.APPEND_FAILURE_QUEUE_FULL == append_result:
             self._logger.error("Offline request queue is full")
             raise self._offline_request_queue_full_exceptions[type]()
+        if AppendResults.APPEND_FAILURE_PERSISTENCE == append_result:
+            self._logger.error("Offline request could not be persisted")
+            raise publishQueuePersistenceException()
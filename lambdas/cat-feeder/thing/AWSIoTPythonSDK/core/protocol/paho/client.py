@@ -17,6 +17,8 @@ This is an MQTT v3.1 client module. MQTT is a lightweight pub/sub messaging
 protocol that is easy to implement and suitable for low powered devices.
 """
 import errno
+import heapq
+import itertools
 import platform
 import random
 import select
@@ -34,6 +36,7 @@ import struct
 import sys
 import threading
 import time
+from collections import OrderedDict
 HAVE_DNS = True
 try:
     import dns.resolver
@@ -48,6 +51,7 @@ else:
 from AWSIoTPythonSDK.core.protocol.connection.cores import ProgressiveBackOffCore
 from AWSIoTPythonSDK.core.protocol.connection.cores import SecuredWebSocketCore
 from AWSIoTPythonSDK.core.protocol.connection.alpn import SSLContextBuilder
+from AWSIoTPythonSDK.core.protocol.connection.ssl_contexts import shared_ssl_context_cache
 
 VERSION_MAJOR=1
 VERSION_MINOR=0
@@ -137,6 +141,16 @@ MQTT_ERR_ERRNO = 14
 MSG_QUEUEING_DROP_OLDEST = 0
 MSG_QUEUEING_DROP_NEWEST = 1
 
+# Payloads up to this size are copied next to their PUBLISH header, larger ones are written from the caller's buffer
+PUBLISH_INLINE_PAYLOAD_BYTES = 1024
+# Most buffers handed to a single sendmsg() call, well below IOV_MAX on every platform
+MAX_WRITE_BUFFERS = 64
+# Most bytes coalesced into a single write on TLS/WebSocket connections, which have no scatter/gather write
+MAX_COALESCED_WRITE_BYTES = 65536
+TOPIC_HEADER_CACHE_SIZE = 256
+# Initial size of the receive buffer, it grows to fit the largest packet seen on the connection
+IN_BUFFER_SIZE = 65536
+
 if sys.version_info[0] < 3:
     sockpair_data = "0"
 else:
@@ -449,23 +463,25 @@ class Client(object):
         self._password = ""
         self._in_packet = {
             "command": 0,
-            "have_remaining": 0,
-            "remaining_count": [],
-            "remaining_mult": 1,
             "remaining_length": 0,
-            "packet": b"",
-            "to_process": 0,
-            "pos": 0}
+            "packet": b""}
+        self._in_buffer = bytearray(IN_BUFFER_SIZE)
+        self._in_buffer_start = 0
+        self._in_buffer_end = 0
         self._out_packet = []
         self._current_out_packet = None
+        self._topic_headers = dict()
         self._last_msg_in = time.time()
         self._last_msg_out = time.time()
         self._ping_t = 0
         self._last_mid = 0
         self._state = mqtt_cs_new
         self._max_inflight_messages = 20
-        self._out_messages = []
-        self._in_messages = []
+        self._out_messages = OrderedDict()
+        self._in_messages = OrderedDict()
+        self._out_retry_heap = []
+        self._in_retry_heap = []
+        self._retry_seq = itertools.count()
         self._inflight_messages = 0
         self._will = False
         self._will_topic = ""
@@ -499,12 +515,17 @@ class Client(object):
         self._tls_certfile = None
         self._tls_keyfile = None
         self._tls_ca_certs = None
+        self._tls_ca_data = None
+        self._tls_cert_data = None
+        self._tls_key_data = None
+        self._ssl_context_cache = shared_ssl_context_cache
         self._tls_cert_reqs = None
         self._tls_ciphers = None
         self._tls_version = tls_version
         self._tls_insecure = False
         self._useSecuredWebsocket = useSecuredWebsocket  # Do we enable secured websocket
         self._backoffCore = ProgressiveBackOffCore()  # Init the backoffCore using default configuration
+        self._stable_connection_timer_enabled = True
         self._AWSAccessKeyIDCustomConfig = ""
         self._AWSSecretAccessKeyCustomConfig = ""
         self._AWSSessionTokenCustomConfig = ""
@@ -626,12 +647,39 @@ class Client(object):
                 f.close()
 
         self._tls_ca_certs = ca_certs
+        self._tls_ca_data = None
         self._tls_certfile = certfile
         self._tls_keyfile = keyfile
         self._tls_cert_reqs = cert_reqs
         self._tls_version = tls_version
         self._tls_ciphers = ciphers
 
+    def tls_set_data(self, ca_data, cert_data=None, key_data=None, cert_reqs=cert_reqs, ciphers=None, ssl_context_cache=None):
+        """Configure network encryption and authentication options from
+        in-memory PEM strings instead of file paths. Enables SSL/TLS support.
+
+        ca_data, cert_data and key_data are the PEM encoded CA certificate(s),
+        client certificate and client private key. The SSLContext built from
+        them is taken from ssl_context_cache (the process wide shared cache by
+        default), so reconnects and other clients using the same credentials
+        do not reload them.
+
+        Must be called before connect() or connect_async()."""
+        if HAVE_SSL is False:
+            raise ValueError('This platform has no SSL/TLS.')
+
+        if ca_data is None:
+            raise ValueError('ca_data must not be None.')
+
+        self._tls_ca_certs = None
+        self._tls_ca_data = ca_data
+        self._tls_cert_data = cert_data
+        self._tls_key_data = key_data
+        self._tls_cert_reqs = cert_reqs
+        self._tls_ciphers = ciphers
+        if ssl_context_cache is not None:
+            self._ssl_context_cache = ssl_context_cache
+
     def tls_insecure_set(self, value):
         """Configure verification of the server hostname in the server certificate.
 
@@ -744,13 +792,10 @@ class Client(object):
 
         self._in_packet = {
             "command": 0,
-            "have_remaining": 0,
-            "remaining_count": [],
-            "remaining_mult": 1,
             "remaining_length": 0,
-            "packet": b"",
-            "to_process": 0,
-            "pos": 0}
+            "packet": b""}
+        self._in_buffer_start = 0
+        self._in_buffer_end = 0
 
         self._out_packet_mutex.acquire()
         self._out_packet = []
@@ -793,7 +838,21 @@ class Client(object):
 
         verify_hostname = self._tls_insecure is False  # Decide whether we need to verify hostname
 
-        if self._tls_ca_certs is not None:
+        if self._tls_ca_data is not None:
+            ssl_context = self._ssl_context_cache.get_context(self._tls_ca_data,
+                                                              self._tls_cert_data,
+                                                              self._tls_key_data,
+                                                              self._tls_cert_reqs,
+                                                              self._tls_ciphers,
+                                                              None if self._useSecuredWebsocket else self._alpn_protocols)
+            if self._useSecuredWebsocket:
+                rawSSL = ssl_context.wrap_socket(sock, server_hostname=self._host)
+                rawSSL.setblocking(0)  # Non-blocking socket
+                self._ssl = SecuredWebSocketCore(rawSSL, self._host, self._port, self._AWSAccessKeyIDCustomConfig, self._AWSSecretAccessKeyCustomConfig, self._AWSSessionTokenCustomConfig)  # Override the _ssl socket
+            else:
+                self._ssl = ssl_context.wrap_socket(sock, server_hostname=self._host, do_handshake_on_connect=False)
+                self._ssl.do_handshake()  # Hostname is verified by the SSLContext during the handshake
+        elif self._tls_ca_certs is not None:
             if self._useSecuredWebsocket:
                 # Never assign to ._ssl before wss handshake is finished
                 # Non-None value for ._ssl will allow ops before wss-MQTT connection is established
@@ -878,9 +937,7 @@ class Client(object):
         self._current_out_packet_mutex.release()
 
         # used to check if there are any bytes left in the ssl socket
-        pending_bytes = 0
-        if self._ssl:
-            pending_bytes = self.socket().pending()
+        pending_bytes = self.data_pending()
 
         # if bytes are pending do not wait in select
         if pending_bytes > 0:
@@ -955,6 +1012,10 @@ class Client(object):
             raise ValueError('Invalid QoS level.')
         if isinstance(payload, str) or isinstance(payload, bytearray):
             local_payload = payload
+        elif sys.version_info[0] >= 3 and isinstance(payload, bytes):
+            local_payload = payload
+        elif sys.version_info[0] >= 3 and isinstance(payload, memoryview):
+            local_payload = payload.cast('B')  # Count bytes, not items
         elif sys.version_info[0] < 3 and isinstance(payload, unicode):
             local_payload = payload
         elif isinstance(payload, int) or isinstance(payload, float):
@@ -962,7 +1023,7 @@ class Client(object):
         elif payload is None:
             local_payload = None
         else:
-            raise TypeError('payload must be a string, bytearray, int, float or None.')
+            raise TypeError('payload must be a string, bytes, bytearray, memoryview, int, float or None.')
 
         if local_payload is not None and len(local_payload) > 268435455:
             raise ValueError('Payload too large.')
@@ -991,7 +1052,8 @@ class Client(object):
             message.dup = False
 
             self._out_message_mutex.acquire()                
-            self._out_messages.append(message)
+            self._out_messages[message.mid] = message
+            self._message_retry_schedule(self._out_messages, self._out_retry_heap, message)
             if self._max_inflight_messages == 0 or self._inflight_messages < self._max_inflight_messages:
                 self._inflight_messages = self._inflight_messages+1
                 if qos == 1:
@@ -1033,6 +1095,46 @@ class Client(object):
         socket_factory: create_connection function which creates a socket to user's specification
         """
         self._socket_factory = socket_factory
+
+    def stable_connection_timer_set(self, enabled):
+        """Enable or disable the timer thread that resets the reconnect backoff
+        time once a connection has been stable. Disable it when reconnects are
+        not driven by loop_forever(), e.g. when the client is run from an event
+        loop that keeps track of connection stability itself.
+        """
+        self._stable_connection_timer_enabled = enabled
+
+    def reconnect_delay_get(self, connected_sec):
+        """Return the time in seconds to wait before trying to reconnect after
+        a connection that lasted connected_sec has been lost, and advance the
+        progressive backoff. For use instead of the blocking backoff in
+        loop_forever() together with stable_connection_timer_set(False).
+        """
+        self._backoffCore.resetIfStable(connected_sec)
+        return self._backoffCore.nextBackOffTimeSecond()
+
+    def want_reconnect(self):
+        """Call to determine if a connection that has been lost should be
+        re-established, that is if disconnect() has not been called."""
+        self._state_mutex.acquire()
+        want = self._state != mqtt_cs_disconnecting
+        self._state_mutex.release()
+        return want
+
+    def wakeup_socket(self):
+        """Return the socket that becomes readable whenever a packet has been
+        queued for writing. Watch it alongside socket() to know when to call
+        loop_write() when not using loop()."""
+        return self._sockpairR
+
+    def loop_thread_set(self, thread):
+        """Hand the network loop of this client over to thread, which calls
+        loop_read(), loop_write() and loop_misc() on its behalf, e.g. a reactor
+        serving many clients. Like with loop_start(), publish() and the other
+        requests then only queue their packets and leave writing them to that
+        thread. Pass None to hand the loop back.
+        """
+        self._thread = thread
         
     def disconnect(self):
         """Disconnect a connected client from the broker."""
@@ -1207,6 +1309,15 @@ class Client(object):
                 return MQTT_ERR_SUCCESS
         return MQTT_ERR_SUCCESS
 
+    def data_pending(self):
+        """Return the number of received bytes buffered by TLS or the websocket
+        layer. They can be read without the socket becoming readable again, so
+        callers doing their own select() should call loop_read() while this is
+        above zero."""
+        if self._ssl:
+            return self._ssl.pending()
+        return 0
+
     def want_write(self):
         """Call to determine if there is network data waiting to be written.
         Useful if you are calling select() yourself rather than using loop().
@@ -1496,119 +1607,125 @@ class Client(object):
 
     def _packet_read(self):
         # This gets called if pselect() indicates that there is network data
-        # available - ie. at least one byte.  What we do depends on what data we
-        # already have.
-        # If we've not got a command, attempt to read one and save it. This should
-        # always work because it's only a single byte.
-        # Then try to read the remaining length. This may fail because it is may
-        # be more than one byte - will need to save data pending next read if it
-        # does fail.
-        # Then try to read the remaining payload, where 'payload' here means the
-        # combined variable header and actual payload. This is the most likely to
-        # fail due to longer length, so save current data and current position.
-        # After all data is read, send to _mqtt_handle_packet() to deal with.
-        # Finally, free the memory and reset everything to starting conditions.
-        if self._in_packet['command'] == 0:
-            try:
-                if self._ssl:
-                    command = self._ssl.read(1)
-                else:
-                    command = self._sock.recv(1)
-            except socket.error as err:
-                if self._ssl and (err.errno == ssl.SSL_ERROR_WANT_READ or err.errno == ssl.SSL_ERROR_WANT_WRITE):
-                    return MQTT_ERR_AGAIN
-                if err.errno == EAGAIN:
-                    return MQTT_ERR_AGAIN
-                print(err)
-                return 1
-            else:
-                if len(command) == 0:
-                    return 1
-                command = struct.unpack("!B", command)
-                self._in_packet['command'] = command[0]
-
-        if self._in_packet['have_remaining'] == 0:
-            # Read remaining
-            # Algorithm for decoding taken from pseudo code at
-            # http://publib.boulder.ibm.com/infocenter/wmbhelp/v6r0m0/topic/com.ibm.etools.mft.doc/ac10870_.htm
-            while True:
-                try:
-                    if self._ssl:
-                        byte = self._ssl.read(1)
-                    else:
-                        byte = self._sock.recv(1)
-                except socket.error as err:
-                    if self._ssl and (err.errno == ssl.SSL_ERROR_WANT_READ or err.errno == ssl.SSL_ERROR_WANT_WRITE):
-                        return MQTT_ERR_AGAIN
-                    if err.errno == EAGAIN:
-                        return MQTT_ERR_AGAIN
-                    print(err)
-                    return 1
-                else:
-                    byte = struct.unpack("!B", byte)
-                    byte = byte[0]
-                    self._in_packet['remaining_count'].append(byte)
-                    # Max 4 bytes length for remaining length as defined by protocol.
-                     # Anything more likely means a broken/malicious client.
-                    if len(self._in_packet['remaining_count']) > 4:
-                        return MQTT_ERR_PROTOCOL
-
-                    self._in_packet['remaining_length'] = self._in_packet['remaining_length'] + (byte & 127)*self._in_packet['remaining_mult']
-                    self._in_packet['remaining_mult'] = self._in_packet['remaining_mult'] * 128
-
-                if (byte & 128) == 0:
-                    break
+        # available - ie. at least one byte.
+        # Incoming data is read in chunks into a reusable receive buffer and
+        # every complete packet in it is framed and handed to
+        # _packet_handle(), with the packet body as a memoryview on the
+        # buffer. An incomplete packet is left at the start of the buffer
+        # until the next read completes it.
+        rc = self._in_buffer_fill()
+        if rc != MQTT_ERR_SUCCESS:
+            return rc
 
-            self._in_packet['have_remaining'] = 1
-            self._in_packet['to_process'] = self._in_packet['remaining_length']
+        return self._in_buffer_handle()
 
-        while self._in_packet['to_process'] > 0:
-            try:
-                if self._ssl:
-                    data = self._ssl.read(self._in_packet['to_process'])
-                else:
-                    data = self._sock.recv(self._in_packet['to_process'])
-            except socket.error as err:
-                if self._ssl and (err.errno == ssl.SSL_ERROR_WANT_READ or err.errno == ssl.SSL_ERROR_WANT_WRITE):
-                    return MQTT_ERR_AGAIN
-                if err.errno == EAGAIN:
-                    return MQTT_ERR_AGAIN
-                print(err)
-                return 1
+    def _in_buffer_fill(self):
+        size = len(self._in_buffer) - self._in_buffer_end
+
+        try:
+            # The websocket core decodes wss frames and hands out their MQTT bytes the same way
+            view = memoryview(self._in_buffer)[self._in_buffer_end:]
+            if self._ssl:
+                count = self._ssl.recv_into(view, size)
             else:
-                self._in_packet['to_process'] = self._in_packet['to_process'] - len(data)
-                self._in_packet['packet'] = self._in_packet['packet'] + data
-
-        # All data for this packet is read.
-        self._in_packet['pos'] = 0
-        rc = self._packet_handle()
-
-        # Free data and reset values
-        self._in_packet = dict(
-            command=0,
-            have_remaining=0,
-            remaining_count=[],
-            remaining_mult=1,
-            remaining_length=0,
-            packet=b"",
-            to_process=0,
-            pos=0)
+                count = self._sock.recv_into(view, size)
+        except socket.error as err:
+            if self._ssl and (err.errno == ssl.SSL_ERROR_WANT_READ or err.errno == ssl.SSL_ERROR_WANT_WRITE):
+                return MQTT_ERR_AGAIN
+            if err.errno == EAGAIN:
+                return MQTT_ERR_AGAIN
+            print(err)
+            return 1
+
+        if count == 0:
+            return 1
+        self._in_buffer_end = self._in_buffer_end + count
+        return MQTT_ERR_SUCCESS
 
-        self._msgtime_mutex.acquire()
-        self._last_msg_in = time.time()
-        self._msgtime_mutex.release()
+    def _in_buffer_decode_remaining_length(self):
+        # Algorithm for decoding taken from pseudo code at
+        # http://publib.boulder.ibm.com/infocenter/wmbhelp/v6r0m0/topic/com.ibm.etools.mft.doc/ac10870_.htm
+        # Returns the remaining length and the size of the fixed header, or
+        # (None, None) if the remaining length has not been fully read yet.
+        buf = self._in_buffer
+        pos = self._in_buffer_start + 1
+        remaining_length = 0
+        remaining_mult = 1
+        while pos < self._in_buffer_end:
+            byte = buf[pos]
+            pos = pos + 1
+            remaining_length = remaining_length + (byte & 127)*remaining_mult
+            remaining_mult = remaining_mult * 128
+            if (byte & 128) == 0:
+                return (remaining_length, pos - self._in_buffer_start)
+            # Max 4 bytes length for remaining length as defined by protocol.
+            # Anything more likely means a broken/malicious client.
+            if pos - self._in_buffer_start > 4:
+                return (-1, None)
+        return (None, None)
+
+    def _in_buffer_handle(self):
+        rc = MQTT_ERR_SUCCESS
+        handled = False
+        while self._in_buffer_end - self._in_buffer_start >= 2:
+            (remaining_length, header_length) = self._in_buffer_decode_remaining_length()
+            if remaining_length is None:
+                break
+            if header_length is None:
+                return MQTT_ERR_PROTOCOL
+
+            start = self._in_buffer_start
+            end = start + header_length + remaining_length
+            if end > self._in_buffer_end:
+                if header_length + remaining_length > len(self._in_buffer):
+                    self._in_buffer_grow(header_length + remaining_length)
+                break
+
+            view = memoryview(self._in_buffer)
+            self._in_packet = {
+                "command": self._in_buffer[start],
+                "remaining_length": remaining_length,
+                "packet": view[start + header_length:end]}
+            self._in_buffer_start = end
+            handled = True
+
+            # Handlers must not hold on to the view, the buffer is reused by the next read
+            rc = self._packet_handle()
+            if rc != MQTT_ERR_SUCCESS:
+                break
+
+        self._in_buffer_compact()
+
+        if handled:
+            self._msgtime_mutex.acquire()
+            self._last_msg_in = time.time()
+            self._msgtime_mutex.release()
         return rc
 
+    def _in_buffer_compact(self):
+        if self._in_buffer_start == self._in_buffer_end:
+            self._in_buffer_start = 0
+            self._in_buffer_end = 0
+        elif self._in_buffer_start > 0:
+            # Move the incomplete packet to the front to make room for the rest of it
+            pending = self._in_buffer_end - self._in_buffer_start
+            self._in_buffer[0:pending] = self._in_buffer[self._in_buffer_start:self._in_buffer_end]
+            self._in_buffer_start = 0
+            self._in_buffer_end = pending
+
+    def _in_buffer_grow(self, packet_length):
+        pending = self._in_buffer_end - self._in_buffer_start
+        in_buffer = bytearray(max(packet_length, 2*len(self._in_buffer)))
+        in_buffer[0:pending] = self._in_buffer[self._in_buffer_start:self._in_buffer_end]
+        self._in_buffer = in_buffer
+        self._in_buffer_start = 0
+        self._in_buffer_end = pending
+
     def _packet_write(self):
         self._current_out_packet_mutex.acquire()
         while self._current_out_packet:
-            packet = self._current_out_packet
-
             try:
-                if self._ssl:
-                    write_length = self._ssl.write(packet['packet'][packet['pos']:])
-                else:
-                    write_length = self._sock.send(packet['packet'][packet['pos']:])
+                write_length = self._write_out_packets()
             except AttributeError:
                 self._current_out_packet_mutex.release()
                 return MQTT_ERR_SUCCESS
@@ -1621,9 +1738,10 @@ class Client(object):
                 print(err)
                 return 1
 
-            if write_length > 0:
-                packet['to_process'] = packet['to_process'] - write_length
-                packet['pos'] = packet['pos'] + write_length
+            # A single write may have completed several queued packets
+            while write_length > 0:
+                packet = self._current_out_packet
+                write_length -= self._consume_out_packet(packet, write_length)
 
                 if packet['to_process'] == 0:
                     if (packet['command'] & 0xF0) == PUBLISH and packet['qos'] == 0:
@@ -1663,8 +1781,6 @@ class Client(object):
                     else:
                         self._current_out_packet = None
                     self._out_packet_mutex.release()
-            else:
-                pass  # FIXME
 
         self._current_out_packet_mutex.release()
 
@@ -1673,6 +1789,48 @@ class Client(object):
         self._msgtime_mutex.release()
         return MQTT_ERR_SUCCESS
 
+    def _write_out_packets(self):
+        # Hand the current packet and as many queued ones as possible to a single socket call
+        if self._ssl:
+            # SSL sockets cannot scatter/gather, so small packets are coalesced into one write (and one TLS record).
+            # A write that could not complete is retried with at least the same leading bytes, as OpenSSL requires.
+            buffers = self._gather_out_buffers(MAX_COALESCED_WRITE_BYTES)
+            return self._ssl.write(buffers[0] if len(buffers) == 1 else b"".join(buffers))
+        if hasattr(self._sock, "sendmsg"):
+            return self._sock.sendmsg(self._gather_out_buffers(None))
+        return self._sock.send(self._current_out_packet['buffers'][0])
+
+    def _gather_out_buffers(self, max_bytes):
+        buffers = []
+        total = 0
+        self._out_packet_mutex.acquire()
+        try:
+            for packet in itertools.chain((self._current_out_packet,), self._out_packet):
+                for buffer in packet['buffers']:
+                    if buffers and (len(buffers) >= MAX_WRITE_BUFFERS or (max_bytes is not None and total + len(buffer) > max_bytes)):
+                        return buffers
+                    buffers.append(buffer)
+                    total += len(buffer)
+        finally:
+            self._out_packet_mutex.release()
+        return buffers
+
+    def _consume_out_packet(self, packet, write_length):
+        # Drop the written bytes from the front of the packet without copying, returns how many belonged to it
+        buffers = packet['buffers']
+        consumed = 0
+        while buffers and consumed < write_length:
+            buffer = buffers[0]
+            length = min(len(buffer), write_length - consumed)
+            if length == len(buffer):
+                buffers.pop(0)
+            else:
+                buffers[0] = buffer[length:]
+            consumed += length
+        packet['to_process'] = packet['to_process'] - consumed
+        packet['pos'] = packet['pos'] + consumed
+        return consumed
+
     def _easy_log(self, level, buf):
         if self.on_log:
             self.on_log(self, self._userdata, level, buf)
@@ -1753,7 +1911,7 @@ class Client(object):
                 byte = byte | 0x80
 
             remaining_bytes.append(byte)
-            packet.extend(struct.pack("!B", byte))
+            packet.append(byte)
             if remaining_length == 0:
                 # FIXME - this doesn't deal with incorrectly large payloads
                 return packet
@@ -1788,51 +1946,60 @@ class Client(object):
         if self._sock is None and self._ssl is None:
             return MQTT_ERR_NO_CONN
 
-        utopic = topic.encode('utf-8')
         command = PUBLISH | ((dup&0x1)<<3) | (qos<<1) | retain
-        packet = bytearray()
-        packet.extend(struct.pack("!B", command))
+        topic_header = self._get_topic_header(topic)
         if payload is None:
-            remaining_length = 2+len(utopic)
-            self._easy_log(MQTT_LOG_DEBUG, "Sending PUBLISH (d"+str(dup)+", q"+str(qos)+", r"+str(int(retain))+", m"+str(mid)+", '"+topic+"' (NULL payload)")
+            upayload = None
+            payloadlen = 0
+            if self.on_log:
+                self._easy_log(MQTT_LOG_DEBUG, "Sending PUBLISH (d"+str(dup)+", q"+str(qos)+", r"+str(int(retain))+", m"+str(mid)+", '"+topic+"' (NULL payload)")
         else:
-            if isinstance(payload, str):
+            if isinstance(payload, bytearray) or isinstance(payload, bytes) or isinstance(payload, memoryview):
+                upayload = payload
+            elif isinstance(payload, str) or (sys.version_info[0] < 3 and isinstance(payload, unicode)):
                 upayload = payload.encode('utf-8')
-                payloadlen = len(upayload)
-            elif isinstance(payload, bytearray):
-                payloadlen = len(payload)
-            elif isinstance(payload, unicode):
-                upayload = payload.encode('utf-8')
-                payloadlen = len(upayload)
-
-            remaining_length = 2+len(utopic) + payloadlen
-            self._easy_log(MQTT_LOG_DEBUG, "Sending PUBLISH (d"+str(dup)+", q"+str(qos)+", r"+str(int(retain))+", m"+str(mid)+", '"+topic+"', ... ("+str(payloadlen)+" bytes)")
+            else:
+                raise TypeError('payload must be a string, unicode, bytes, bytearray or memoryview.')
+            payloadlen = len(upayload)
+            if self.on_log:  # Skip building the message on the publish hot path when nobody listens
+                self._easy_log(MQTT_LOG_DEBUG, "Sending PUBLISH (d"+str(dup)+", q"+str(qos)+", r"+str(int(retain))+", m"+str(mid)+", '"+topic+"', ... ("+str(payloadlen)+" bytes)")
 
+        remaining_length = len(topic_header) + payloadlen
         if qos > 0:
             # For message id
             remaining_length = remaining_length + 2
 
+        packet = bytearray()
+        packet.append(command)
         self._pack_remaining_length(packet, remaining_length)
-        self._pack_str16(packet, topic)
+        packet.extend(topic_header)
 
         if qos > 0:
             # For message id
             packet.extend(struct.pack("!H", mid))
 
-        if payload is not None:
-            if isinstance(payload, str):
-                pack_format = str(payloadlen) + "s"
-                packet.extend(struct.pack(pack_format, upayload))
-            elif isinstance(payload, bytearray):
-                packet.extend(payload)
-            elif isinstance(payload, unicode):
-                pack_format = str(payloadlen) + "s"
-                packet.extend(struct.pack(pack_format, upayload))
-            else:
-                raise TypeError('payload must be a string, unicode or a bytearray.')
-
+        # Large payloads are queued as a second buffer instead of being copied into the packet. Only immutable bytes
+        # are queued as they are, the caller may still resize or modify a bytearray or memoryview while it is queued.
+        if payloadlen > PUBLISH_INLINE_PAYLOAD_BYTES:
+            if not isinstance(upayload, bytes):
+                upayload = bytes(upayload)
+            return self._packet_queue(PUBLISH, packet, mid, qos, upayload)
+        if payloadlen > 0:
+            packet.extend(upayload)
         return self._packet_queue(PUBLISH, packet, mid, qos)
 
+    def _get_topic_header(self, topic):
+        # Length-prefixed UTF-8 topic, reused across publishes to the same topic
+        topic_header = self._topic_headers.get(topic)
+        if topic_header is None:
+            topic_header = bytearray()
+            self._pack_str16(topic_header, topic)
+            topic_header = bytes(topic_header)
+            if len(self._topic_headers) >= TOPIC_HEADER_CACHE_SIZE:
+                self._topic_headers.clear()
+            self._topic_headers[topic] = topic_header
+        return topic_header
+
     def _send_pubrec(self, mid):
         self._easy_log(MQTT_LOG_DEBUG, "Sending PUBREC (Mid: "+str(mid)+")")
         return self._send_command_with_mid(PUBREC, mid, False)
@@ -1942,33 +2109,62 @@ class Client(object):
             self._pack_str16(packet, t)
         return (self._packet_queue(command, packet, local_mid, 1), local_mid)
 
-    def _message_retry_check_actual(self, messages, mutex):
+    def _message_retry_schedule(self, messages, retry_heap, message):
+        # Dont lock message_mutex here
+        # Entries of completed messages are dropped lazily when they come up,
+        # rebuild the heap once they outnumber the live messages.
+        if len(retry_heap) > 2*len(messages) + 64:
+            self._message_retry_reschedule(messages, retry_heap)
+            if messages.get(message.mid) is message:
+                # Already added to messages by the caller, so the rebuilt heap holds it
+                return
+        heapq.heappush(retry_heap, (message.timestamp, next(self._retry_seq), message))
+
+    def _message_retry_reschedule(self, messages, retry_heap):
+        # Dont lock message_mutex here
+        retry_heap[:] = [(m.timestamp, next(self._retry_seq), m) for m in messages.values()]
+        heapq.heapify(retry_heap)
+
+    def _message_retry_check_actual(self, messages, retry_heap, mutex):
+        # The heap is ordered by the timestamp a message was last sent at, so
+        # only the messages whose retry is due are looked at.
         mutex.acquire()
         now = time.time()
-        for m in messages:
-            if m.timestamp + self._message_retry < now:
-                if m.state == mqtt_ms_wait_for_puback or m.state == mqtt_ms_wait_for_pubrec:
-                    m.timestamp = now
-                    m.dup = True
-                    self._send_publish(m.mid, m.topic, m.payload, m.qos, m.retain, m.dup)
-                elif m.state == mqtt_ms_wait_for_pubrel:
-                    m.timestamp = now
-                    m.dup = True
-                    self._send_pubrec(m.mid)
-                elif m.state == mqtt_ms_wait_for_pubcomp:
-                    m.timestamp = now
-                    m.dup = True
-                    self._send_pubrel(m.mid, True)
+        while retry_heap and retry_heap[0][0] + self._message_retry < now:
+            (timestamp, _, m) = heapq.heappop(retry_heap)
+            if messages.get(m.mid) is not m:
+                # Already completed
+                continue
+            if m.timestamp > timestamp:
+                # Sent again since it was scheduled
+                heapq.heappush(retry_heap, (m.timestamp, next(self._retry_seq), m))
+                continue
+
+            if m.state == mqtt_ms_wait_for_puback or m.state == mqtt_ms_wait_for_pubrec:
+                m.timestamp = now
+                m.dup = True
+                self._send_publish(m.mid, m.topic, m.payload, m.qos, m.retain, m.dup)
+            elif m.state == mqtt_ms_wait_for_pubrel:
+                m.timestamp = now
+                m.dup = True
+                self._send_pubrec(m.mid)
+            elif m.state == mqtt_ms_wait_for_pubcomp:
+                m.timestamp = now
+                m.dup = True
+                self._send_pubrel(m.mid, True)
+            # Messages that are not waiting for an acknowledgement are checked
+            # again one retry interval later.
+            heapq.heappush(retry_heap, (now, next(self._retry_seq), m))
         mutex.release()
 
     def _message_retry_check(self):
-        self._message_retry_check_actual(self._out_messages, self._out_message_mutex)
-        self._message_retry_check_actual(self._in_messages, self._in_message_mutex)
+        self._message_retry_check_actual(self._out_messages, self._out_retry_heap, self._out_message_mutex)
+        self._message_retry_check_actual(self._in_messages, self._in_retry_heap, self._in_message_mutex)
 
     def _messages_reconnect_reset_out(self):
         self._out_message_mutex.acquire()
         self._inflight_messages = 0
-        for m in self._out_messages:
+        for m in self._out_messages.values():
             m.timestamp = 0
             if self._max_inflight_messages == 0 or self._inflight_messages < self._max_inflight_messages:
                 if m.qos == 0:
@@ -1989,31 +2185,36 @@ class Client(object):
                         m.state = mqtt_ms_publish
             else:
                 m.state = mqtt_ms_queued
+        self._message_retry_reschedule(self._out_messages, self._out_retry_heap)
         self._out_message_mutex.release()
 
     def _messages_reconnect_reset_in(self):
         self._in_message_mutex.acquire()
-        for m in self._in_messages:
+        for m in list(self._in_messages.values()):
             m.timestamp = 0
             if m.qos != 2:
-                self._in_messages.pop(self._in_messages.index(m))
+                del self._in_messages[m.mid]
             else:
                 # Preserve current state
                 pass
+        self._message_retry_reschedule(self._in_messages, self._in_retry_heap)
         self._in_message_mutex.release()
 
     def _messages_reconnect_reset(self):
         self._messages_reconnect_reset_out()
         self._messages_reconnect_reset_in()
 
-    def _packet_queue(self, command, packet, mid, qos):
+    def _packet_queue(self, command, packet, mid, qos, payload=None):
+        buffers = [memoryview(packet)]
+        if payload is not None:
+            buffers.append(memoryview(payload))
         mpkt = dict(
             command = command,
             mid = mid,
             qos = qos,
             pos = 0,
-            to_process = len(packet),
-            packet = packet)
+            to_process = sum(len(buffer) for buffer in buffers),
+            buffers = buffers)
 
         self._out_packet_mutex.acquire()
         self._out_packet.append(mpkt)
@@ -2119,12 +2320,13 @@ class Client(object):
         self._callback_mutex.release()
 
         # Start counting for stable connection
-        self._backoffCore.startStableConnectionTimer()
+        if self._stable_connection_timer_enabled:
+            self._backoffCore.startStableConnectionTimer()
 
         if result == 0:
             rc = 0
             self._out_message_mutex.acquire()
-            for m in self._out_messages:
+            for m in self._out_messages.values():
                 m.timestamp = time.time()
                 if m.state == mqtt_ms_queued:
                     self.loop_write()  # Process outgoing messages that have just been queued up
@@ -2200,22 +2402,24 @@ class Client(object):
         message.qos = (header & 0x06)>>1
         message.retain = (header & 0x01)
 
-        pack_format = "!H" + str(len(self._in_packet['packet'])-2) + 's'
-        (slen, packet) = struct.unpack(pack_format, self._in_packet['packet'])
-        pack_format = '!' + str(slen) + 's' + str(len(packet)-slen) + 's'
-        (message.topic, packet) = struct.unpack(pack_format, packet)
+        packet = self._in_packet['packet']
+        (slen,) = struct.unpack_from("!H", packet)
+        pos = 2 + slen
+        message.topic = packet[2:pos].tobytes()
 
-        if len(message.topic) == 0:
+        if len(message.topic) == 0 or pos > len(packet):
             return MQTT_ERR_PROTOCOL
 
         if sys.version_info[0] >= 3:
             message.topic = message.topic.decode('utf-8')
 
         if message.qos > 0:
-            pack_format = "!H" + str(len(packet)-2) + 's'
-            (message.mid, packet) = struct.unpack(pack_format, packet)
+            (message.mid,) = struct.unpack_from("!H", packet, pos)
+            pos = pos + 2
 
-        message.payload = packet
+        # The packet is a view on the receive buffer, so the payload is copied
+        # out once here as it outlives the next read.
+        message.payload = packet[pos:].tobytes()
 
         self._easy_log(
             MQTT_LOG_DEBUG,
@@ -2236,7 +2440,8 @@ class Client(object):
             rc = self._send_pubrec(message.mid)
             message.state = mqtt_ms_wait_for_pubrel
             self._in_message_mutex.acquire()
-            self._in_messages.append(message)
+            self._in_messages[message.mid] = message
+            self._message_retry_schedule(self._in_messages, self._in_retry_heap, message)
             self._in_message_mutex.release()
             return rc
         else:
@@ -2255,31 +2460,29 @@ class Client(object):
         self._easy_log(MQTT_LOG_DEBUG, "Received PUBREL (Mid: "+str(mid)+")")
 
         self._in_message_mutex.acquire()
-        for i in range(len(self._in_messages)):
-            if self._in_messages[i].mid == mid:
-
-                # Only pass the message on if we have removed it from the queue - this
-                # prevents multiple callbacks for the same message.
-                self._handle_on_message(self._in_messages[i])
-                self._in_messages.pop(i)
-                self._inflight_messages = self._inflight_messages - 1
-                if self._max_inflight_messages > 0:
-                    self._out_message_mutex.acquire()
-                    rc = self._update_inflight()
-                    self._out_message_mutex.release()
-                    if rc != MQTT_ERR_SUCCESS:
-                        self._in_message_mutex.release()
-                        return rc
+        message = self._in_messages.pop(mid, None)
+        if message is not None:
+            # Only pass the message on if we have removed it from the queue - this
+            # prevents multiple callbacks for the same message.
+            self._handle_on_message(message)
+            self._inflight_messages = self._inflight_messages - 1
+            if self._max_inflight_messages > 0:
+                self._out_message_mutex.acquire()
+                rc = self._update_inflight()
+                self._out_message_mutex.release()
+                if rc != MQTT_ERR_SUCCESS:
+                    self._in_message_mutex.release()
+                    return rc
 
-                self._in_message_mutex.release()
-                return self._send_pubcomp(mid)
+            self._in_message_mutex.release()
+            return self._send_pubcomp(mid)
 
         self._in_message_mutex.release()
         return MQTT_ERR_SUCCESS
 
     def _update_inflight(self):
         # Dont lock message_mutex here
-        for m in self._out_messages:
+        for m in self._out_messages.values():
             if self._inflight_messages < self._max_inflight_messages:
                 if m.qos > 0 and m.state == mqtt_ms_queued:
                     self._inflight_messages = self._inflight_messages + 1
@@ -2304,12 +2507,12 @@ class Client(object):
         self._easy_log(MQTT_LOG_DEBUG, "Received PUBREC (Mid: "+str(mid)+")")
 
         self._out_message_mutex.acquire()
-        for m in self._out_messages:
-            if m.mid == mid:
-                m.state = mqtt_ms_wait_for_pubcomp
-                m.timestamp = time.time()
-                self._out_message_mutex.release()
-                return self._send_pubrel(mid, False)
+        m = self._out_messages.get(mid)
+        if m is not None:
+            m.state = mqtt_ms_wait_for_pubcomp
+            m.timestamp = time.time()
+            self._out_message_mutex.release()
+            return self._send_pubrel(mid, False)
 
         self._out_message_mutex.release()
         return MQTT_ERR_SUCCESS
@@ -2340,32 +2543,24 @@ class Client(object):
         self._easy_log(MQTT_LOG_DEBUG, "Received "+cmd+" (Mid: "+str(mid)+")")
 
         self._out_message_mutex.acquire()
-        for i in range(len(self._out_messages)):
-            try:
-                if self._out_messages[i].mid == mid:
-                    # Only inform the client the message has been sent once.
-                    self._callback_mutex.acquire()
-                    if self.on_publish:
+        if mid in self._out_messages:
+            # Only inform the client the message has been sent once.
+            self._callback_mutex.acquire()
+            if self.on_publish:
+                self._out_message_mutex.release()
+                self._in_callback = True
+                self.on_publish(self, self._userdata, mid)
+                self._in_callback = False
+                self._out_message_mutex.acquire()
+
+            self._callback_mutex.release()
+            if self._out_messages.pop(mid, None) is not None:
+                self._inflight_messages = self._inflight_messages - 1
+                if self._max_inflight_messages > 0:
+                    rc = self._update_inflight()
+                    if rc != MQTT_ERR_SUCCESS:
                         self._out_message_mutex.release()
-                        self._in_callback = True
-                        self.on_publish(self, self._userdata, mid)
-                        self._in_callback = False
-                        self._out_message_mutex.acquire()
-
-                    self._callback_mutex.release()
-                    self._out_messages.pop(i)
-                    self._inflight_messages = self._inflight_messages - 1
-                    if self._max_inflight_messages > 0:
-                        rc = self._update_inflight()
-                        if rc != MQTT_ERR_SUCCESS:
-                            self._out_message_mutex.release()
-                            return rc
-                    self._out_message_mutex.release()
-                    return MQTT_ERR_SUCCESS
-            except IndexError:
-                # Have removed item so i>count.
-                # Not really an error.
-                pass
+                        return rc
 
         self._out_message_mutex.release()
         return MQTT_ERR_SUCCESS
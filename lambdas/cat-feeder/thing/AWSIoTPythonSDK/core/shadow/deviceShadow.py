@@ -16,7 +16,7 @@
 import json
 import logging
 import uuid
-from threading import Timer, Lock, Thread
+from threading import Lock, Event
 
 
 class _shadowRequestToken:
@@ -89,30 +89,46 @@ class deviceShadow:
         self._shadowName = srcShadowName
         # Tool handler
         self._shadowManagerHandler = srcShadowManager
+        self._callbackExecutor = srcShadowManager.getCallbackExecutor()
+        self._timeoutScheduler = srcShadowManager.getTimeoutScheduler()
         self._basicJSONParserHandler = _basicJSONParser()
         self._tokenHandler = _shadowRequestToken()
         # Properties
         self._isPersistentSubscribe = srcIsPersistentSubscribe
         self._lastVersionInSync = -1  # -1 means not initialized
-        self._isGetSubscribed = False
-        self._isUpdateSubscribed = False
-        self._isDeleteSubscribed = False
+        # Set once the SUBACK for the accepted/rejected topics of an action is in, None while not subscribed
+        self._shadowSubscribeEventTable = dict()
+        self._shadowSubscribeEventTable["get"] = None
+        self._shadowSubscribeEventTable["delete"] = None
+        self._shadowSubscribeEventTable["update"] = None
         self._shadowSubscribeCallbackTable = dict()
-        self._shadowSubscribeCallbackTable["get"] = None
-        self._shadowSubscribeCallbackTable["delete"] = None
-        self._shadowSubscribeCallbackTable["update"] = None
         self._shadowSubscribeCallbackTable["delta"] = None
         self._shadowSubscribeStatusTable = dict()
         self._shadowSubscribeStatusTable["get"] = 0
         self._shadowSubscribeStatusTable["delete"] = 0
         self._shadowSubscribeStatusTable["update"] = 0
-        self._tokenPool = dict()
+        self._tokenPool = dict()  # token -> ScheduledTimeout of the pending request
+        # Each request keeps its own callback so concurrent requests are answered by clientToken
+        self._tokenCallbackTable = dict()
         self._dataStructureLock = Lock()
 
     def _doNonPersistentUnsubscribe(self, currentAction):
-        self._shadowManagerHandler.basicShadowUnsubscribe(self._shadowName, currentAction)
+        try:
+            self._shadowManagerHandler.basicShadowUnsubscribe(self._shadowName, currentAction)
+        except Exception as e:
+            self._logger.warn("Failed to unsubscribe from " + currentAction + " accepted/rejected topics for deviceShadow: " + self._shadowName + ": " + str(e))
+            return
         self._logger.info("Unsubscribed to " + currentAction + " accepted/rejected topics for deviceShadow: " + self._shadowName)
 
+    def _releaseSubscription(self, srcActionName):
+        # Called with the data structure lock held once a request got its response or timed out.
+        # The UNSUBSCRIBE is queued before the lock is released, so it cannot overtake the SUBSCRIBE of a later request.
+        self._shadowSubscribeStatusTable[srcActionName] -= 1
+        if not self._isPersistentSubscribe and self._shadowSubscribeStatusTable.get(srcActionName) <= 0:
+            self._shadowSubscribeStatusTable[srcActionName] = 0
+            self._shadowSubscribeEventTable[srcActionName] = None
+            self._doNonPersistentUnsubscribe(srcActionName)
+
     def generalCallback(self, client, userdata, message):
         # In Py3.x, message.payload comes in as a bytes(string)
         # json.loads needs a string input
@@ -129,7 +145,7 @@ class deviceShadow:
                     currentToken = self._basicJSONParserHandler.getAttributeValue(u"clientToken")
                     if currentToken is not None:
                         self._logger.debug("shadow message clientToken: " + currentToken)
-                    if currentToken is not None and currentToken in self._tokenPool.keys():  # Filter out JSON without the desired token
+                    if currentToken is not None and currentToken in self._tokenPool:  # Filter out JSON without the desired token
                         # Sync local version when it is an accepted response
                         self._logger.debug("Token is in the pool. Type: " + currentType)
                         if currentType == "accepted":
@@ -141,18 +157,13 @@ class deviceShadow:
                             else:
                                 self._lastVersionInSync = -1  # The version will always be synced for the next incoming delta/GU-accepted response
                         # Cancel the timer and clear the token
-                        self._tokenPool[currentToken].cancel()
-                        del self._tokenPool[currentToken]
+                        self._tokenPool.pop(currentToken).cancel()
+                        currentCallback = self._tokenCallbackTable.pop(currentToken)
                         # Need to unsubscribe?
-                        self._shadowSubscribeStatusTable[currentAction] -= 1
-                        if not self._isPersistentSubscribe and self._shadowSubscribeStatusTable.get(currentAction) <= 0:
-                            self._shadowSubscribeStatusTable[currentAction] = 0
-                            processNonPersistentUnsubscribe = Thread(target=self._doNonPersistentUnsubscribe, args=[currentAction])
-                            processNonPersistentUnsubscribe.start()
+                        self._releaseSubscription(currentAction)
                         # Custom callback
-                        if self._shadowSubscribeCallbackTable.get(currentAction) is not None:
-                            processCustomCallback = Thread(target=self._shadowSubscribeCallbackTable[currentAction], args=[payloadUTF8String, currentType, currentToken])
-                            processCustomCallback.start()
+                        if currentCallback is not None:
+                            self._callbackExecutor.submit(currentTopic, currentCallback, payloadUTF8String, currentType, currentToken)
             # delta: Watch for version
             else:
                 currentType += "/" + self._parseTopicShadowName(currentTopic)
@@ -164,8 +175,7 @@ class deviceShadow:
                         self._lastVersionInSync = incomingVersion
                         # Custom callback
                         if self._shadowSubscribeCallbackTable.get(currentAction) is not None:
-                            processCustomCallback = Thread(target=self._shadowSubscribeCallbackTable[currentAction], args=[payloadUTF8String, currentType, None])
-                            processCustomCallback.start()
+                            self._callbackExecutor.submit(currentTopic, self._shadowSubscribeCallbackTable[currentAction], payloadUTF8String, currentType, None)
 
     def _parseTopicAction(self, srcTopic):
         ret = None
@@ -192,15 +202,57 @@ class deviceShadow:
                 return
             # Remove the token
             del self._tokenPool[srcToken]
+            currentCallback = self._tokenCallbackTable.pop(srcToken)
             # Need to unsubscribe?
-            self._shadowSubscribeStatusTable[srcActionName] -= 1
-            if not self._isPersistentSubscribe and self._shadowSubscribeStatusTable.get(srcActionName) <= 0:
-                self._shadowSubscribeStatusTable[srcActionName] = 0
-                self._shadowManagerHandler.basicShadowUnsubscribe(self._shadowName, srcActionName)
+            self._releaseSubscription(srcActionName)
             # Notify time-out issue
-            if self._shadowSubscribeCallbackTable.get(srcActionName) is not None:
+            if currentCallback is not None:
                 self._logger.info("Shadow request with token: " + str(srcToken) + " has timed out.")
-                self._shadowSubscribeCallbackTable[srcActionName]("REQUEST TIME OUT", "timeout", srcToken)
+                currentCallback("REQUEST TIME OUT", "timeout", srcToken)
+
+    def _shadowRequest(self, srcActionName, srcJSONPayload, srcCallback, srcTimeout):
+        with self._dataStructureLock:
+            # clientToken
+            currentToken = self._tokenHandler.getNextToken()
+            self._tokenPool[currentToken] = self._timeoutScheduler.new_timeout(srcTimeout, self._timerHandler, srcActionName, currentToken)
+            self._tokenCallbackTable[currentToken] = srcCallback
+            self._basicJSONParserHandler.setString(srcJSONPayload)
+            self._basicJSONParserHandler.validateJSON()
+            self._basicJSONParserHandler.setAttributeValue("clientToken", currentToken)
+            currentPayload = self._basicJSONParserHandler.regenerateString()
+            # Update number of pending feedback
+            self._shadowSubscribeStatusTable[srcActionName] += 1
+            # The first request subscribes, concurrent ones wait for its SUBACK instead of subscribing again
+            subscribeEvent = self._shadowSubscribeEventTable[srcActionName]
+            isSubscriber = subscribeEvent is None
+            if isSubscriber:
+                subscribeEvent = Event()
+                self._shadowSubscribeEventTable[srcActionName] = subscribeEvent
+        # Two subscriptions, one SUBSCRIBE packet
+        if isSubscriber:
+            try:
+                self._shadowManagerHandler.basicShadowSubscribe(self._shadowName, srcActionName, self.generalCallback)
+                self._logger.info("Subscribed to " + srcActionName + " accepted/rejected topics for deviceShadow: " + self._shadowName)
+            except Exception:
+                with self._dataStructureLock:
+                    # Drop this request and let the next one retry the subscription
+                    if self._shadowSubscribeEventTable[srcActionName] is subscribeEvent:
+                        self._shadowSubscribeEventTable[srcActionName] = None
+                    self._tokenPool.pop(currentToken, None)
+                    self._tokenCallbackTable.pop(currentToken, None)
+                    self._shadowSubscribeStatusTable[srcActionName] = max(0, self._shadowSubscribeStatusTable[srcActionName] - 1)
+                raise
+            finally:
+                subscribeEvent.set()
+        else:
+            subscribeEvent.wait()
+        # One publish
+        self._shadowManagerHandler.basicShadowPublish(self._shadowName, srcActionName, currentPayload)
+        # Start the timer
+        with self._dataStructureLock:
+            if currentToken in self._tokenPool:
+                self._tokenPool[currentToken].start()
+        return currentToken
 
     def shadowGet(self, srcCallback, srcTimeout):
         """
@@ -234,30 +286,7 @@ class deviceShadow:
         The token used for tracing in this shadow request.
 
         """
-        with self._dataStructureLock:
-            # Update callback data structure
-            self._shadowSubscribeCallbackTable["get"] = srcCallback
-            # Update number of pending feedback
-            self._shadowSubscribeStatusTable["get"] += 1
-            # clientToken
-            currentToken = self._tokenHandler.getNextToken()
-            self._tokenPool[currentToken] = Timer(srcTimeout, self._timerHandler, ["get", currentToken])
-            self._basicJSONParserHandler.setString("{}")
-            self._basicJSONParserHandler.validateJSON()
-            self._basicJSONParserHandler.setAttributeValue("clientToken", currentToken)
-            currentPayload = self._basicJSONParserHandler.regenerateString()
-        # Two subscriptions
-        if not self._isPersistentSubscribe or not self._isGetSubscribed:
-            self._shadowManagerHandler.basicShadowSubscribe(self._shadowName, "get", self.generalCallback)
-            self._isGetSubscribed = True
-            self._logger.info("Subscribed to get accepted/rejected topics for deviceShadow: " + self._shadowName)
-        # One publish
-        self._shadowManagerHandler.basicShadowPublish(self._shadowName, "get", currentPayload)
-        # Start the timer
-        with self._dataStructureLock:
-            if currentToken in self._tokenPool:
-                self._tokenPool[currentToken].start()
-        return currentToken
+        return self._shadowRequest("get", "{}", srcCallback, srcTimeout)
 
     def shadowDelete(self, srcCallback, srcTimeout):
         """
@@ -291,30 +320,7 @@ class deviceShadow:
         The token used for tracing in this shadow request.
 
         """
-        with self._dataStructureLock:
-            # Update callback data structure
-            self._shadowSubscribeCallbackTable["delete"] = srcCallback
-            # Update number of pending feedback
-            self._shadowSubscribeStatusTable["delete"] += 1
-            # clientToken
-            currentToken = self._tokenHandler.getNextToken()
-            self._tokenPool[currentToken] = Timer(srcTimeout, self._timerHandler, ["delete", currentToken])
-            self._basicJSONParserHandler.setString("{}")
-            self._basicJSONParserHandler.validateJSON()
-            self._basicJSONParserHandler.setAttributeValue("clientToken", currentToken)
-            currentPayload = self._basicJSONParserHandler.regenerateString()
-        # Two subscriptions
-        if not self._isPersistentSubscribe or not self._isDeleteSubscribed:
-            self._shadowManagerHandler.basicShadowSubscribe(self._shadowName, "delete", self.generalCallback)
-            self._isDeleteSubscribed = True
-            self._logger.info("Subscribed to delete accepted/rejected topics for deviceShadow: " + self._shadowName)
-        # One publish
-        self._shadowManagerHandler.basicShadowPublish(self._shadowName, "delete", currentPayload)
-        # Start the timer
-        with self._dataStructureLock:
-            if currentToken in self._tokenPool:
-                self._tokenPool[currentToken].start()
-        return currentToken
+        return self._shadowRequest("delete", "{}", srcCallback, srcTimeout)
 
     def shadowUpdate(self, srcJSONPayload, srcCallback, srcTimeout):
         """
@@ -351,33 +357,9 @@ class deviceShadow:
 
         """
         # Validate JSON
-        if _validateJSON(srcJSONPayload):
-            with self._dataStructureLock:
-                self._basicJSONParserHandler.setString(srcJSONPayload)
-                self._basicJSONParserHandler.validateJSON()
-                # clientToken
-                currentToken = self._tokenHandler.getNextToken()
-                self._tokenPool[currentToken] = Timer(srcTimeout, self._timerHandler, ["update", currentToken])
-                self._basicJSONParserHandler.setAttributeValue("clientToken", currentToken)
-                JSONPayloadWithToken = self._basicJSONParserHandler.regenerateString()
-                # Update callback data structure
-                self._shadowSubscribeCallbackTable["update"] = srcCallback
-                # Update number of pending feedback
-                self._shadowSubscribeStatusTable["update"] += 1
-            # Two subscriptions
-            if not self._isPersistentSubscribe or not self._isUpdateSubscribed:
-                self._shadowManagerHandler.basicShadowSubscribe(self._shadowName, "update", self.generalCallback)
-                self._isUpdateSubscribed = True
-                self._logger.info("Subscribed to update accepted/rejected topics for deviceShadow: " + self._shadowName)
-            # One publish
-            self._shadowManagerHandler.basicShadowPublish(self._shadowName, "update", JSONPayloadWithToken)
-            # Start the timer
-            with self._dataStructureLock:
-                if currentToken in self._tokenPool:
-                    self._tokenPool[currentToken].start()
-        else:
+        if not _validateJSON(srcJSONPayload):
             raise ValueError("Invalid JSON file.")
-        return currentToken
+        return self._shadowRequest("update", srcJSONPayload, srcCallback, srcTimeout)
 
     def shadowRegisterDeltaCallback(self, srcCallback):
         """
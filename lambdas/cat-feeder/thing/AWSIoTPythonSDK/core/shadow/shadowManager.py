@@ -14,8 +14,7 @@
 # */
 
 import logging
-import time
-from threading import Lock
+from AWSIoTPythonSDK.core.protocol.internal.workers import TimeoutScheduler
 
 class _shadowAction:
     _actionType = ["get", "update", "delete", "delta"]
@@ -55,29 +54,33 @@ class shadowManager:
         if srcMQTTCore is None:
             raise TypeError("None type inputs detected.")
         self._mqttCoreHandler = srcMQTTCore
-        self._shadowSubUnsubOperationLock = Lock()
+        # One thread keeps the request deadlines of every shadow on this connection
+        self._timeoutScheduler = TimeoutScheduler(srcMQTTCore.get_callback_executor())
+
+    def getCallbackExecutor(self):
+        return self._mqttCoreHandler.get_callback_executor()
+
+    def getTimeoutScheduler(self):
+        return self._timeoutScheduler
 
     def basicShadowPublish(self, srcShadowName, srcShadowAction, srcPayload):
         currentShadowAction = _shadowAction(srcShadowName, srcShadowAction)
         self._mqttCoreHandler.publish(currentShadowAction.getTopicGeneral(), srcPayload, 0, False)
 
     def basicShadowSubscribe(self, srcShadowName, srcShadowAction, srcCallback):
-        with self._shadowSubUnsubOperationLock:
-            currentShadowAction = _shadowAction(srcShadowName, srcShadowAction)
-            if currentShadowAction.isDelta:
-                self._mqttCoreHandler.subscribe(currentShadowAction.getTopicDelta(), 0, srcCallback)
-            else:
-                self._mqttCoreHandler.subscribe(currentShadowAction.getTopicAccept(), 0, srcCallback)
-                self._mqttCoreHandler.subscribe(currentShadowAction.getTopicReject(), 0, srcCallback)
-            time.sleep(2)
+        # Accepted and rejected go out in one SUBSCRIBE packet, returns once the SUBACK is in.
+        # No lock is held while waiting so subscriptions for other shadows proceed concurrently.
+        currentShadowAction = _shadowAction(srcShadowName, srcShadowAction)
+        self._mqttCoreHandler.subscribe_batch(self._getTopics(currentShadowAction), 0, srcCallback)
 
     def basicShadowUnsubscribe(self, srcShadowName, srcShadowAction):
-        with self._shadowSubUnsubOperationLock:
-            currentShadowAction = _shadowAction(srcShadowName, srcShadowAction)
-            if currentShadowAction.isDelta:
-                self._mqttCoreHandler.unsubscribe(currentShadowAction.getTopicDelta())
-            else:
-                self._logger.debug(currentShadowAction.getTopicAccept())
-                self._mqttCoreHandler.unsubscribe(currentShadowAction.getTopicAccept())
-                self._logger.debug(currentShadowAction.getTopicReject())
-                self._mqttCoreHandler.unsubscribe(currentShadowAction.getTopicReject())
+        # Does not wait for the UNSUBACK, a SUBSCRIBE issued afterwards is still sent after this UNSUBSCRIBE
+        currentShadowAction = _shadowAction(srcShadowName, srcShadowAction)
+        topics = self._getTopics(currentShadowAction)
+        self._logger.debug("Unsubscribing from " + ", ".join(topics))
+        self._mqttCoreHandler.unsubscribe_batch_async(topics)
+
+    def _getTopics(self, srcShadowAction):
+        if srcShadowAction.isDelta:
+            return [srcShadowAction.getTopicDelta()]
+        return [srcShadowAction.getTopicAccept(), srcShadowAction.getTopicReject()]
@@ -46,6 +46,32 @@ class CertificateCredentialsProvider(CredentialsProvider):
         return self._key_path
 
 
+class MemoryCertificateCredentialsProvider(object):
+
+    def __init__(self):
+        self._ca_pem = ""
+        self._cert_pem = ""
+        self._key_pem = ""
+
+    def set_ca_pem(self, ca_pem):
+        self._ca_pem = ca_pem
+
+    def set_cert_pem(self, cert_pem):
+        self._cert_pem = cert_pem
+
+    def set_key_pem(self, key_pem):
+        self._key_pem = key_pem
+
+    def get_ca_pem(self):
+        return self._ca_pem
+
+    def get_cert_pem(self):
+        return self._cert_pem
+
+    def get_key_pem(self):
+        return self._key_pem
+
+
 class IAMCredentialsProvider(CredentialsProvider):
 
     def __init__(self):
@@ -75,6 +75,11 @@ class publishQueueDisabledException(operationError.operationError):
         self.message = "Offline publish request dropped because queueing is disabled"
 
 
+class publishQueuePersistenceException(operationError.operationError):
+    def __init__(self):
+        self.message = "Offline publish request dropped because it could not be persisted"
+
+
 class subscribeError(operationError.operationError):
     def __init__(self, errorCode):
         self.message = "Subscribe Error: " + str(errorCode)
@@ -1,23 +1,230 @@
 import os
-import boto3
-import json 
-from botocore.exceptions import ClientError
+import time
+import importlib
+import json
+from json.encoder import encode_basestring_ascii
+from threading import Lock
 
-from AWSIoTPythonSDK.MQTTLib import AWSIoTMQTTClient
 
-def lambda_handler(event, context):
-    certificate_pem_parameter_name = os.environ['CertificatePemParameter']
-    private_key_secret_parameter_name = os.environ['PrivateKeySecretParameter']
-    amazon_root_ca_parameter_name = os.environ['AmazonRootCAParameter']
+DEFAULT_CREDENTIAL_CACHE_TTL_SEC = 900
+DEFAULT_FEED_EVENT = "FEED_BOTH_BOWLS"
+FEED_COMMAND_QOS = 1
+# A warm execution environment is frozen between invocations and cannot send PINGREQs while frozen.
+# AWS IoT drops a client after 1.5x its keep-alive without traffic, so use the 1200 second maximum
+# to keep the cached connection usable across the longest possible idle gap between invocations.
+DEFAULT_MQTT_KEEPALIVE_SEC = 1200
+
+# boto3 and the MQTT stack are most of the import time. With LazyImports=true they are only
+# imported when an invocation first needs them, which shortens the init phase.
+LAZY_IMPORTS = os.environ.get('LazyImports', 'false').lower() == 'true'
+
+
+class DeferredModule(object):
+    """Stands in for a module and imports it on first attribute access."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+
+def import_module(name):
+    return DeferredModule(name) if LAZY_IMPORTS else importlib.import_module(name)
+
+
+boto3 = import_module('boto3')
+botocore_exceptions = import_module('botocore.exceptions')
+mqtt_lib = import_module('AWSIoTPythonSDK.MQTTLib')
+mqtt_clients = import_module('AWSIoTPythonSDK.core.protocol.internal.clients')
+ssl_contexts = import_module('AWSIoTPythonSDK.core.protocol.connection.ssl_contexts')
+mqtt_requests = import_module('AWSIoTPythonSDK.core.protocol.internal.requests')
+mqtt_exceptions = import_module('AWSIoTPythonSDK.exception.AWSIoTExceptions')
+
+
+def connected_client_statuses():
+    # Connection states in which the MQTT client still holds a live session with AWS IoT
+    ClientStatus = mqtt_clients.ClientStatus
+    return (ClientStatus.STABLE, ClientStatus.RESUBSCRIBE, ClientStatus.DRAINING)
+
+
+def connect_failure_exceptions():
+    # TLS handshake and socket errors (ssl.SSLError is an OSError), CONNACK timeouts and refused connects
+    return (OSError, mqtt_exceptions.connectTimeoutException, mqtt_exceptions.connectError)
+
+
+def delivered_publish_results():
+    # QoS1 messages count as delivered once acknowledged, QoS0 messages once written to the socket
+    PublishResults = mqtt_requests.PublishResults
+    return (PublishResults.ACKED, PublishResults.SENT)
+
+
+class MqttConnectionManager(object):
+    """Keeps one MQTT client connected across warm Lambda invocations.
+
+    The client is only rebuilt (and the TLS mutual-auth handshake only paid)
+    when there is no client yet or the existing one has dropped its connection.
+    """
+
+    def __init__(self, client_factory, keepalive_sec=DEFAULT_MQTT_KEEPALIVE_SEC):
+        self._client_factory = client_factory
+        self._keepalive_sec = keepalive_sec
+        self._client = None
+        self._lock = Lock()
+        self._connect_count = 0
+        self._reuse_count = 0
+
+    def get_client(self):
+        with self._lock:
+            if self._is_connected():
+                self._reuse_count += 1
+                return self._client
+
+            self._close()
+            client = self._client_factory()
+            try:
+                client.connect(self._keepalive_sec)
+            except Exception:
+                # Stop the network and event threads the failed attempt may have started
+                self._disconnect_quietly(client)
+                raise
+            self._client = client
+            self._connect_count += 1
+            return client
+
+    def invalidate(self):
+        with self._lock:
+            self._close()
+
+    def stats(self):
+        total = self._connect_count + self._reuse_count
+        return {
+            "connects": self._connect_count,
+            "reuses": self._reuse_count,
+            "reuse_rate": float(self._reuse_count) / total if total else 0.0
+        }
+
+    def _is_connected(self):
+        return self._client is not None and self._client.getClientStatus() in connected_client_statuses()
+
+    def _close(self):
+        if self._client is None:
+            return
+        self._disconnect_quietly(self._client)
+        self._client = None
+
+    def _disconnect_quietly(self, client):
+        try:
+            client.disconnect()
+        except Exception as e:
+            print("Ignoring error while closing the stale MQTT connection:", e)
+
+
+class CredentialsNotFoundError(Exception):
+    pass
+
+
+class FeedCommandsNotDeliveredError(Exception):
+    pass
+
+
+class CredentialCache(object):
+    """Holds the thing's root CA, certificate and private key in memory.
+
+    All three SSM parameters are fetched with a single GetParameters call and
+    kept for ttl_sec seconds.
+    """
+
+    def __init__(self, amazon_root_ca_parameter_name, certificate_pem_parameter_name,
+                 private_key_secret_parameter_name, ttl_sec):
+        self._parameter_names = {
+            "ca": amazon_root_ca_parameter_name,
+            "cert": certificate_pem_parameter_name,
+            "key": private_key_secret_parameter_name
+        }
+        self._ttl_sec = ttl_sec
+        self._ssm = None
+        self._credentials = None
+        self._fetched_at = 0
+        self._lock = Lock()
+
+    def get(self):
+        with self._lock:
+            if self._credentials is None or time.time() - self._fetched_at >= self._ttl_sec:
+                self._credentials = self._fetch()
+                self._fetched_at = time.time()
+            return self._credentials
+
+    def invalidate(self):
+        with self._lock:
+            self._credentials = None
 
+    def _fetch(self):
+        if self._ssm is None:
+            self._ssm = boto3.client('ssm')
 
-    ssm = boto3.client('ssm')
+        response = self._ssm.get_parameters(Names=list(self._parameter_names.values()), WithDecryption=True)
+        if response['InvalidParameters']:
+            raise CredentialsNotFoundError(", ".join(response['InvalidParameters']))
 
+        values = dict((parameter['Name'], parameter['Value']) for parameter in response['Parameters'])
+        return dict((name, values[parameter_name]) for name, parameter_name in self._parameter_names.items())
+
+
+def create_mqtt_client():
+    credentials = get_credential_cache().get()
+
+    myMQTTClient = mqtt_lib.AWSIoTMQTTClient(os.environ['ThingName'])
+    myMQTTClient.configureEndpoint(os.environ['IoTEndpoint'], 8883)
+    myMQTTClient.configureCredentialsFromMemory(credentials["ca"], credentials["key"], credentials["cert"])
+    myMQTTClient.configureOfflinePublishQueueing(-1)
+    myMQTTClient.configureDrainingFrequency(2)
+    myMQTTClient.configureConnectDisconnectTimeout(10)
+    myMQTTClient.configureMQTTOperationTimeout(5)
+
+    return myMQTTClient
+
+
+# Built on first use so importing the handler does not depend on the function's environment variables
+credential_cache = None
+
+
+def get_credential_cache():
+    global credential_cache
+    if credential_cache is None:
+        credential_cache = CredentialCache(os.environ['AmazonRootCAParameter'],
+                                           os.environ['CertificatePemParameter'],
+                                           os.environ['PrivateKeySecretParameter'],
+                                           int(os.environ.get('CredentialCacheTtlSeconds', DEFAULT_CREDENTIAL_CACHE_TTL_SEC)))
+    return credential_cache
+
+# Lives for the lifetime of the execution environment so warm invocations reuse the connection
+connection_manager = MqttConnectionManager(create_mqtt_client,
+                                           int(os.environ.get('MqttKeepAliveSeconds', DEFAULT_MQTT_KEEPALIVE_SEC)))
+
+
+def get_connected_client():
+    try:
+        return connection_manager.get_client()
+    except connect_failure_exceptions() as e:
+        # The certificate may have been rotated since it was cached, and AWS IoT can also reject a revoked
+        # certificate after the handshake by not answering the CONNECT. Retry once with fresh credentials.
+        print("MQTT connect failed, refreshing cached credentials:", repr(e))
+        get_credential_cache().invalidate()
+        ssl_contexts.shared_ssl_context_cache.clear()
+        return connection_manager.get_client()
+
+
+def lambda_handler(event, context):
     try:
-        certificate_pem_response = ssm.get_parameter(Name=certificate_pem_parameter_name, WithDecryption=True)
-        private_key_secret_private_response = ssm.get_parameter(Name=private_key_secret_parameter_name, WithDecryption=True)
-        amazon_root_ca_response = ssm.get_parameter(Name=amazon_root_ca_parameter_name, WithDecryption=True)
-    except ClientError as e:
+        myMQTTClient = get_connected_client()
+    except CredentialsNotFoundError as e:
+        print("The requested secret was not found:", e)
+        return False
+    except botocore_exceptions.ClientError as e:
         if e.response['Error']['Code'] == 'ResourceNotFoundException':
             print("The requested secret was not found")
         elif e.response['Error']['Code'] == 'InvalidRequestException':
@@ -28,38 +235,91 @@ def lambda_handler(event, context):
             print(e)
 
         return False
-    else:
-        text_secret_data_cert_ca = amazon_root_ca_response['Parameter']['Value']
-        text_secret_data_cert_crt = certificate_pem_response['Parameter']['Value']
-        text_secret_data_cert_private = private_key_secret_private_response['Parameter']['Value']
-
-
-        with open('/tmp/root_ca.pem', 'w') as the_file:
-            the_file.write(text_secret_data_cert_ca)
-
-        with open('/tmp/device_cert.crt', 'w') as the_file:
-            the_file.write(text_secret_data_cert_crt)
-
-        with open('/tmp/private_key.key', 'w') as the_file:
-            the_file.write(text_secret_data_cert_private)
-
-        myMQTTClient = AWSIoTMQTTClient(os.environ['ThingName'])
-        myMQTTClient.configureEndpoint(os.environ['IoTEndpoint'], 8883)
-        myMQTTClient.configureCredentials("/tmp/root_ca.pem", "/tmp/private_key.key", "/tmp/device_cert.crt")
-        myMQTTClient.configureOfflinePublishQueueing(-1) 
-        myMQTTClient.configureDrainingFrequency(2)  
-        myMQTTClient.configureConnectDisconnectTimeout(10) 
-        myMQTTClient.configureMQTTOperationTimeout(5)  
-
-        myMQTTClient.connect()
-   
-        dictionary ={ 
-            "event": "FEED_BOTH_BOWLS",
-            "event_source": os.environ['ThingName'],
-            "reportedTime": "1234567890"
-        }
 
-        myMQTTClient.publish(os.environ['Topic'], json.dumps(dictionary), 0)
-        myMQTTClient.disconnect()
+    commands = get_feed_commands(event)
+    messages = [(command.get("topic", os.environ['Topic']), build_feed_message(command), command.get("qos", FEED_COMMAND_QOS))
+                for command in commands]
+
+    start = time.time()
+    publish_results = publish_feed_messages(myMQTTClient, messages)
+    elapsed_sec = time.time() - start
+
+    print("MQTT connection stats:", connection_manager.stats())
+    print("SSLContext cache stats:", ssl_contexts.shared_ssl_context_cache.get_stats())
+
+    results = []
+    for (topic, _, _), command, (_, result) in zip(messages, commands, publish_results):
+        results.append({"event": command.get("event", DEFAULT_FEED_EVENT), "topic": topic, "result": result})
+
+    return {
+        "message": "Sent %d MQTT message(s) to %s" % (len(messages), ", ".join(sorted(set(topic for topic, _, _ in messages)))),
+        "results": results,
+        "elapsedSeconds": elapsed_sec
+    }
+
+
+def publish_feed_messages(mqtt_client, messages):
+    publish_results = mqtt_client.publishBatch(messages)
+    undelivered = undelivered_indexes(publish_results)
+    if not undelivered:
+        return publish_results
+
+    # A timed out, failed or offline-queued publish means the cached connection can no longer be trusted.
+    # Drop it and republish the undelivered messages once over a fresh connection.
+    print("%d of %d MQTT message(s) were not delivered, reconnecting:" % (len(undelivered), len(messages)),
+          [publish_results[index][1] for index in undelivered])
+    connection_manager.invalidate()
+    retry_results = get_connected_client().publishBatch([messages[index] for index in undelivered])
+    for index, result in zip(undelivered, retry_results):
+        publish_results[index] = result
+
+    undelivered = undelivered_indexes(publish_results)
+    if undelivered:
+        connection_manager.invalidate()
+        raise FeedCommandsNotDeliveredError("%d of %d MQTT message(s) were not delivered: %s" % (
+            len(undelivered), len(messages), ", ".join(publish_results[index][1] for index in undelivered)))
+    return publish_results
+
+
+def undelivered_indexes(publish_results):
+    delivered = delivered_publish_results()
+    return [index for index, (_, result) in enumerate(publish_results) if result not in delivered]
+
+
+def get_feed_commands(event):
+    # A scheduled invocation may carry a batch of commands, e.g. {"commands": [{"event": "FEED_BOTH_BOWLS"}]}.
+    # Anything else is treated as a single default feed command.
+    if isinstance(event, dict) and event.get("commands"):
+        return event["commands"]
+    return [{"event": DEFAULT_FEED_EVENT}]
+
+
+class MessageTemplate(object):
+    """Pre-serialized JSON object with a fixed set of string fields.
+
+    The keys and punctuation are encoded once. Rendering only escapes the field
+    values and returns UTF-8 bytes, the same bytes json.dumps() would produce,
+    which the MQTT client publishes without converting them again.
+    """
+
+    def __init__(self, field_names):
+        self._field_names = tuple(field_names)
+        # json.dumps() of the keys gives the same escaping and separators as a full dump
+        self._format = "{" + ", ".join(json.dumps(name).replace("%", "%%") + ": %s" for name in self._field_names) + "}"
+
+    def render(self, *values):
+        return (self._format % tuple(self._encode_value(value) for value in values)).encode("ascii")
+
+    def _encode_value(self, value):
+        if isinstance(value, str):
+            return encode_basestring_ascii(value)
+        return json.dumps(value)
+
+
+FEED_MESSAGE_TEMPLATE = MessageTemplate(("event", "event_source", "reportedTime"))
+
 
-    return "Sent MQTT message to " + os.environ['Topic']
+def build_feed_message(command):
+    return FEED_MESSAGE_TEMPLATE.render(command.get("event", DEFAULT_FEED_EVENT),
+                                        command.get("event_source", os.environ['ThingName']),
+                                        str(int(time.time())))
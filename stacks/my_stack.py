@@ -12,6 +12,20 @@ from aws_cdk import (
 )
 import aws_cdk as cdk
 import logging
+import os
+
+
+CAT_FEEDER_THING_ASSET_PATH = "lambdas/cat-feeder/thing"
+
+# AWS services the cat feeder thing function calls through boto3, every other botocore
+# service model is left out of the asset
+CAT_FEEDER_THING_BOTOCORE_SERVICES = ["ssm"]
+
+
+def botocore_model_excludes(asset_path, services):
+    data_path = os.path.join(asset_path, "botocore", "data")
+    return ["botocore/data/" + name for name in sorted(os.listdir(data_path))
+            if os.path.isdir(os.path.join(data_path, name)) and name not in services]
 
 
 class FeedmyfurbabiesPipelineCdkStack(Stack):
@@ -123,7 +137,8 @@ class FeedmyfurbabiesPipelineCdkStack(Stack):
         # IAM Policies
         secrets_policy = iam.PolicyStatement(
             actions=[
-                "ssm:GetParameter"
+                "ssm:GetParameter",
+                "ssm:GetParameters"
             ],
             resources=["*"]  
         )
@@ -137,7 +152,10 @@ class FeedmyfurbabiesPipelineCdkStack(Stack):
             self, "CatFeederThingFunction",
             runtime=lambda_.Runtime.PYTHON_3_8,
             handler="app.lambda_handler",
-            code=lambda_.Code.from_asset("lambdas/cat-feeder/thing"),
+            code=lambda_.Code.from_asset(
+                CAT_FEEDER_THING_ASSET_PATH,
+                exclude=botocore_model_excludes(CAT_FEEDER_THING_ASSET_PATH, CAT_FEEDER_THING_BOTOCORE_SERVICES)
+            ),
             environment={
                 "Topic": cat_feeder_thing_lambda_action_topic_name.value_as_string,
                 "ThingName": cat_feeder_thing_lambda_name.value_as_string,
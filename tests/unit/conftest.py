@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The SDK is vendored into the thing Lambda asset rather than installed
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "lambdas", "cat-feeder", "thing"))
@@ -0,0 +1,125 @@
+import pytest
+
+from AWSIoTPythonSDK.core.protocol.internal.queues import AppendResults
+from AWSIoTPythonSDK.core.protocol.internal.queues import OfflineRequestQueue
+from AWSIoTPythonSDK.core.protocol.internal.queues import PersistentOfflineRequestQueue
+from AWSIoTPythonSDK.core.protocol.internal.requests import QueueableRequest
+from AWSIoTPythonSDK.core.protocol.internal.requests import RequestTypes
+from AWSIoTPythonSDK.core.util.enums import DropBehaviorTypes
+
+
+def publish(payload, topic="t"):
+    return QueueableRequest(RequestTypes.PUBLISH, (topic, payload, 1, False))
+
+
+def drain(queue):
+    return [queue.popleft().data[1] for _ in range(len(queue))]
+
+
+def test_count_limit_drop_newest():
+    queue = OfflineRequestQueue(2, DropBehaviorTypes.DROP_NEWEST)
+    assert queue.append(publish("a")) == AppendResults.APPEND_SUCCESS
+    assert queue.append(publish("b")) == AppendResults.APPEND_SUCCESS
+    assert queue.append(publish("c")) == AppendResults.APPEND_FAILURE_QUEUE_FULL
+    assert drain(queue) == ["a", "b"]
+
+
+def test_count_limit_drop_oldest():
+    queue = OfflineRequestQueue(2, DropBehaviorTypes.DROP_OLDEST)
+    for payload in ("a", "b", "c"):
+        queue.append(publish(payload))
+    assert drain(queue) == ["b", "c"]
+
+
+def test_byte_budget_drop_oldest_frees_enough_room():
+    # Each request is its topic plus payload: 1 + 4 bytes
+    queue = OfflineRequestQueue(-1, DropBehaviorTypes.DROP_OLDEST, max_bytes=12)
+    queue.append(publish("aaaa"))
+    queue.append(publish("bbbb"))
+    assert queue.get_total_bytes() == 10
+    assert queue.append(publish("cccccccc")) == AppendResults.APPEND_FAILURE_QUEUE_FULL
+    assert drain(queue) == ["cccccccc"]
+    assert queue.get_total_bytes() == 0
+
+
+def test_byte_budget_drop_newest():
+    queue = OfflineRequestQueue(-1, DropBehaviorTypes.DROP_NEWEST, max_bytes=12)
+    queue.append(publish("aaaa"))
+    queue.append(publish("bbbb"))
+    assert queue.append(publish("cc")) == AppendResults.APPEND_FAILURE_QUEUE_FULL
+    assert drain(queue) == ["aaaa", "bbbb"]
+
+
+def test_request_larger_than_the_budget_is_dropped_without_evicting():
+    queue = OfflineRequestQueue(-1, DropBehaviorTypes.DROP_OLDEST, max_bytes=8)
+    queue.append(publish("aa"))
+    assert queue.append(publish(b"x" * 20)) == AppendResults.APPEND_FAILURE_QUEUE_FULL
+    assert drain(queue) == ["aa"]
+
+
+def test_disabled_queue():
+    queue = OfflineRequestQueue(0)
+    assert queue.append(publish("a")) == AppendResults.APPEND_FAILURE_QUEUE_DISABLED
+    assert len(queue) == 0
+
+
+def test_byte_sizes_count_encoded_payloads():
+    queue = OfflineRequestQueue(-1)
+    queue.append(publish(u"ü"))  # Two bytes in UTF-8
+    queue.append(publish(bytearray(3)))
+    queue.append(QueueableRequest(RequestTypes.SUBSCRIBE, ("topic", 1, None, None)))
+    assert queue.get_total_bytes() == (1 + 2) + (1 + 3) + 5
+    queue.popleft()
+    assert queue.get_total_bytes() == 9
+
+
+def test_invalid_configuration():
+    with pytest.raises(TypeError):
+        OfflineRequestQueue("10")
+    with pytest.raises(ValueError):
+        OfflineRequestQueue(10, 5)
+
+
+def persistent_queue(tmp_path, max_size=-1):
+    return PersistentOfflineRequestQueue(max_size, path=str(tmp_path / "offline" / "requests.db"))
+
+
+def test_persistent_queue_replays_unacknowledged_publishes(tmp_path):
+    queue = persistent_queue(tmp_path)
+    for payload in ("one", bytearray(b"two"), "three"):
+        assert queue.append(publish(payload)) == AppendResults.APPEND_SUCCESS
+    queue.append(QueueableRequest(RequestTypes.SUBSCRIBE, ("topic", 1, None, None)))  # Memory only
+    queue.acknowledge(queue.popleft())
+    queue.close()
+
+    replayed = persistent_queue(tmp_path)
+    requests = [replayed.popleft() for _ in range(len(replayed))]
+    assert [request.data for request in requests] == [("t", bytearray(b"two"), 1, False), ("t", "three", 1, False)]
+    assert replayed.get_total_bytes() == 0
+    # New requests continue after the replayed ids
+    replayed.append(publish("four"))
+    assert replayed.popleft().persistent_id > requests[-1].persistent_id
+    replayed.close()
+
+
+def test_persistent_queue_forgets_dropped_requests(tmp_path):
+    queue = PersistentOfflineRequestQueue(1, DropBehaviorTypes.DROP_OLDEST, path=str(tmp_path / "requests.db"))
+    queue.append(publish("old"))
+    queue.append(publish("new"))
+    queue.close()
+    replayed = PersistentOfflineRequestQueue(1, path=str(tmp_path / "requests.db"))
+    assert drain(replayed) == ["new"]
+    replayed.close()
+
+
+def test_persistent_queue_reports_failed_writes(tmp_path):
+    queue = persistent_queue(tmp_path)
+    queue.append(publish("stored"))
+    queue._writer._connection.execute(
+        "CREATE TRIGGER reject BEFORE INSERT ON requests BEGIN SELECT RAISE(ABORT, 'disk full'); END")
+    assert queue.append(publish("lost")) == AppendResults.APPEND_FAILURE_PERSISTENCE
+    assert len(queue) == 1
+    queue.close()
+    replayed = persistent_queue(tmp_path)
+    assert drain(replayed) == ["stored"]
+    replayed.close()
@@ -0,0 +1,116 @@
+import errno
+import socket
+
+import pytest
+
+from AWSIoTPythonSDK.core.protocol.paho import client as paho
+from AWSIoTPythonSDK.core.protocol.paho.client import Client
+
+
+class ChunkedSocket(object):
+    """Hands out the scripted chunks one recv_into call at a time."""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def recv_into(self, buffer, size):
+        if not self.chunks:
+            raise socket.error(errno.EAGAIN, "would block")
+        chunk = self.chunks.pop(0)
+        if isinstance(chunk, Exception):
+            raise chunk
+        count = min(len(chunk), size)
+        buffer[:count] = chunk[:count]
+        if count < len(chunk):
+            self.chunks.insert(0, chunk[count:])
+        return count
+
+
+def encode_packet(command, body):
+    header = bytearray([command])
+    length = len(body)
+    while True:
+        byte = length % 128
+        length //= 128
+        header.append(byte | 0x80 if length > 0 else byte)
+        if length == 0:
+            return bytes(header) + body
+
+
+def make_client(chunks):
+    client = Client("test")
+    client._sock = ChunkedSocket(chunks)
+    client.handled = []
+
+    def record_packet():
+        client.handled.append((client._in_packet["command"], bytes(client._in_packet["packet"])))
+        return paho.MQTT_ERR_SUCCESS
+    client._packet_handle = record_packet
+    return client
+
+
+def read_all(client):
+    rc = paho.MQTT_ERR_SUCCESS
+    while client._sock.chunks and rc == paho.MQTT_ERR_SUCCESS:
+        rc = client._packet_read()
+    return rc
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("body_length", [0, 1, 127, 128, 16383, 16384, 200000])
+def test_remaining_length_forms_across_single_byte_reads(body_length):
+    body = bytes(bytearray(i % 256 for i in range(body_length)))
+    packet = encode_packet(0x30, body)
+    chunk_size = 1 if body_length < 1000 else 997
+    client = make_client(split(packet, chunk_size))
+    assert read_all(client) == paho.MQTT_ERR_SUCCESS
+    assert client.handled == [(0x30, body)]
+    assert client._in_buffer_start == client._in_buffer_end == 0
+
+
+def test_many_packets_in_one_read_and_a_partial_tail():
+    packets = [encode_packet(0x30, b"message %d" % i) for i in range(50)]
+    data = b"".join(packets)
+    cut = len(data) - 3
+    client = make_client([data[:cut]])
+    assert read_all(client) == paho.MQTT_ERR_SUCCESS
+    assert len(client.handled) == 49
+    assert client._in_buffer_start == 0 and client._in_buffer_end == len(packets[-1]) - 3
+    client._sock.chunks.append(data[cut:])
+    assert read_all(client) == paho.MQTT_ERR_SUCCESS
+    assert [body for _, body in client.handled] == [b"message %d" % i for i in range(50)]
+
+
+def test_packet_larger_than_the_buffer_grows_it():
+    body = b"x" * (paho.IN_BUFFER_SIZE * 3)
+    client = make_client(split(encode_packet(0x30, body) + encode_packet(0xd0, b""), 65536))
+    assert read_all(client) == paho.MQTT_ERR_SUCCESS
+    assert client.handled == [(0x30, body), (0xd0, b"")]
+    assert len(client._in_buffer) >= len(body)
+
+
+def test_remaining_length_over_four_bytes_is_a_protocol_error():
+    client = make_client([b"\x30\xff\xff\xff\xff\x01"])
+    assert client._packet_read() == paho.MQTT_ERR_PROTOCOL
+    assert client.handled == []
+
+
+def test_would_block_and_closed_connection():
+    client = make_client([socket.error(errno.EAGAIN, "would block"), b""])
+    assert client._packet_read() == paho.MQTT_ERR_AGAIN
+    assert client._packet_read() == 1
+
+
+def test_publish_is_dispatched_from_the_buffer():
+    topic = b"cat-feeder/action"
+    body = bytes(bytearray([0, len(topic)])) + topic + b'{"event": "feed"}'
+    client = Client("test")
+    client._sock = ChunkedSocket(split(encode_packet(0x30, body), 5))
+    received = []
+    client.on_message = lambda client, userdata, message: received.append((message.topic, bytes(message.payload)))
+    while client._sock.chunks:
+        assert client._packet_read() == paho.MQTT_ERR_SUCCESS
+    assert received == [("cat-feeder/action", b'{"event": "feed"}')]
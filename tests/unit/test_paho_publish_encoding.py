@@ -0,0 +1,157 @@
+import errno
+import socket
+import struct
+
+import pytest
+
+from AWSIoTPythonSDK.core.protocol.paho import client as paho
+from AWSIoTPythonSDK.core.protocol.paho.client import Client
+
+
+def legacy_encode_publish(mid, topic, payload, qos, retain=False, dup=False):
+    # The bytearray encoder _send_publish used before topic headers were cached and large payloads queued separately
+    utopic = topic.encode("utf-8")
+    packet = bytearray()
+    packet.extend(struct.pack("!B", paho.PUBLISH | ((dup & 0x1) << 3) | (qos << 1) | retain))
+    if payload is None:
+        upayload = b""
+    elif isinstance(payload, str):
+        upayload = payload.encode("utf-8")
+    else:
+        upayload = bytes(payload)
+    remaining_length = 2 + len(utopic) + len(upayload) + (2 if qos > 0 else 0)
+    while True:
+        byte = remaining_length % 128
+        remaining_length = remaining_length // 128
+        packet.append(byte | 0x80 if remaining_length > 0 else byte)
+        if remaining_length == 0:
+            break
+    packet.extend(struct.pack("!H", len(utopic)))
+    packet.extend(utopic)
+    if qos > 0:
+        packet.extend(struct.pack("!H", mid))
+    packet.extend(upayload)
+    return bytes(packet)
+
+
+class ShortWriteSocket(object):
+    """Accepts at most max_write bytes per sendmsg call, and refuses every other call when blocking_every_other is set."""
+
+    def __init__(self, max_write=None, blocking_every_other=False):
+        self.max_write = max_write
+        self.blocking_every_other = blocking_every_other
+        self.blocked = False
+        self.written = bytearray()
+        self.writes = 0
+
+    def sendmsg(self, buffers):
+        if self.blocked:
+            if self.blocking_every_other:
+                self.blocked = False
+            raise socket.error(errno.EAGAIN, "would block")
+        data = b"".join(bytes(buffer) for buffer in buffers)
+        if self.max_write is not None:
+            data = data[:self.max_write]
+        self.written.extend(data)
+        self.writes += 1
+        self.blocked = self.blocking_every_other
+        return len(data)
+
+
+def make_client(sock):
+    client = Client("test")
+    client._sock = sock
+    client.published_mids = []
+    client.on_publish = lambda client_, userdata, mid: client.published_mids.append(mid)
+    return client
+
+
+def drain(client, max_rounds=100000):
+    for _ in range(max_rounds):
+        if client._current_out_packet is None:
+            return
+        client.loop_write()
+    raise AssertionError("Out packets were not drained")
+
+
+LARGE_PAYLOAD_BYTES = paho.PUBLISH_INLINE_PAYLOAD_BYTES + 1
+
+TOPICS = ["a", "cat-feeder/bowls/left", u"fütterung/ü", "t" * 300]
+PAYLOADS = [
+    None,
+    "",
+    "feed",
+    u"text ü",
+    b"\x00\x01bytes",
+    bytearray(b"bytearray"),
+    memoryview(b"memoryview"),
+    "x" * LARGE_PAYLOAD_BYTES,
+    b"y" * LARGE_PAYLOAD_BYTES,
+    bytearray(b"z" * 20000),
+    b"w" * 200000,  # Three byte remaining length
+]
+
+
+@pytest.mark.parametrize("qos", [0, 1])
+@pytest.mark.parametrize("topic", TOPICS)
+@pytest.mark.parametrize("payload", PAYLOADS)
+def test_publish_bytes_match_the_legacy_encoder(topic, payload, qos):
+    client = make_client(ShortWriteSocket())
+
+    assert client._send_publish(7, topic, payload, qos) == paho.MQTT_ERR_SUCCESS
+
+    assert bytes(client._sock.written) == legacy_encode_publish(7, topic, payload, qos)
+
+
+@pytest.mark.parametrize("retain, dup", [(True, False), (False, True), (True, True)])
+def test_publish_flags_match_the_legacy_encoder(retain, dup):
+    client = make_client(ShortWriteSocket())
+
+    client._send_publish(9, "flags", "payload", 1, retain, dup)
+
+    assert bytes(client._sock.written) == legacy_encode_publish(9, "flags", "payload", 1, retain, dup)
+
+
+def test_cached_topic_header_is_reused_without_changing_the_bytes():
+    client = make_client(ShortWriteSocket())
+
+    client._send_publish(1, "cached", "first", 1)
+    client._send_publish(2, "cached", "second", 1)
+
+    assert bytes(client._sock.written) == legacy_encode_publish(1, "cached", "first", 1) + legacy_encode_publish(2, "cached", "second", 1)
+
+
+@pytest.mark.parametrize("max_write", [1, 5, 1000, paho.PUBLISH_INLINE_PAYLOAD_BYTES + 3])
+def test_partial_writes_resume_where_the_previous_write_stopped(max_write):
+    sock = ShortWriteSocket(max_write=max_write, blocking_every_other=True)
+    client = make_client(sock)
+    messages = [
+        (1, "small", "feed", 0),
+        (2, "large", b"L" * (3 * LARGE_PAYLOAD_BYTES), 0),
+        (3, "qos1", "ack me", 1),
+        (4, "large/bytearray", bytearray(b"B" * LARGE_PAYLOAD_BYTES), 0),
+        (5, "small", "done", 0),
+    ]
+
+    for mid, topic, payload, qos in messages:
+        client._send_publish(mid, topic, payload, qos)
+    drain(client)
+
+    expected = b"".join(legacy_encode_publish(mid, topic, payload, qos) for mid, topic, payload, qos in messages)
+    assert bytes(sock.written) == expected
+    assert sock.writes > 1
+    assert client.published_mids == [1, 2, 4, 5]  # on_publish only fires for QoS0 once fully written
+
+
+def test_large_mutable_payload_is_copied_before_it_is_queued():
+    sock = ShortWriteSocket()
+    sock.blocked = True
+    client = make_client(sock)
+    payload = bytearray(b"a" * LARGE_PAYLOAD_BYTES)
+
+    client._send_publish(1, "mutable", payload, 0)
+    payload[:] = b"b" * (2 * LARGE_PAYLOAD_BYTES)
+    sock.blocked = False
+    drain(client)
+
+    assert bytes(sock.written) == legacy_encode_publish(1, "mutable", b"a" * LARGE_PAYLOAD_BYTES, 0)
@@ -0,0 +1,130 @@
+import struct
+import time
+
+import pytest
+
+from AWSIoTPythonSDK.core.protocol.paho import client as paho
+from AWSIoTPythonSDK.core.protocol.paho.client import Client
+
+
+class FakeClock(object):
+    """Replaces the time module inside the paho client so retry intervals can be stepped through."""
+
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+class RecordingSocket(object):
+
+    def __init__(self):
+        self.packets = []
+
+    def sendmsg(self, buffers):
+        data = b"".join(bytes(buffer) for buffer in buffers)
+        self.packets.append(data)
+        return len(data)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock(1000.0)
+    monkeypatch.setattr(paho, "time", clock)
+    return clock
+
+
+def make_client():
+    client = Client("test")
+    client._sock = RecordingSocket()
+    client._max_inflight_messages = 0
+    return client
+
+
+def publish(client, topic="retry", payload="payload"):
+    rc, mid = client.publish(topic, payload, 1)
+    assert rc == paho.MQTT_ERR_SUCCESS
+    return mid
+
+
+def puback(client, mid):
+    client._in_packet = {"command": paho.PUBACK, "remaining_length": 2, "packet": struct.pack("!H", mid)}
+    assert client._handle_pubackcomp("PUBACK") == paho.MQTT_ERR_SUCCESS
+
+
+def resent_mids(client):
+    # The DUP flag is only set when a PUBLISH is sent again. The mid follows the fixed header and the "retry" topic.
+    mid_offset = 2 + 2 + len("retry")
+    return [struct.unpack("!H", packet[mid_offset:mid_offset + 2])[0] for packet in client._sock.packets if packet[0] & 0x08]
+
+
+def test_publish_is_retried_once_the_interval_has_passed(clock):
+    client = make_client()
+    mid = publish(client)
+
+    clock.now += client._message_retry - 1
+    client._message_retry_check()
+    assert resent_mids(client) == []
+
+    clock.now += 2
+    client._message_retry_check()
+    assert resent_mids(client) == [mid]
+    assert client._out_messages[mid].dup
+    assert [(timestamp, m.mid) for timestamp, _, m in client._out_retry_heap] == [(clock.now, mid)]
+
+
+def test_completed_mids_are_not_retried(clock):
+    client = make_client()
+    acked_mid = publish(client)
+    pending_mid = publish(client)
+    puback(client, acked_mid)
+
+    clock.now += client._message_retry + 1
+    client._message_retry_check()
+
+    assert resent_mids(client) == [pending_mid]
+    assert [m.mid for _, _, m in client._out_retry_heap] == [pending_mid]
+
+
+def test_entry_is_rescheduled_when_the_message_was_sent_again(clock):
+    client = make_client()
+    mid = publish(client)
+    sent_again_at = clock.now + 15
+    client._out_messages[mid].timestamp = sent_again_at
+
+    clock.now += client._message_retry + 1
+    client._message_retry_check()
+    assert resent_mids(client) == []
+    assert [(timestamp, m.mid) for timestamp, _, m in client._out_retry_heap] == [(sent_again_at, mid)]
+
+    clock.now = sent_again_at + client._message_retry + 1
+    client._message_retry_check()
+    assert resent_mids(client) == [mid]
+
+
+def test_heap_is_rebuilt_once_completed_entries_outnumber_live_messages(clock):
+    client = make_client()
+    live_mid = publish(client)
+    # The new message is already live when the size check runs, so the heap has to exceed 2 * 2 + 64 entries
+    completed = 2 * 2 + 64
+    for _ in range(completed):
+        puback(client, publish(client))
+    assert len(client._out_retry_heap) == completed + 1  # Completed entries are only dropped when they come up
+
+    next_mid = publish(client)
+
+    assert sorted(m.mid for _, _, m in client._out_retry_heap) == [live_mid, next_mid]
+
+
+def test_heap_is_left_alone_below_the_compaction_threshold(clock):
+    client = make_client()
+    for _ in range(10):
+        puback(client, publish(client))
+
+    publish(client)
+
+    assert len(client._out_retry_heap) == 11
@@ -0,0 +1,97 @@
+from AWSIoTPythonSDK.core.protocol.internal.clients import ClientStatus
+from AWSIoTPythonSDK.core.protocol.internal.requests import PublishResults
+from AWSIoTPythonSDK.core.protocol.mqtt_core import MqttCore
+from AWSIoTPythonSDK.core.protocol.paho.client import MQTT_ERR_SUCCESS
+from AWSIoTPythonSDK.core.protocol.paho.client import MQTTv311
+
+
+class FakeAsyncClient(object):
+    """Stands in for InternalAsyncMqttClient and PUBACKs the QoS1 publishes in acked_topics."""
+
+    def __init__(self, acked_topics=()):
+        self.acked_topics = set(acked_topics)
+        self.published = []
+        self.ack_callbacks = {}
+        self.removed_mids = []
+        self._next_mid = 1
+
+    def publish(self, topic, payload, qos, retain=False, ack_callback=None):
+        mid = self._next_mid
+        self._next_mid += 1
+        self.published.append((mid, topic, payload, qos))
+        if qos > 0 and ack_callback:
+            self.ack_callbacks[mid] = ack_callback
+            if topic in self.acked_topics:
+                ack_callback(mid)
+        return MQTT_ERR_SUCCESS, mid
+
+    def remove_event_callback(self, mid):
+        self.removed_mids.append(mid)
+
+
+def create_core(async_client, status=ClientStatus.STABLE, operation_timeout_sec=0.05):
+    core = MqttCore("test", True, MQTTv311, False)
+    core._internal_async_client = async_client
+    core._client_status.set_status(status)
+    core._operation_timeout_sec = operation_timeout_sec
+    return core
+
+
+def test_all_acked_batch_returns_acked_in_request_order():
+    async_client = FakeAsyncClient(acked_topics=("a", "b", "c"))
+    core = create_core(async_client, operation_timeout_sec=5)
+
+    results = core.publish_batch([("a", "1", 1, False), ("b", "2", 1, False), ("c", "3", 1, False)])
+
+    assert results == [(1, PublishResults.ACKED), (2, PublishResults.ACKED), (3, PublishResults.ACKED)]
+    assert async_client.removed_mids == []
+
+
+def test_partial_timeout_removes_the_callbacks_of_unacked_mids():
+    async_client = FakeAsyncClient(acked_topics=("acked",))
+    core = create_core(async_client)
+
+    results = core.publish_batch([("acked", "1", 1, False), ("lost", "2", 1, False), ("lost", "3", 1, False)])
+
+    assert results == [(1, PublishResults.ACKED), (2, PublishResults.TIMEOUT), (3, PublishResults.TIMEOUT)]
+    assert sorted(async_client.removed_mids) == [2, 3]
+
+
+def test_publishes_are_queued_while_not_stable():
+    async_client = FakeAsyncClient()
+    core = create_core(async_client, status=ClientStatus.CONNECT)
+
+    results = core.publish_batch([("a", "1", 1, False), ("b", "2", 0, False)])
+
+    assert results == [(None, PublishResults.QUEUED), (None, PublishResults.QUEUED)]
+    assert async_client.published == []
+    assert core._offline_requests_manager.get_size() == 2
+
+
+def test_mixed_qos_batch_only_waits_for_qos1_pubacks():
+    async_client = FakeAsyncClient(acked_topics=("qos1",))
+    core = create_core(async_client, operation_timeout_sec=5)
+
+    results = core.publish_batch([("qos0", "1", 0, False), ("qos1", "2", 1, False), ("qos0", "3", 0, False)])
+
+    assert results == [(1, PublishResults.SENT), (2, PublishResults.ACKED), (3, PublishResults.SENT)]
+    assert list(async_client.ack_callbacks) == [2]
+    assert async_client.removed_mids == []
+
+
+def test_pubacks_received_while_the_batch_is_being_sent_are_counted():
+    async_client = FakeAsyncClient()
+    core = create_core(async_client)
+    original_publish = async_client.publish
+
+    def publish_and_ack_previous(topic, payload, qos, retain=False, ack_callback=None):
+        # PUBACKs arrive while later requests of the batch are still being written
+        for mid, callback in list(async_client.ack_callbacks.items()):
+            callback(mid)
+        return original_publish(topic, payload, qos, retain, ack_callback)
+
+    async_client.publish = publish_and_ack_previous
+    results = core.publish_batch([("a", "1", 1, False), ("b", "2", 1, False)])
+
+    assert results == [(1, PublishResults.ACKED), (2, PublishResults.TIMEOUT)]
+    assert async_client.removed_mids == [2]
@@ -0,0 +1,90 @@
+import threading
+import time
+
+from AWSIoTPythonSDK.core.protocol.internal.workers import ScheduledTimeout
+from AWSIoTPythonSDK.core.protocol.internal.workers import TimeoutScheduler
+
+
+class InlineExecutor(object):
+    """Runs submitted callbacks right away on the scheduler thread."""
+
+    def __init__(self):
+        self.fired = []
+        self.event = threading.Event()
+
+    def submit(self, ordering_key, callback, *args):
+        callback(*args)
+
+    def record(self, name):
+        self.fired.append(name)
+        self.event.set()
+
+
+def wait_for(condition, timeout_sec=2):
+    deadline = time.time() + timeout_sec
+    while not condition() and time.time() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+def test_timeouts_fire_in_due_order_with_their_arguments():
+    executor = InlineExecutor()
+    scheduler = TimeoutScheduler(executor)
+    for name, delay_sec in (("late", 0.15), ("early", 0.05), ("middle", 0.1)):
+        scheduler.new_timeout(delay_sec, executor.record, name).start()
+    assert wait_for(lambda: len(executor.fired) == 3)
+    assert executor.fired == ["early", "middle", "late"]
+    assert scheduler.get_pending() == 0
+
+
+def test_earlier_deadline_wakes_the_scheduler():
+    executor = InlineExecutor()
+    scheduler = TimeoutScheduler(executor)
+    scheduler.new_timeout(10, executor.record, "never").start()
+    start_time = time.time()
+    scheduler.new_timeout(0.05, executor.record, "soon").start()
+    assert executor.event.wait(2)
+    assert time.time() - start_time < 1
+    assert executor.fired == ["soon"]
+
+
+def test_cancelled_timeouts_do_not_fire():
+    executor = InlineExecutor()
+    scheduler = TimeoutScheduler(executor)
+    cancelled = scheduler.new_timeout(0.05, executor.record, "cancelled")
+    cancelled.start()
+    cancelled.cancel()
+    scheduler.new_timeout(0.1, executor.record, "kept").start()
+    assert wait_for(lambda: executor.fired == ["kept"])
+    time.sleep(0.05)
+    assert executor.fired == ["kept"]
+    assert cancelled.state == ScheduledTimeout.CANCELLED
+
+
+def test_life_cycle_edges():
+    executor = InlineExecutor()
+    scheduler = TimeoutScheduler(executor)
+    never_started = scheduler.new_timeout(0.01, executor.record, "never started")
+    never_started.cancel()
+    never_started.start()  # Like threading.Timer, a cancelled timeout cannot be started
+    fired = scheduler.new_timeout(0.01, executor.record, "fired")
+    fired.start()
+    fired.start()
+    assert wait_for(lambda: executor.fired == ["fired"])
+    fired.cancel()
+    assert fired.state == ScheduledTimeout.FIRED
+    assert scheduler.get_pending() == 0
+
+
+def test_pending_count_survives_compaction():
+    scheduler = TimeoutScheduler(InlineExecutor())
+    for _ in range(3):
+        timeouts = [scheduler.new_timeout(0.05, lambda: None) for _ in range(2 * TimeoutScheduler.COMPACT_MIN_CANCELLED)]
+        for timeout in timeouts:
+            timeout.start()
+        for timeout in timeouts:
+            timeout.cancel()
+        assert scheduler.get_pending() == 0
+    assert wait_for(lambda: not scheduler._heap)
+    assert scheduler.get_pending() == 0
+    assert scheduler._cancelled == 0
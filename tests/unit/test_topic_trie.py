@@ -0,0 +1,67 @@
+import pytest
+
+from AWSIoTPythonSDK.core.protocol.internal.workers import SubscriptionManager
+from AWSIoTPythonSDK.core.protocol.internal.workers import TopicTrie
+
+
+def make_trie(*topic_filters):
+    trie = TopicTrie()
+    for topic_filter in topic_filters:
+        trie.add(topic_filter)
+    return trie
+
+
+@pytest.mark.parametrize("topic_filter, topic, expected", [
+    ("a/b", "a/b", True),
+    ("a/b", "a/c", False),
+    ("a/b", "a/b/c", False),
+    ("a/+", "a/b", True),
+    ("a/+", "a/b/c", False),
+    ("a/+", "a/", True),
+    ("+/+", "/b", True),
+    ("a/#", "a", True),
+    ("a/#", "a/", True),
+    ("a/#", "a/b/c", True),
+    ("a/#", "b/c", False),
+    ("#", "a/b", True),
+    ("+/#", "a", True),
+    ("+/#", "a/b/c", True),
+    ("a/+/c", "a/b/c", True),
+    ("a/+/c", "a/b/d", False),
+    ("#", "$aws/things/t/shadow/get", False),
+    ("+/things/t/shadow/get", "$aws/things/t/shadow/get", False),
+    ("$aws/things/+/shadow/#", "$aws/things/t/shadow/get/accepted", True),
+])
+def test_match(topic_filter, topic, expected):
+    assert (make_trie(topic_filter).match(topic) == [topic_filter]) == expected
+
+
+def test_match_returns_every_matching_filter_once():
+    trie = make_trie("a/b", "a/+", "a/#", "#", "+/b", "c/#")
+    assert sorted(trie.match("a/b")) == ["#", "+/b", "a/#", "a/+", "a/b"]
+
+
+def test_remove_keeps_other_filters_and_prunes_empty_branches():
+    trie = make_trie("a/b/c", "a/b", "a/#")
+    trie.remove("a/b/c")
+    assert sorted(trie.match("a/b")) == ["a/#", "a/b"]
+    assert trie.match("a/b/c") == ["a/#"]
+    trie.remove("a/b")
+    trie.remove("a/#")
+    assert trie.match("a/b") == []
+    assert trie._root.children == {}
+
+
+def test_remove_unknown_filter_is_ignored():
+    trie = make_trie("a/b")
+    trie.remove("a/b/c")
+    trie.remove("x")
+    assert trie.match("a/b") == ["a/b"]
+
+
+def test_subscription_manager_matches_records():
+    manager = SubscriptionManager()
+    manager.add_record("cat-feeder/+", 1, "message callback", None)
+    manager.add_record("cat-feeder/action", 0, None, None)
+    manager.remove_record("cat-feeder/action")
+    assert manager.match_records("cat-feeder/action") == [("cat-feeder/+", (1, "message callback", None))]
@@ -0,0 +1,154 @@
+import os
+import socket
+import ssl
+import struct
+
+import pytest
+
+from AWSIoTPythonSDK.core.protocol.connection.cores import SecuredWebSocketCore
+
+OP_CONTINUATION = 0x0
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xa
+
+
+def encode_frame(op_code, payload, fin=True, masked=False):
+    length = len(payload)
+    header = bytearray([(0x80 if fin else 0) | op_code])
+    mask_bit = 0x80 if masked else 0
+    if length <= 125:
+        header.append(mask_bit | length)
+    elif length <= 0xffff:
+        header.append(mask_bit | 126)
+        header += struct.pack("!H", length)
+    else:
+        header.append(mask_bit | 127)
+        header += struct.pack("!Q", length)
+    if masked:
+        header += b"\x00\x00\x00\x00"
+    return bytes(header) + payload
+
+
+class ChunkedSSLSocket(object):
+    """Returns the stream in reads of at most chunk_size bytes, then WANT_READ."""
+
+    def __init__(self, stream, chunk_size):
+        self.stream = stream
+        self.pos = 0
+        self.chunk_size = chunk_size
+        self.written = []
+
+    def read(self, number_of_bytes):
+        if self.pos >= len(self.stream):
+            raise ssl.SSLWantReadError(ssl.SSL_ERROR_WANT_READ, "want read")
+        data = self.stream[self.pos:self.pos + min(number_of_bytes, self.chunk_size)]
+        self.pos += len(data)
+        return data
+
+    def write(self, data):
+        self.written.append(bytes(data))
+        return len(data)
+
+    def pending(self):
+        return 0
+
+
+@pytest.fixture
+def make_core(monkeypatch):
+    monkeypatch.setattr(SecuredWebSocketCore, "_handShake", lambda self, host, port: None)
+
+    def make(stream, chunk_size=65536):
+        return SecuredWebSocketCore(ChunkedSSLSocket(stream, chunk_size), "localhost", 443)
+    return make
+
+
+def read_everything(core, buffer_size=4096):
+    received = bytearray()
+    buffer = bytearray(buffer_size)
+    while True:
+        try:
+            count = core.recv_into(memoryview(buffer))
+        except socket.error:
+            if core._sslSocket.pos >= len(core._sslSocket.stream) and core.pending() == 0:
+                return bytes(received)
+            continue
+        received += buffer[:count]
+
+
+@pytest.mark.parametrize("payload_length, chunk_size", [
+    (0, 1), (1, 1), (125, 1), (126, 1), (125, 3), (126, 3),
+    (65535, 1000), (65536, 1000), (200000, 1000),
+    (0, 65536), (126, 65536), (65535, 65536), (65536, 65536), (200000, 65536),
+])
+def test_length_forms_across_reads(make_core, payload_length, chunk_size):
+    payload = os.urandom(payload_length)
+    stream = encode_frame(OP_BINARY, payload) + encode_frame(OP_BINARY, b"tail")
+    assert read_everything(make_core(stream, chunk_size)) == payload + b"tail"
+
+
+def test_many_frames_are_decoded_from_one_read(make_core):
+    payloads = [os.urandom(n) for n in (10, 300, 70000, 5)]
+    core = make_core(b"".join(encode_frame(OP_BINARY, payload) for payload in payloads), chunk_size=1 << 20)
+    assert read_everything(core, buffer_size=1 << 20) == b"".join(payloads)
+    assert core._sslSocket.pos == len(core._sslSocket.stream)
+
+
+def test_fragmented_message_is_reassembled(make_core):
+    stream = encode_frame(OP_BINARY, b"first ", fin=False) + \
+        encode_frame(OP_CONTINUATION, b"second ", fin=False) + \
+        encode_frame(OP_CONTINUATION, b"last")
+    assert read_everything(make_core(stream, chunk_size=4)) == b"first second last"
+
+
+def test_ping_is_answered_and_control_payloads_are_not_data(make_core):
+    stream = encode_frame(OP_BINARY, b"ab") + encode_frame(OP_PING, b"ping data") + \
+        encode_frame(OP_PONG, b"pong data") + encode_frame(OP_BINARY, b"cd")
+    core = make_core(stream, chunk_size=5)
+    assert read_everything(core) == b"abcd"
+    assert len(core._sslSocket.written) == 1
+    pong = core._sslSocket.written[0]
+    assert pong[0] == 0x80 | OP_PONG and pong[1] & 0x80  # Client frames are masked
+
+
+def test_control_frames_only_want_read(make_core):
+    core = make_core(encode_frame(OP_PING, b""))
+    with pytest.raises(socket.error) as raised:
+        core.recv_into(bytearray(10))
+    assert raised.value.errno == ssl.SSL_ERROR_WANT_READ
+
+
+def test_read_returns_exactly_the_requested_bytes(make_core):
+    core = make_core(encode_frame(OP_BINARY, b"abcdef") + encode_frame(OP_BINARY, b"gh"), chunk_size=3)
+    received = []
+    for number_of_bytes in (2, 3, 3):
+        while True:
+            try:
+                received.append(bytes(core.read(number_of_bytes)))
+                break
+            except socket.error:
+                pass
+    assert received == [b"ab", b"cde", b"fgh"]
+
+
+def test_close_frame_discards_buffered_data(make_core):
+    core = make_core(encode_frame(OP_BINARY, b"ab") + encode_frame(OP_CLOSE, b""))
+    with pytest.raises(socket.error):
+        core.recv_into(bytearray(10))
+    assert core._connectStatus == core._WebsocketDisconnected
+    assert core.pending() == 0
+
+
+def test_masked_server_frame_is_a_protocol_error(make_core):
+    core = make_core(encode_frame(OP_BINARY, b"x", masked=True))
+    with pytest.raises(socket.error):
+        core.recv_into(bytearray(10))
+    assert core._sslSocket.written  # A close frame was sent
+
+
+def test_connection_closed_without_close_frame(make_core):
+    core = make_core(b"")
+    core._sslSocket.read = lambda number_of_bytes: b""
+    with pytest.raises(socket.error):
+        core.recv_into(bytearray(10))